@@ -0,0 +1,155 @@
+# async_core.py
+import asyncio
+from collections import deque
+import io
+from pathlib import Path
+import sys
+from typing import AsyncIterator, Awaitable, Callable, Deque, Dict, List, Optional, TypeVar
+
+import core
+from progress import CancellationToken, check_cancelled
+
+# Archivos que una misma generación lee a la vez (cada lectura ocupa un hilo)
+DEFAULT_ASYNC_CONCURRENCY = 8
+
+T = TypeVar('T')
+
+
+async def _run_cancellable(token: CancellationToken, function: Callable[..., T], /, *args, **kwargs) -> T:
+    """
+    Ejecuta function en un hilo (asyncio.to_thread). Si la tarea se cancela,
+    se activa token para que la función (que lo consulta entre archivos)
+    termine cuanto antes en lugar de seguir ocupando el hilo.
+    """
+    try:
+        return await asyncio.to_thread(function, *args, **kwargs)
+    except asyncio.CancelledError:
+        token.cancel()
+        raise
+
+
+async def _iter_file_blocks(
+    files_to_format: List[Path],
+    vault_path: Path,
+    output_mode: str,
+    section_targets: Dict[str, List[str]],
+    extracted: Dict[Path, Optional[str]],
+    options: core.GenerationOptions,
+    cancel_token: CancellationToken,
+    max_concurrency: int,
+    root_label: Optional[str] = None,
+) -> AsyncIterator[str]:
+    """
+    Formatea los archivos en hilos (como mucho max_concurrency a la vez) con
+    core.write_file_block y devuelve los bloques en el orden de files_to_format.
+    Se adelanta un número acotado de archivos, así que la memoria no crece con
+    el tamaño de la selección. Como en core, cancel_token se comprueba antes de
+    cada archivo.
+    """
+    semaphore = asyncio.Semaphore(max_concurrency)
+    transcluder = core.create_transcluder(vault_path, output_mode, options)
+    def format_one(file_path: Path) -> str:
+        check_cancelled(cancel_token)
+        buffer = io.BytesIO()
+        core.write_file_block(buffer, file_path, vault_path, output_mode, section_targets, extracted, options, root_label=root_label, transcluder=transcluder)
+        return str(buffer.getbuffer(), 'utf-8')
+    async def run(file_path: Path) -> str:
+        async with semaphore:
+            return await _run_cancellable(cancel_token, format_one, file_path)
+
+    pending: Deque[Awaitable[str]] = deque()
+    try:
+        for file_path in files_to_format:
+            pending.append(asyncio.ensure_future(run(file_path)))
+            if len(pending) >= 2 * max_concurrency:
+                yield await pending.popleft()
+        while pending:
+            yield await pending.popleft()
+    finally:
+        for task in pending: task.cancel() # Cancelación o consumidor que deja de iterar
+
+
+async def _iter_content(
+    vault_path: Path,
+    relevant_files: List[Path],
+    section_targets: Dict[str, List[str]],
+    output_mode: str,
+    options: core.GenerationOptions,
+    cancel_token: CancellationToken,
+    max_concurrency: int,
+    root_label: Optional[str] = None,
+) -> AsyncIterator[str]:
+    """Paso 3 de core.collect_context_parts: prepara la lista (core.prepare_files_to_format), formatea y añade los casi-duplicados."""
+    files_to_format, duplicate_groups, extracted = await _run_cancellable(
+        cancel_token, core.prepare_files_to_format, relevant_files, vault_path, output_mode, section_targets, options, cancel_token=cancel_token,
+    )
+    async for block in _iter_file_blocks(files_to_format, vault_path, output_mode, section_targets, extracted, options, cancel_token, max_concurrency, root_label):
+        yield block
+    if duplicate_groups:
+        yield core.format_duplicates_block(duplicate_groups, vault_path, options, root_label).decode('utf-8')
+
+
+async def iter_context_blocks(
+    vault_path: Path,
+    target_paths: List[str],
+    extensions: List[str],
+    output_mode: str = 'content',
+    options: Optional[core.GenerationOptions] = None,
+    root_label: Optional[str] = None,
+    max_concurrency: int = DEFAULT_ASYNC_CONCURRENCY,
+) -> AsyncIterator[str]:
+    """
+    Versión asíncrona del contenido de collect_context_parts: devuelve uno a
+    uno los bloques formateados ('content' u 'outline'), sin bloquear el bucle
+    de eventos. La búsqueda y las lecturas se hacen en hilos; cancelar la
+    tarea (o dejar de iterar) detiene la búsqueda y las lecturas pendientes.
+    Si hay casi-duplicados, el último bloque los lista.
+
+    Ejemplo:
+        async for block in iter_context_blocks(vault, ["Proyectos"], [".md"]):
+            await response.write(block)
+    """
+    options = options or core.GenerationOptions()
+    cancel_token = CancellationToken()
+    relevant_files, section_targets = await _run_cancellable(
+        cancel_token, core.select_files, vault_path, target_paths, extensions, options, cancel_token=cancel_token,
+    )
+    if not relevant_files: return
+    async for block in _iter_content(vault_path, relevant_files, section_targets, output_mode, options, cancel_token, max_concurrency, root_label):
+        yield block
+
+
+async def generate_prompt_async(
+    vault_path: Path,
+    target_paths: List[str],
+    extensions: List[str],
+    output_mode: str,
+    output_note_path: Optional[Path],
+    template_string: str,
+    options: Optional[core.GenerationOptions] = None,
+    max_concurrency: int = DEFAULT_ASYNC_CONCURRENCY,
+) -> str:
+    """
+    Equivalente asíncrono de core.generate_prompt_core (mismo resultado, mismas
+    etapas de core). Varias llamadas concurrentes (otras bóvedas u otros
+    targets) solapan su E/S en lugar de ejecutarse una tras otra; cada una usa
+    como mucho max_concurrency hilos de lectura. Cancelar la tarea detiene la
+    búsqueda y las lecturas.
+    """
+    print(f"--- Iniciando Lógica Core (async) --- Bóveda: {vault_path} | Targets: {target_paths}", file=sys.stderr)
+    options = options or core.GenerationOptions()
+    cancel_token = CancellationToken()
+    relevant_files, section_targets = await _run_cancellable(
+        cancel_token, core.select_files, vault_path, target_paths, extensions, options, cancel_token=cancel_token,
+    )
+    tree_string = ""
+    if output_mode in ['tree', 'both']:
+        tree_string = await _run_cancellable(cancel_token, core.build_tree_string, relevant_files, vault_path, options)
+
+    content_block_str = ""
+    if output_mode in ['content', 'both', 'outline'] and relevant_files:
+        blocks = [block async for block in _iter_content(vault_path, relevant_files, section_targets, output_mode, options, cancel_token, max_concurrency)]
+        content_block_str = "".join(blocks).strip()
+
+    context_block = core.build_context_block(output_mode, tree_string, content_block_str)
+    return core.render_prompt(template_string, context_block, output_note_path)
@@ -46,9 +46,14 @@ def save_config(config: Dict):
         print(f"Error inesperado al guardar configuración: {e}", file=sys.stderr)
 
 
-def get_vaults() -> Dict[str, str]:
-    """Obtiene el diccionario de bóvedas guardadas (nombre: ruta_string)."""
+def get_vaults(check_paths: bool = True) -> Dict[str, str]:
+    """
+    Obtiene el diccionario de bóvedas guardadas (nombre: ruta_string).
+    Con check_paths=False no se comprueba ninguna ruta (sin stat: útil si hay
+    rutas de red o unidades lentas); quien use una bóveda debe validarla.
+    """
     config = load_config()
+    if not check_paths: return dict(config.get("vaults", {}))
     # Filtrar rutas inválidas al obtenerlas
     valid_vaults = {}
     for name, path_str in config.get("vaults", {}).items():
@@ -143,4 +148,14 @@ def set_last_vault(name: str):
         else:
              print(f"Advertencia: No se pudo establecer '{name}' como última bóveda porque su ruta no es válida.", file=sys.stderr)
     else:
-        print(f"Advertencia: No se pudo establecer '{name}' como última bóveda porque no existe.", file=sys.stderr)
\ No newline at end of file
+        print(f"Advertencia: No se pudo establecer '{name}' como última bóveda porque no existe.", file=sys.stderr)
+
+def get_redaction_config() -> Dict:
+    """
+    Patrones de redacción guardados en la configuración (sección "redaction"):
+    {"presets": ["email", ...], "literals": [...], "regexes": {"nombre": "expresión"},
+    "whole_word_literals": true}.
+    Devuelve {} si no hay sección (se usarán los patrones incluidos).
+    """
+    section = load_config().get("redaction", {})
+    return section if isinstance(section, dict) else {}
@@ -1,13 +1,29 @@
 # core.py
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+import heapq
+import io
+import os
 from pathlib import Path
 import sys
-from typing import List, Optional, Dict, Tuple
+import threading
+from typing import BinaryIO, List, Optional, Dict, Tuple
 
 # Importar módulos necesarios para la lógica central
 import file_handler
 import tree_generator
 import formatter
+import near_duplicates
+import extractors
+import tag_index
 import prompt_handler # Para inject_context_multi
+import spill
+import redaction
+import transclusion
+import defaults
+from progress import (
+    CancellationToken, ProgressCallback, ProgressInfo, check_cancelled, report_progress,
+)
 
 # --- Constantes Compartidas ---
 DEFAULT_PLACEHOLDERS: Dict[str, str] = {
@@ -19,7 +35,63 @@ DEFAULT_PLACEHOLDERS: Dict[str, str] = {
     "etiqueta_jerarquica_4": "{etiqueta_jerarquica_4}",
     "etiqueta_jerarquica_5": "{etiqueta_jerarquica_5}",
 }
-DEFAULT_EXTENSIONS = ['.md']
+# Definido en defaults; se mantiene aquí para quien usaba core.DEFAULT_EXTENSIONS
+DEFAULT_EXTENSIONS = defaults.DEFAULT_EXTENSIONS
+# Separador para asignar un target a una bóveda concreta en modo multi-bóveda (ej: "NoitaMod::data/scripts")
+FEDERATED_TARGET_SEPARATOR = "::"
+
+
+@dataclass
+class GenerationOptions:
+    """
+    Opciones de selección y formateo de una generación. Se crea una vez (CLI,
+    GUI o biblioteca) y se pasa tal cual por todas las etapas: select_files,
+    prepare_files_to_format, write_file_block, collect_context_parts,
+    generate_prompt_core, generate_federated_prompt_core, estimate_selection
+    y async_core.
+
+    excluded_extensions: extensiones a excluir aunque estén incluidas.
+    tree_max_depth / tree_collapse_threshold: límites del árbol (ver tree_generator).
+    max_file_bytes / max_file_lines: recortan archivos gigantes a cabeza/cola.
+    near_duplicate_threshold (0-1): omite casi-duplicados (ver near_duplicates).
+    tag_filters / where_filters: notas con esas etiquetas y propiedades de
+        frontmatter (ver tag_index.filter_files).
+    scan_workers (>= 2): recorrido paralelo de directorios.
+    use_git_index / git_untracked: lista los archivos desde el índice de git
+        si la bóveda es la raíz del repositorio (ver file_handler.find_relevant_files).
+    max_files / selection_sort: solo los max_files primeros según 'mtime',
+        'size' o 'name'; solo esos se leen y formatean.
+    file_order ('name' o 'stable'): orden del bloque de contenido (ver
+        file_handler.order_files); el árbol es siempre alfabético.
+    use_extractors: canvas, Excalidraw, CSV, PDF... como texto extraído. Desactivado
+        por defecto: los .excalidraw.md se incluyen tal cual, como antes.
+    redactor (redaction.Redactor): cada bloque y el árbol pasan por él; sus
+        recuentos quedan en redactor.counts.
+    transclusion_depth (>= 1): expande las incrustaciones ![[nota]] hasta esa
+        profundidad (ver transclusion.Transcluder).
+    """
+    excluded_extensions: List[str] = field(default_factory=list)
+    tree_max_depth: Optional[int] = None
+    tree_collapse_threshold: Optional[int] = None
+    max_file_bytes: Optional[int] = None
+    max_file_lines: Optional[int] = None
+    near_duplicate_threshold: Optional[float] = None
+    tag_filters: List[str] = field(default_factory=list)
+    where_filters: List[Tuple[str, str]] = field(default_factory=list)
+    scan_workers: Optional[int] = None
+    use_git_index: bool = False
+    git_untracked: bool = False
+    max_files: Optional[int] = None
+    selection_sort: str = 'mtime'
+    file_order: str = 'name'
+    use_extractors: bool = False
+    redactor: Optional[redaction.Redactor] = None
+    transclusion_depth: Optional[int] = None
+
+    @property
+    def filters_metadata(self) -> bool:
+        """True si hay filtros de etiquetas/propiedades (la selección max_files se hace después de filtrar)."""
+        return bool(self.tag_filters or self.where_filters)
 
 # --- Funciones de Lógica Central ---
 
@@ -47,33 +119,204 @@ def generate_hierarchical_tags(relative_note_path: Optional[Path]) -> List[str]:
     return list(reversed(tags)) # _1 = padre directo, _2 = abuelo, etc.
 
 
-def generate_prompt_core(
+def _find_candidate_files(
+    vault_path: Path,
+    search_targets: List[str],
+    extensions: List[str],
+    options: GenerationOptions,
+    progress_callback: Optional[ProgressCallback] = None,
+    cancel_token: Optional[CancellationToken] = None,
+) -> List[Path]:
+    """Recorrido (o índice de git) con las opciones de búsqueda; con filtros de metadatos, max_files se aplica después de filtrar."""
+    return file_handler.find_relevant_files(
+        vault_path=vault_path,
+        target_paths=search_targets,
+        extensions=extensions,
+        excluded_extensions=options.excluded_extensions or [],
+        progress_callback=progress_callback,
+        cancel_token=cancel_token,
+        scan_workers=options.scan_workers,
+        use_git_index=options.use_git_index, git_untracked=options.git_untracked,
+        max_files=options.max_files if not options.filters_metadata else None, selection_sort=options.selection_sort,
+    )
+
+
+def select_files(
     vault_path: Path,
     target_paths: List[str],
     extensions: List[str],
+    options: Optional[GenerationOptions] = None,
+    progress_callback: Optional[ProgressCallback] = None,
+    cancel_token: Optional[CancellationToken] = None,
+) -> Tuple[List[Path], Dict[str, List[str]]]:
+    """
+    Paso 1: archivos relevantes (ordenados por nombre) tras aplicar targets,
+    extensiones y filtros de etiquetas/propiedades.
+
+    Returns:
+        Tupla (archivos, secciones) con secciones como en
+        file_handler.split_section_targets.
+    """
+    options = options or GenerationOptions()
+    print("\nCore - Buscando archivos relevantes...", file=sys.stderr) # Mensaje añadido
+    search_targets, section_targets = file_handler.split_section_targets(vault_path, target_paths)
+    relevant_files = _find_candidate_files(vault_path, search_targets, extensions, options, progress_callback, cancel_token)
+    if options.filters_metadata:
+        print("\nCore - Filtrando por etiquetas/propiedades (índice de metadatos)...", file=sys.stderr)
+        relevant_files = tag_index.filter_files(relevant_files, options.tag_filters, options.where_filters, cancel_token)
+        if options.max_files is not None: relevant_files = file_handler.select_top_files(relevant_files, vault_path, options.max_files, options.selection_sort)
+    return relevant_files, section_targets
+
+
+def build_tree_string(relevant_files: List[Path], vault_path: Path, options: Optional[GenerationOptions] = None) -> str:
+    """Paso 2: árbol de los archivos seleccionados (ya redactado si hay redactor)."""
+    options = options or GenerationOptions()
+    print("\nCore - Generando estructura de árbol...", file=sys.stderr)
+    tree_string = tree_generator.generate_tree_string(
+        list(relevant_files), vault_path,
+        max_depth=options.tree_max_depth, collapse_threshold=options.tree_collapse_threshold,
+    )
+    if not tree_string.strip() or tree_string.startswith(" (No se encontraron"):
+         print("Core - Advertencia: No se generó estructura de árbol válida.", file=sys.stderr)
+         return " (No se generó estructura de árbol para los targets/extensiones especificados)"
+    return options.redactor.redact_text(tree_string) if options.redactor is not None else tree_string
+
+
+def prepare_files_to_format(
+    relevant_files: List[Path],
+    vault_path: Path,
     output_mode: str,
-    output_note_path: Optional[Path], # <-- Ahora es Opcional
-    template_string: str,
-    excluded_extensions: Optional[List[str]] = None # <-- Parámetro añadido (necesita implementación en file_handler)
-) -> str:
+    section_targets: Dict[str, List[str]],
+    options: Optional[GenerationOptions] = None,
+    cancel_token: Optional[CancellationToken] = None,
+) -> Tuple[List[Path], List[near_duplicates.NearDuplicateGroup], Dict[Path, Optional[str]]]:
     """
-    Lógica central para generar el prompt final.
+    Ordena los archivos del contenido, omite casi-duplicados y extrae el texto
+    de los tipos con extractor (ver collect_context_parts).
+
+    Returns:
+        Tupla (archivos_a_formatear, grupos_de_casi_duplicados, textos_extraídos).
     """
-    print("--- Iniciando Lógica Core ---", file=sys.stderr)
-    print(f"Core - Bóveda: {vault_path}", file=sys.stderr)
-    print(f"Core - Targets: {target_paths}", file=sys.stderr)
-    print(f"Core - Incluir Extensiones: {extensions}", file=sys.stderr)
-    print(f"Core - Excluir Extensiones: {excluded_extensions if excluded_extensions else 'Ninguna'}", file=sys.stderr)
-    print(f"Core - Modo Contexto: {output_mode}", file=sys.stderr)
-    print(f"Core - Ruta Nota Destino: {output_note_path if output_note_path else 'No especificada'}", file=sys.stderr)
+    options = options or GenerationOptions()
+    files_to_format = file_handler.order_files(relevant_files, vault_path, options.file_order); duplicate_groups: List[near_duplicates.NearDuplicateGroup] = []
+    if options.near_duplicate_threshold is not None:
+        print("\nCore - Buscando casi-duplicados...", file=sys.stderr)
+        files_to_format, duplicate_groups = near_duplicates.find_near_duplicates(files_to_format, options.near_duplicate_threshold, cancel_token)
+        print(f"Core - Casi-duplicados omitidos: {len(relevant_files) - len(files_to_format)} (en {len(duplicate_groups)} grupos)", file=sys.stderr)
+    extracted: Dict[Path, Optional[str]] = {}
+    if options.use_extractors and output_mode != 'outline':
+        to_extract = [p for p in files_to_format if extractors.get_extractor(p) is not None and not (section_targets and p.relative_to(vault_path).as_posix() in section_targets)]
+        if to_extract:
+            print(f"\nCore - Extrayendo texto de {len(to_extract)} archivos (canvas, CSV, PDF...)...", file=sys.stderr)
+            extracted = extractors.extract_many(to_extract, cancel_token=cancel_token)
+    return files_to_format, duplicate_groups, extracted
+
+
+def create_transcluder(vault_path: Path, output_mode: str, options: GenerationOptions) -> Optional[transclusion.Transcluder]:
+    """Transcluder de la generación, o None si no se expanden incrustaciones (o el modo es 'outline')."""
+    if not options.transclusion_depth or output_mode == 'outline': return None
+    return transclusion.Transcluder(vault_path, options.transclusion_depth)
+
+
+def format_duplicates_block(duplicate_groups: List[near_duplicates.NearDuplicateGroup], vault_path: Path, options: GenerationOptions, root_label: Optional[str] = None) -> bytes:
+    """Bloque final (UTF-8, ya redactado) con los casi-duplicados omitidos."""
+    block = formatter.format_near_duplicates(duplicate_groups, vault_path, root_label).encode('utf-8')
+    return options.redactor.redact(block) if options.redactor is not None else block
+
+
+def _format_partial_target(file_path: Path, vault_path: Path, spec: str, root_label: Optional[str], transcluder: Optional[transclusion.Transcluder]) -> str:
+    """Bloque de un target parcial: rango de líneas (":120-260") o sección ("Encabezado")."""
+    if spec.startswith(file_handler.LINE_RANGE_SEPARATOR):
+        line_range = file_handler.parse_line_range(spec[len(file_handler.LINE_RANGE_SEPARATOR):])
+        return formatter.format_file_content(file_path, vault_path, root_label, transcluder=transcluder, line_range=line_range)
+    return formatter.format_file_section(file_path, vault_path, spec, root_label, transcluder)
 
+
+def write_file_block(
+    buffer: BinaryIO,
+    file_path: Path,
+    vault_path: Path,
+    output_mode: str,
+    section_targets: Dict[str, List[str]],
+    extracted: Dict[Path, Optional[str]],
+    options: Optional[GenerationOptions] = None,
+    root_label: Optional[str] = None,
+    transcluder: Optional[transclusion.Transcluder] = None,
+) -> int:
+    """Escribe en buffer (UTF-8) el bloque de un archivo según output_mode, sus secciones o su texto extraído. Devuelve los bytes escritos."""
+    options = options or GenerationOptions()
+    if options.redactor is not None:
+        block = io.BytesIO()
+        _write_plain_file_block(block, file_path, vault_path, output_mode, section_targets, extracted, options, root_label, transcluder)
+        return buffer.write(options.redactor.redact(block.getvalue()))
+    return _write_plain_file_block(buffer, file_path, vault_path, output_mode, section_targets, extracted, options, root_label, transcluder)
+
+
+def _write_plain_file_block(
+    buffer: BinaryIO,
+    file_path: Path,
+    vault_path: Path,
+    output_mode: str,
+    section_targets: Dict[str, List[str]],
+    extracted: Dict[Path, Optional[str]],
+    options: GenerationOptions,
+    root_label: Optional[str],
+    transcluder: Optional[transclusion.Transcluder],
+) -> int:
+    """write_file_block sin redacción."""
+    sections = section_targets.get(file_path.relative_to(vault_path).as_posix()) if section_targets else None
+    if output_mode == 'outline':
+        return buffer.write(formatter.format_file_outline(file_path, vault_path, root_label).encode('utf-8'))
+    if file_path in extracted:
+        return buffer.write(formatter.format_extracted_content(file_path, vault_path, extracted[file_path], root_label).encode('utf-8'))
+    if sections:
+        return sum(buffer.write(_format_partial_target(file_path, vault_path, spec, root_label, transcluder).encode('utf-8')) for spec in sections)
+    return formatter.write_file_content(
+        buffer, file_path, vault_path, root_label=root_label,
+        max_file_bytes=options.max_file_bytes, max_file_lines=options.max_file_lines, transcluder=transcluder,
+    )
+
+
+def collect_context_parts(
+    vault_path: Path,
+    target_paths: List[str],
+    extensions: List[str],
+    output_mode: str,
+    options: Optional[GenerationOptions] = None,
+    progress_callback: Optional[ProgressCallback] = None,
+    cancel_token: Optional[CancellationToken] = None,
+    root_label: Optional[str] = None,
+    content_buffer: Optional[BinaryIO] = None,
+) -> Tuple[str, str]:
+    """
+    Pasos 1-3 de la generación: busca archivos relevantes, genera el árbol y
+    formatea el contenido según output_mode y options (GenerationOptions).
+
+    root_label (opcional) se antepone a las rutas de los encabezados de contenido
+    (usado por la generación multi-bóveda).
+
+    Los targets "nota.md#Encabezado" incluyen solo esa sección del archivo, y
+    "archivo.py:120-260" solo esas líneas (con su numeración original). En
+    modo 'outline' se incluye el esquema de encabezados de cada archivo en lugar
+    de su contenido.
+
+    Con options.near_duplicate_threshold (0-1), los archivos casi idénticos se
+    agrupan y solo se formatea uno por grupo; los demás se listan al final del
+    contenido.
+
+    Si se pasa content_buffer (ej: spill.SpillBuffer), los bloques se escriben
+    en él en UTF-8, sin decodificarlos ni recortarlos, y content_block_str se
+    devuelve vacío.
+
+    Returns:
+        Tupla (tree_string, content_block_str). Cualquiera puede ser "" si el modo
+        no lo incluye.
+    """
+    options = options or GenerationOptions()
     # 1. Encontrar archivos relevantes
-    print("\nCore - Buscando archivos relevantes...", file=sys.stderr) # Mensaje añadido
-    relevant_files: List[Path] = file_handler.find_relevant_files(
-        vault_path=vault_path,
-        target_paths=target_paths,
-        extensions=extensions,
-        excluded_extensions=excluded_extensions or [] # <<< ASEGURARSE DE PASARLO >>>
+    relevant_files, section_targets = select_files(
+        vault_path, target_paths, extensions, options,
+        progress_callback=progress_callback, cancel_token=cancel_token,
     )
     if not relevant_files and output_mode != 'tree':
         print("\nCore - Advertencia: No se encontraron archivos relevantes (considerando inclusiones/exclusiones) para incluir contenido.", file=sys.stderr)
@@ -81,33 +324,51 @@ def generate_prompt_core(
     # 2. Generar string del árbol (si aplica)
     tree_string = ""
     if output_mode in ['tree', 'both']:
-        print("\nCore - Generando estructura de árbol...", file=sys.stderr)
-        tree_string = tree_generator.generate_tree_string(list(relevant_files), vault_path)
-        if not tree_string.strip() or tree_string.startswith(" (No se encontraron"):
-             print("Core - Advertencia: No se generó estructura de árbol válida.", file=sys.stderr)
-             tree_string = " (No se generó estructura de árbol para los targets/extensiones especificados)"
+        tree_string = build_tree_string(relevant_files, vault_path, options)
 
     # 3. Formatear contenido (si aplica)
-    formatted_contents: List[str] = []
     content_block_str = ""
-    if output_mode in ['content', 'both']:
+    if output_mode in ['content', 'both', 'outline']:
         if relevant_files:
+             files_to_format, duplicate_groups, extracted = prepare_files_to_format(
+                 relevant_files, vault_path, output_mode, section_targets, options, cancel_token=cancel_token,
+             )
+             transcluder = create_transcluder(vault_path, output_mode, options)
              print("\nCore - Formateando contenido...", file=sys.stderr)
-             for file_path in relevant_files:
-                 formatted = formatter.format_file_content(file_path, vault_path)
-                 if formatted: formatted_contents.append(formatted)
-             if not formatted_contents: print("Core - Advertencia: No se pudo formatear contenido.", file=sys.stderr)
-             content_block_str = "".join(formatted_contents).strip()
+             progress = ProgressInfo(stage='format', files_scanned=len(relevant_files), files_matched=len(relevant_files), files_total=len(files_to_format))
+             # Los bloques se escriben ya codificados (UTF-8) en un único buffer y se decodifican una sola vez al final
+             buffer = content_buffer if content_buffer is not None else io.BytesIO()
+             formatted_count = 0
+             for file_path in files_to_format:
+                 check_cancelled(cancel_token)
+                 written = write_file_block(
+                     buffer, file_path, vault_path, output_mode, section_targets, extracted, options,
+                     root_label=root_label, transcluder=transcluder,
+                 )
+                 if written:
+                     formatted_count += 1
+                     progress.bytes_so_far += written
+                 progress.files_formatted += 1
+                 progress.current_path = file_path
+                 report_progress(progress_callback, progress)
+             if not formatted_count: print("Core - Advertencia: No se pudo formatear contenido.", file=sys.stderr)
+             if duplicate_groups: buffer.write(format_duplicates_block(duplicate_groups, vault_path, options, root_label))
+             if content_buffer is None: content_block_str = str(buffer.getbuffer(), 'utf-8').strip()
         else:
              print("\nCore - No hay archivos relevantes para formatear contenido.", file=sys.stderr)
              content_block_str = ""
 
-    # 4. Construir bloque de contexto final
+    return tree_string, content_block_str
+
+
+def build_context_block(output_mode: str, tree_string: str, content_block_str: str) -> str:
+    """Paso 4: combina árbol y contenido en el bloque {contexto_extraido} según output_mode."""
     print(f"\nCore - Construyendo bloque de contexto (Modo: {output_mode})...", file=sys.stderr)
     context_block = ""; tree_part = ""; content_part = content_block_str
     if tree_string and not tree_string.startswith(" (No se generó"): tree_part = tree_string.strip()
     if output_mode == 'tree': context_block = tree_part if tree_part else "(Estructura de árbol no disponible o vacía)"
     elif output_mode == 'content': context_block = content_part if content_part else "(Contenido no disponible o vacío)"
+    elif output_mode == 'outline': context_block = content_part if content_part else "(Esquema no disponible o vacío)"
     elif output_mode == 'both':
         if tree_part and content_part: separator = "\n" + ("-" * 40) + " CONTENIDO " + ("-" * 40) + "\n\n"; context_block = tree_part + separator + content_part
         elif tree_part: context_block = tree_part
@@ -115,13 +376,16 @@ def generate_prompt_core(
         else: context_block = "(No se generó ni árbol ni contenido para el contexto)"
 
     print(f"Core - Contexto generado (primeros 100 chars): {context_block[:100].replace(chr(10), ' ')}...", file=sys.stderr)
+    return context_block
+
 
+def _placeholder_values(output_note_path: Optional[Path]) -> Tuple[Dict[str, Optional[str]], List[str], int]:
+    """Paso 5: valores de {ruta_destino} y {etiqueta_jerarquica_N} (todo salvo {contexto_extraido})."""
     # 5. Preparar valores para reemplazo (manejando output_note_path opcional)
     ruta_destino_relativa_str = output_note_path.as_posix() if output_note_path else ""
     hierarchical_tags = generate_hierarchical_tags(output_note_path) # Ahora maneja None
 
     replacements: Dict[str, Optional[str]] = {
-        DEFAULT_PLACEHOLDERS["contexto_extraido"]: context_block,
         DEFAULT_PLACEHOLDERS["ruta_destino"]: ruta_destino_relativa_str,
     }
 
@@ -138,13 +402,13 @@ def generate_prompt_core(
         if placeholder_fmt:
             tag_value = hierarchical_tags[i] if i < len(hierarchical_tags) else ""
             replacements[placeholder_fmt] = tag_value
+    return replacements, hierarchical_tags, max_tag_level
 
-    # 6. Inyectar placeholders
-    print("\nCore - Inyectando placeholders en la plantilla...", file=sys.stderr)
-    final_prompt = prompt_handler.inject_context_multi(template_string, replacements)
 
+def _warn_missing_note_path(template_string: str, output_note_path: Optional[Path], hierarchical_tags: List[str], max_tag_level: int):
+    """Advierte si la plantilla usa placeholders que quedan vacíos porque faltó la ruta de la nota."""
     # Advertir si placeholders clave están vacíos porque faltó la ruta
-    if not ruta_destino_relativa_str and DEFAULT_PLACEHOLDERS["ruta_destino"] in template_string:
+    if not output_note_path and DEFAULT_PLACEHOLDERS["ruta_destino"] in template_string:
         print(f"Core - Advertencia: Placeholder {{ruta_destino}} presente pero no se proporcionó Ruta Nota Destino.", file=sys.stderr)
     found_tag_placeholders_in_template = []
     for i in range(max_tag_level):
@@ -161,7 +425,368 @@ def generate_prompt_core(
     if not hierarchical_tags and found_tag_placeholders_in_template:
         placeholders_str = ', '.join(found_tag_placeholders_in_template) # Lista los placeholders encontrados
         print(f"Core - Advertencia: Placeholders ({placeholders_str}) presentes pero no se generaron etiquetas (falta Ruta Nota Destino).", file=sys.stderr)
-    # --- Fin Bloque Corregido ---
+
+
+def render_prompt(template_string: str, context_block: str, output_note_path: Optional[Path]) -> str:
+    """Pasos 5-6: prepara los valores de los placeholders y los inyecta en la plantilla."""
+    other_replacements, hierarchical_tags, max_tag_level = _placeholder_values(output_note_path)
+    replacements: Dict[str, Optional[str]] = {DEFAULT_PLACEHOLDERS["contexto_extraido"]: context_block, **other_replacements}
+
+    # 6. Inyectar placeholders
+    print("\nCore - Inyectando placeholders en la plantilla...", file=sys.stderr)
+    final_prompt = prompt_handler.inject_context_multi(template_string, replacements)
+
+    _warn_missing_note_path(template_string, output_note_path, hierarchical_tags, max_tag_level)
+    return final_prompt
+
+
+ContentPart = Tuple[spill.SpillBuffer, int, int] # (buffer, inicio, fin) de un bloque de contenido ya recortado
+
+
+def _write_context_block(out: BinaryIO, output_mode: str, tree_string: str, content_parts: List[ContentPart]):
+    """Paso 4 por streaming: igual que build_context_block, pero copia el contenido desde los buffers."""
+    print(f"\nCore - Construyendo bloque de contexto por streaming (Modo: {output_mode})...", file=sys.stderr)
+    tree_part = tree_string.strip() if tree_string and not tree_string.startswith(" (No se generó") else ""
+    content_parts = [part for part in content_parts if part[2] > part[1]]
+    def write_content():
+        for i, (buffer, start, end) in enumerate(content_parts):
+            if i: out.write(b"\n\n")
+            spill.copy_range(buffer, out, start, end)
+
+    if output_mode == 'tree': out.write((tree_part or "(Estructura de árbol no disponible o vacía)").encode('utf-8'))
+    elif output_mode in ['content', 'outline']:
+        if content_parts: write_content()
+        else: out.write(("(Contenido no disponible o vacío)" if output_mode == 'content' else "(Esquema no disponible o vacío)").encode('utf-8'))
+    elif output_mode == 'both':
+        if tree_part: out.write(tree_part.encode('utf-8'))
+        if tree_part and content_parts: out.write(("\n" + ("-" * 40) + " CONTENIDO " + ("-" * 40) + "\n\n").encode('utf-8'))
+        if content_parts: write_content()
+        if not tree_part and not content_parts: out.write("(No se generó ni árbol ni contenido para el contexto)".encode('utf-8'))
+
+
+def write_prompt(
+    out: BinaryIO,
+    template_string: str,
+    output_mode: str,
+    tree_string: str,
+    content_parts: List[ContentPart],
+    output_note_path: Optional[Path],
+):
+    """
+    Pasos 4-6 por streaming: escribe el prompt final en `out` (UTF-8) sin
+    construirlo como string. El texto de la plantilla se escribe tal cual y el
+    bloque {contexto_extraido} se copia desde los buffers de contenido (ver
+    spill.copy_range).
+
+    A diferencia de render_prompt, los placeholders que aparezcan dentro del
+    contenido de las notas no se sustituyen.
+    """
+    other_replacements, hierarchical_tags, max_tag_level = _placeholder_values(output_note_path)
+    print("\nCore - Escribiendo prompt por streaming...", file=sys.stderr)
+    segments = template_string.split(DEFAULT_PLACEHOLDERS["contexto_extraido"])
+    for i, segment in enumerate(segments):
+        if i: _write_context_block(out, output_mode, tree_string, content_parts)
+        for placeholder_fmt, value in other_replacements.items():
+            segment = segment.replace(placeholder_fmt, value or "")
+        out.write(segment.encode('utf-8'))
+    if len(segments) == 1:
+        print("Advertencia: El placeholder {contexto_extraido} no se encontró en la plantilla.", file=sys.stderr)
+    _warn_missing_note_path(template_string, output_note_path, hierarchical_tags, max_tag_level)
+
+
+def _write_extra_prompts(
+    extra_templates: Optional[List[Tuple[str, BinaryIO]]],
+    output_mode: str,
+    tree_string: str,
+    content_parts: Optional[List[ContentPart]],
+    context_block: Optional[str],
+    output_note_path: Optional[Path],
+):
+    """
+    Renderiza cada plantilla adicional con el contexto ya calculado y la escribe
+    en su archivo: desde los buffers de contenido (streaming) o, si el contexto
+    se construyó en memoria, desde context_block.
+    """
+    for template_string, out in extra_templates or []:
+        if content_parts is not None: write_prompt(out, template_string, output_mode, tree_string, content_parts, output_note_path)
+        else: out.write(render_prompt(template_string, context_block, output_note_path).encode('utf-8'))
+
+
+def generate_prompt_core(
+    vault_path: Path,
+    target_paths: List[str],
+    extensions: List[str],
+    output_mode: str,
+    output_note_path: Optional[Path], # <-- Ahora es Opcional
+    template_string: str,
+    options: Optional[GenerationOptions] = None,
+    progress_callback: Optional[ProgressCallback] = None,
+    cancel_token: Optional[CancellationToken] = None,
+    output_stream: Optional[BinaryIO] = None,
+    max_memory: Optional[int] = None,
+    extra_templates: Optional[List[Tuple[str, BinaryIO]]] = None,
+) -> Optional[str]:
+    """
+    Lógica central para generar el prompt final.
+
+    options (GenerationOptions) reúne las opciones de selección y formateo
+    (exclusiones, límites, filtros, orden, redacción...). file_order='stable'
+    pone primero el contenido que menos cambia (ver prompt_prefix para medir el
+    prefijo reutilizado entre ejecuciones).
+
+    progress_callback recibe un ProgressInfo durante la búsqueda ('scan') y tras
+    cada archivo formateado ('format'). cancel_token se comprueba entre archivos;
+    si se cancela, se lanza progress.GenerationCancelled.
+    extra_templates (opcional): pares (plantilla, archivo binario). El contexto
+    se calcula una sola vez y cada plantilla se renderiza con él en su archivo.
+
+    Si se pasa output_stream (archivo binario), el prompt se escribe en él por
+    streaming y se devuelve None: el contenido formateado se acumula en un
+    spill.SpillBuffer que pasa a disco al superar max_memory bytes, y se copia
+    a la salida sin construir el prompt como string (ver write_prompt).
+    """
+    print("--- Iniciando Lógica Core ---", file=sys.stderr)
+    print(f"Core - Bóveda: {vault_path}", file=sys.stderr)
+    print(f"Core - Targets: {target_paths}", file=sys.stderr)
+    print(f"Core - Incluir Extensiones: {extensions}", file=sys.stderr)
+    options = options or GenerationOptions()
+    print(f"Core - Excluir Extensiones: {options.excluded_extensions if options.excluded_extensions else 'Ninguna'}", file=sys.stderr)
+    print(f"Core - Modo Contexto: {output_mode}", file=sys.stderr)
+    print(f"Core - Ruta Nota Destino: {output_note_path if output_note_path else 'No especificada'}", file=sys.stderr)
+
+    content_buffer = spill.SpillBuffer(max_memory) if output_stream is not None else None
+    try:
+        tree_string, content_block_str = collect_context_parts(
+            vault_path, target_paths, extensions, output_mode, options,
+            progress_callback=progress_callback,
+            cancel_token=cancel_token,
+            content_buffer=content_buffer,
+        )
+        if content_buffer is not None:
+            content_parts = [(content_buffer, *content_buffer.stripped_range())]
+            write_prompt(output_stream, template_string, output_mode, tree_string, content_parts, output_note_path)
+            _write_extra_prompts(extra_templates, output_mode, tree_string, content_parts, None, output_note_path)
+            print("--- Fin Lógica Core ---", file=sys.stderr)
+            return None
+    finally:
+        if content_buffer is not None: content_buffer.close()
+    context_block = build_context_block(output_mode, tree_string, content_block_str)
+    final_prompt = render_prompt(template_string, context_block, output_note_path)
+    _write_extra_prompts(extra_templates, output_mode, tree_string, None, context_block, output_note_path)
 
     print("--- Fin Lógica Core ---", file=sys.stderr)
-    return final_prompt
\ No newline at end of file
+    return final_prompt
+
+
+def split_federated_targets(target_paths: List[str], vault_names: List[str]) -> Dict[str, List[str]]:
+    """
+    Reparte los targets entre bóvedas para la generación multi-bóveda.
+
+    Un target "NOMBRE::ruta" se asigna solo a la bóveda NOMBRE; un target sin
+    prefijo se aplica a todas. Una bóveda sin targets usa la bóveda completa.
+
+    Raises:
+        ValueError: Si un target referencia una bóveda que no está seleccionada.
+    """
+    per_vault: Dict[str, List[str]] = {name: [] for name in vault_names}
+    for target in target_paths:
+        if FEDERATED_TARGET_SEPARATOR in target:
+            name, relative = target.split(FEDERATED_TARGET_SEPARATOR, 1)
+            if name not in per_vault:
+                raise ValueError(f"Target '{target}' referencia la bóveda '{name}', que no está seleccionada.")
+            per_vault[name].append(relative)
+        else:
+            for name in per_vault: per_vault[name].append(target)
+    return per_vault
+
+
+def _merge_federated_trees(vault_trees: List[Tuple[str, str]]) -> str:
+    """Une los árboles de varias bóvedas en uno solo con una raíz [NOMBRE] por bóveda."""
+    lines: List[str] = []
+    for i, (name, tree_string) in enumerate(vault_trees):
+        is_last = (i == len(vault_trees) - 1)
+        lines.append(("└── " if is_last else "├── ") + f"[{name}]")
+        extension = "    " if is_last else "│   "
+        if tree_string and not tree_string.startswith(" (No se"):
+            lines.extend(extension + line for line in tree_string.strip().splitlines())
+        else:
+            lines.append(extension + "└── (sin archivos relevantes)")
+    return "\n".join(lines)
+
+
+def generate_federated_prompt_core(
+    vaults: List[Tuple[str, Path, List[str]]],
+    extensions: List[str],
+    output_mode: str,
+    output_note_path: Optional[Path],
+    template_string: str,
+    options: Optional[GenerationOptions] = None,
+    progress_callback: Optional[ProgressCallback] = None,
+    cancel_token: Optional[CancellationToken] = None,
+    max_workers: Optional[int] = None,
+    output_stream: Optional[BinaryIO] = None,
+    max_memory: Optional[int] = None,
+    extra_templates: Optional[List[Tuple[str, BinaryIO]]] = None,
+) -> Optional[str]:
+    """
+    Genera un único prompt a partir de varias bóvedas. Cada bóveda se recorre y
+    se lee en su propio hilo, por lo que el tiempo total queda acotado por la
+    bóveda más lenta. El árbol resultante tiene una raíz por bóveda y el
+    contenido se concatena en el orden en que se dieron las bóvedas.
+
+    Args:
+        vaults: Lista de tuplas (nombre, ruta_bóveda, targets_relativos).
+        max_workers: Hilos concurrentes. Default: uno por bóveda.
+        output_stream / max_memory: Como en generate_prompt_core; el límite de
+                    memoria se reparte a partes iguales entre las bóvedas.
+        (resto igual que generate_prompt_core; options se aplica a todas las bóvedas)
+    """
+    options = options or GenerationOptions()
+    print("--- Iniciando Lógica Core (Multi-Bóveda) ---", file=sys.stderr)
+    for name, vault_path, targets in vaults:
+        print(f"Core - Bóveda '{name}': {vault_path} | Targets: {targets}", file=sys.stderr)
+    print(f"Core - Modo Contexto: {output_mode}", file=sys.stderr)
+
+    # Progreso agregado: se suma el último estado conocido de cada bóveda
+    progress_lock = threading.Lock()
+    latest_progress: Dict[str, ProgressInfo] = {}
+    def make_vault_callback(name: str) -> Optional[ProgressCallback]:
+        if progress_callback is None: return None
+        def callback(info: ProgressInfo):
+            with progress_lock:
+                latest_progress[name] = ProgressInfo(**vars(info))
+                infos = list(latest_progress.values())
+                all_formatting = len(infos) == len(vaults) and all(i.stage == 'format' for i in infos)
+                combined = ProgressInfo(
+                    stage='format' if all_formatting else 'scan',
+                    files_scanned=sum(i.files_scanned for i in infos),
+                    files_matched=sum(i.files_matched for i in infos),
+                    files_formatted=sum(i.files_formatted for i in infos),
+                    files_total=sum(i.files_total for i in infos),
+                    bytes_so_far=sum(i.bytes_so_far for i in infos),
+                    current_path=info.current_path,
+                )
+                progress_callback(combined)
+        return callback
+
+    content_buffers: List[Optional[spill.SpillBuffer]] = [
+        spill.SpillBuffer(max_memory // len(vaults) if max_memory else None) if output_stream is not None else None
+        for _ in vaults
+    ]
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers or len(vaults) or 1, thread_name_prefix="vault") as executor:
+            futures = [
+                executor.submit(
+                    collect_context_parts, vault_path, targets, extensions, output_mode, options,
+                    progress_callback=make_vault_callback(name),
+                    cancel_token=cancel_token,
+                    root_label=name,
+                    content_buffer=content_buffer,
+                )
+                for (name, vault_path, targets), content_buffer in zip(vaults, content_buffers)
+            ]
+            results = [future.result() for future in futures]
+
+        tree_string = ""
+        if output_mode in ['tree', 'both']:
+            tree_string = _merge_federated_trees([(name, tree) for (name, _, _), (tree, _) in zip(vaults, results)])
+        if output_stream is not None:
+            content_parts = [(buffer, *buffer.stripped_range()) for buffer in content_buffers]
+            write_prompt(output_stream, template_string, output_mode, tree_string, content_parts, output_note_path)
+            _write_extra_prompts(extra_templates, output_mode, tree_string, content_parts, None, output_note_path)
+            print("--- Fin Lógica Core (Multi-Bóveda) ---", file=sys.stderr)
+            return None
+    finally:
+        for buffer in content_buffers:
+            if buffer is not None: buffer.close()
+    content_block_str = "\n\n".join(content for _, content in results if content)
+
+    context_block = build_context_block(output_mode, tree_string, content_block_str)
+    final_prompt = render_prompt(template_string, context_block, output_note_path)
+    _write_extra_prompts(extra_templates, output_mode, tree_string, None, context_block, output_note_path)
+
+    print("--- Fin Lógica Core (Multi-Bóveda) ---", file=sys.stderr)
+    return final_prompt
+
+
+# --- Estimación previa (sin abrir archivos) ---
+
+# Aproximación habitual para texto en idiomas latinos: ~4 bytes por token
+BYTES_PER_TOKEN = 4
+# Bytes que añade cada bloque formateado (tres separadores y encabezado) sin contar la ruta
+BLOCK_OVERHEAD_BYTES = 3 * len(formatter.SEPARATOR) + 8
+# Sin abrir los archivos no se conocen sus líneas: se asume una longitud media por línea
+# para estimar los prefijos de numeración ("  N | ")
+ESTIMATED_LINE_BYTES = 40
+LINE_PREFIX_BYTES = 6
+ESTIMATE_TOP_FILES = 10
+
+
+@dataclass
+class SelectionEstimate:
+    """Resultado de estimate_selection."""
+    files: int = 0
+    total_bytes: int = 0
+    estimated_tokens: int = 0
+    largest_files: List[Tuple[str, int]] = field(default_factory=list) # (ruta mostrada, bytes), de mayor a menor
+    unindexed_files: int = 0 # Incluidos sin aplicar --tag/--where por no estar en el índice
+
+
+def estimate_selection(
+    vault_path: Path,
+    target_paths: List[str],
+    extensions: List[str],
+    output_mode: str = 'both',
+    options: Optional[GenerationOptions] = None,
+    root_label: Optional[str] = None,
+    top_n: int = ESTIMATE_TOP_FILES,
+) -> SelectionEstimate:
+    """
+    Estima el tamaño de una generación sin abrir ningún archivo: usa solo el
+    recorrido de directorios, stat y el índice de metadatos (para --tag/--where).
+
+    Los tokens son una aproximación (BYTES_PER_TOKEN); no se descuentan
+    secciones, casi-duplicados ni --max-file-lines, por lo que la estimación es
+    una cota superior del contenido real. Usa las mismas opciones de selección
+    que select_files (y options.max_file_bytes como tope por archivo).
+    """
+    options = options or GenerationOptions()
+    search_targets, _ = file_handler.split_section_targets(vault_path, target_paths)
+    relevant_files = _find_candidate_files(vault_path, search_targets, extensions, options)
+    estimate = SelectionEstimate()
+    if options.filters_metadata:
+        relevant_files, estimate.unindexed_files = tag_index.filter_files_indexed(relevant_files, options.tag_filters, options.where_filters)
+        if options.max_files is not None: relevant_files = file_handler.select_top_files(relevant_files, vault_path, options.max_files, options.selection_sort)
+
+    sizes: List[Tuple[int, str]] = []
+    tree_bytes = 0
+    for file_path in relevant_files:
+        try: size = os.stat(file_path).st_size
+        except OSError: continue
+        if options.max_file_bytes is not None: size = min(size, options.max_file_bytes)
+        display_path = file_path.relative_to(vault_path).as_posix()
+        if root_label: display_path = f"{root_label}/{display_path}"
+        sizes.append((size, display_path))
+        tree_bytes += len(file_path.name) + 8 # Nombre + ramas del árbol ("│   ├── ")
+
+    estimate.files = len(sizes)
+    estimate.total_bytes = sum(size for size, _ in sizes)
+    estimated_bytes = 0
+    if output_mode in ['tree', 'both']: estimated_bytes += tree_bytes
+    if output_mode in ['content', 'both', 'outline']:
+        estimated_bytes += estimate.total_bytes + estimate.total_bytes // ESTIMATED_LINE_BYTES * LINE_PREFIX_BYTES
+        estimated_bytes += sum(len(path) + BLOCK_OVERHEAD_BYTES for _, path in sizes)
+    estimate.estimated_tokens = estimated_bytes // BYTES_PER_TOKEN
+    estimate.largest_files = [(path, size) for size, path in heapq.nlargest(top_n, sizes)]
+    return estimate
+
+
+def merge_estimates(estimates: List[SelectionEstimate], top_n: int = ESTIMATE_TOP_FILES) -> SelectionEstimate:
+    """Combina las estimaciones de varias bóvedas (generación multi-bóveda)."""
+    return SelectionEstimate(
+        files=sum(e.files for e in estimates),
+        total_bytes=sum(e.total_bytes for e in estimates),
+        estimated_tokens=sum(e.estimated_tokens for e in estimates),
+        largest_files=heapq.nlargest(top_n, (item for e in estimates for item in e.largest_files), key=lambda item: item[1]),
+        unindexed_files=sum(e.unindexed_files for e in estimates),
+    )
@@ -0,0 +1,17 @@
+# defaults.py
+# Constantes compartidas sin dependencias: main.py las usa para construir las
+# opciones y la ayuda de la CLI sin cargar el pipeline de generación.
+
+# Extensiones incluidas si no se indica ninguna
+DEFAULT_EXTENSIONS = ['.md']
+# Similitud mínima para considerar dos notas casi-duplicados (--dedupe sin valor)
+DEFAULT_NEAR_DUPLICATE_THRESHOLD = 0.8
+# Órdenes del contenido: 'name' (alfabético) o 'stable' (archivos menos modificados primero)
+FILE_ORDERS = ('name', 'stable')
+# Niveles de incrustación que se expanden por defecto (--expand-embeds sin valor)
+DEFAULT_TRANSCLUSION_DEPTH = 2
+# Criterios de --max-files: 'mtime' (más recientes), 'size' (más grandes) o 'name' (primeros por ruta)
+SELECTION_SORTS = ('mtime', 'size', 'name')
+# Patrones de redacción incluidos (redaction.BUILTIN_PATTERNS) y texto que sustituye cada coincidencia
+REDACTION_PRESETS = ('email', 'api_key', 'private_key')
+REDACTION_REPLACEMENT = "[REDACTADO:{name}]"
@@ -0,0 +1,128 @@
+# dir_index.py
+import os
+import sys
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from index_cache import IndexCache, get_default_cache
+
+CACHE_NAMESPACE = "dir-summary-v2"
+
+
+class DirectoryEntry(NamedTuple):
+    """Entrada del explorador de directorios (un nivel)."""
+    name: str
+    relative_path: str # Posix, relativa a la bóveda (lista para usar como target)
+    is_dir: bool
+    file_count: int    # Archivos que pasan el filtro de extensiones (directos, o de todo el subárbol con subtree_totals)
+    total_bytes: int
+    dir_count: int = 0 # Subdirectorios directos (solo directorios)
+
+
+def _direct_summary(directory: Path, cache: IndexCache) -> Optional[Dict[str, list]]:
+    """
+    Resumen del contenido directo de un directorio: {"dirs": [nombres],
+    "files": [[nombre, bytes, mtime_ns], ...]}. Se guarda en la caché y el
+    listado se reutiliza mientras el directorio no cambie (mismo mtime: no se
+    añadieron, borraron ni renombraron entradas). Como editar un archivo no
+    cambia el mtime del directorio, el tamaño y mtime de cada archivo se
+    comprueban con stat y las entradas editadas se actualizan.
+    """
+    try:
+        st = os.stat(directory)
+    except OSError:
+        return None
+    cached = cache.get(CACHE_NAMESPACE, directory, st)
+    if cached is not None:
+        changed = False
+        for item in cached["files"]:
+            try: file_st = os.stat(directory / item[0])
+            except OSError: continue # Borrado: el mtime del directorio ya habrá cambiado
+            if (item[1], item[2]) != (file_st.st_size, file_st.st_mtime_ns):
+                item[1], item[2] = file_st.st_size, file_st.st_mtime_ns; changed = True
+        if changed: cache.put(CACHE_NAMESPACE, directory, cached, st)
+        return cached
+    summary: Dict[str, list] = {"dirs": [], "files": []}
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                try:
+                    # Igual que find_relevant_files: no se entra en directorios enlazados
+                    if entry.is_dir(follow_symlinks=False): summary["dirs"].append(entry.name)
+                    elif entry.is_file():
+                        entry_st = entry.stat()
+                        summary["files"].append([entry.name, entry_st.st_size, entry_st.st_mtime_ns])
+                except OSError: continue
+    except OSError as e:
+        print(f"Advertencia: No se pudo listar {directory}: {e}", file=sys.stderr)
+        return None
+    cache.put(CACHE_NAMESPACE, directory, summary, st)
+    return summary
+
+
+def _matches(name: str, extensions: Optional[List[str]], excluded_extensions: Optional[List[str]]) -> bool:
+    suffix = Path(name).suffix.lower()
+    if extensions and suffix not in extensions: return False
+    return not excluded_extensions or suffix not in excluded_extensions
+
+
+def _aggregate(
+    directory: Path,
+    cache: IndexCache,
+    extensions: Optional[List[str]],
+    excluded_extensions: Optional[List[str]],
+    memo: Dict[Path, Tuple[int, int]],
+) -> Tuple[int, int]:
+    """(archivos, bytes) del subárbol, a partir de los resúmenes cacheados de cada directorio."""
+    if directory in memo: return memo[directory]
+    memo[directory] = (0, 0) # Protege contra ciclos (puntos de unión)
+    summary = _direct_summary(directory, cache)
+    if summary is None: return 0, 0
+    matched = [size for name, size, _ in summary["files"] if _matches(name, extensions, excluded_extensions)]
+    file_count, total_bytes = len(matched), sum(matched)
+    for name in summary["dirs"]:
+        sub_count, sub_bytes = _aggregate(directory / name, cache, extensions, excluded_extensions, memo)
+        file_count += sub_count; total_bytes += sub_bytes
+    memo[directory] = (file_count, total_bytes)
+    return file_count, total_bytes
+
+
+def list_directory(
+    vault_path: Path,
+    relative_dir: str = "",
+    extensions: Optional[List[str]] = None,
+    excluded_extensions: Optional[List[str]] = None,
+    cache: Optional[IndexCache] = None,
+    subtree_totals: bool = False,
+) -> List[DirectoryEntry]:
+    """
+    Lista UN nivel de la bóveda (para cargar el árbol de forma perezosa):
+    directorios primero y luego archivos que pasan el filtro de extensiones,
+    ambos en orden alfabético sin distinguir mayúsculas. Cada directorio
+    incluye sus archivos y bytes directos y su número de subdirectorios, así
+    que listar un nivel solo lee ese nivel y el siguiente. Con subtree_totals,
+    los archivos y bytes son los de todo el subárbol (se recorre entero, desde
+    los resúmenes cacheados).
+    """
+    cache = cache or get_default_cache()
+    normalized_extensions = [f".{e.lower().lstrip('.')}" for e in extensions or [] if e]
+    normalized_excluded = [f".{e.lower().lstrip('.')}" for e in excluded_extensions or [] if e]
+    directory = vault_path / relative_dir if relative_dir else vault_path
+    summary = _direct_summary(directory, cache)
+    if summary is None: return []
+
+    prefix = f"{relative_dir.strip('/')}/" if relative_dir.strip('/') else ""
+    memo: Dict[Path, Tuple[int, int]] = {}
+    entries: List[DirectoryEntry] = []
+    for name in sorted(summary["dirs"], key=str.lower):
+        child = _direct_summary(directory / name, cache)
+        if subtree_totals: file_count, total_bytes = _aggregate(directory / name, cache, normalized_extensions, normalized_excluded, memo)
+        else:
+            matched = [size for child_name, size, _ in child["files"] if _matches(child_name, normalized_extensions, normalized_excluded)] if child else []
+            file_count, total_bytes = len(matched), sum(matched)
+        entries.append(DirectoryEntry(name, prefix + name, True, file_count, total_bytes, len(child["dirs"]) if child else 0))
+    for name, size, _ in sorted(summary["files"], key=lambda item: item[0].lower()):
+        if _matches(name, normalized_extensions, normalized_excluded):
+            entries.append(DirectoryEntry(name, prefix + name, False, 1, size))
+    cache.flush()
+    return entries
@@ -0,0 +1,263 @@
+# extractors.py
+from concurrent.futures import ProcessPoolExecutor
+import csv
+import json
+import os
+from pathlib import Path
+import re
+import sys
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from file_handler import read_file_content
+from index_cache import IndexCache, get_default_cache
+from progress import CancellationToken, check_cancelled
+
+CACHE_NAMESPACE = "extract-v1"
+# Límites para que las tablas CSV queden compactas
+CSV_MAX_ROWS = 20
+CSV_MAX_COLUMNS = 12
+CSV_MAX_CELL_CHARS = 40
+# Longitud máxima de la etiqueta de un nodo de canvas en la lista de conexiones
+CANVAS_LABEL_CHARS = 60
+
+
+class Extractor(NamedTuple):
+    """Convierte un tipo de archivo en texto compacto para el prompt."""
+    function: Callable[[Path], str] # Debe ser una función de módulo (se envía a otros procesos)
+    heavy: bool = False             # Uso intensivo de CPU: se ejecuta en un pool de procesos
+
+
+_registry: Dict[str, Extractor] = {}
+
+
+def register_extractor(suffix: str, function: Callable[[Path], str], heavy: bool = False):
+    """
+    Registra (o reemplaza) el extractor de un sufijo. El sufijo puede ser
+    compuesto (".excalidraw.md"); gana el sufijo más largo que coincida.
+    """
+    _registry[suffix.lower()] = Extractor(function, heavy)
+
+
+def get_extractor(file_path: Path) -> Optional[Extractor]:
+    """Extractor registrado para el archivo, o None si se incluye como texto normal."""
+    name = file_path.name.lower()
+    matches = [suffix for suffix in _registry if name.endswith(suffix)]
+    return _registry[max(matches, key=len)] if matches else None
+
+
+# --- Extractores incluidos ---
+
+def _canvas_node_label(node: Dict) -> str:
+    node_type = node.get("type")
+    if node_type == "text": label = (node.get("text") or "").strip()
+    elif node_type == "file": label = node.get("file", "") + (f"#{node['subpath'].lstrip('#')}" if node.get("subpath") else "")
+    elif node_type == "link": label = node.get("url", "")
+    else: label = node.get("label", "") or "(grupo sin nombre)"
+    return label
+
+
+def _canvas_contains(group: Dict, node: Dict) -> bool:
+    try:
+        return (group["x"] <= node["x"] and group["y"] <= node["y"]
+                and node["x"] + node["width"] <= group["x"] + group["width"]
+                and node["y"] + node["height"] <= group["y"] + group["height"])
+    except (KeyError, TypeError):
+        return False
+
+
+def extract_canvas(file_path: Path) -> str:
+    """
+    Canvas de Obsidian (JSON): los nodos como esquema, anidados en el grupo más
+    pequeño que los contiene y en orden de lectura (arriba-abajo,
+    izquierda-derecha), seguidos de las conexiones entre nodos.
+    """
+    data = json.loads(read_file_content(file_path) or "{}")
+    nodes = [node for node in data.get("nodes", []) if isinstance(node, dict)]
+    edges = [edge for edge in data.get("edges", []) if isinstance(edge, dict)]
+    groups = [node for node in nodes if node.get("type") == "group"]
+    area = lambda node: node.get("width", 0) * node.get("height", 0)
+    parents: Dict[str, Optional[str]] = {}
+    for node in nodes:
+        containers = [group for group in groups if group is not node and _canvas_contains(group, node)]
+        parents[node.get("id")] = min(containers, key=area).get("id") if containers else None
+    reading_order = sorted(nodes, key=lambda node: (node.get("y", 0), node.get("x", 0)))
+
+    lines: List[str] = []
+    type_names = {"text": "texto", "file": "archivo", "link": "enlace", "group": "grupo"}
+    def add_children(parent_id: Optional[str], depth: int):
+        for node in reading_order:
+            if parents.get(node.get("id")) != parent_id: continue
+            indent = "  " * depth
+            label_lines = _canvas_node_label(node).splitlines() or [""]
+            lines.append(f"{indent}- [{type_names.get(node.get('type'), node.get('type', '?'))}] {label_lines[0]}")
+            lines.extend(f"{indent}  {line}" for line in label_lines[1:] if line.strip())
+            if node.get("type") == "group": add_children(node.get("id"), depth + 1)
+    add_children(None, 0)
+
+    if edges:
+        short_labels = {node.get("id"): (_canvas_node_label(node).splitlines() or [""])[0][:CANVAS_LABEL_CHARS] for node in nodes}
+        lines.append("")
+        lines.append("Conexiones:")
+        for edge in edges:
+            # Por defecto en Obsidian: sin flecha en el origen y con flecha en el destino
+            arrow = {(False, True): "→", (True, True): "↔", (True, False): "←", (False, False): "—"}[(edge.get("fromEnd") == "arrow", edge.get("toEnd", "arrow") != "none")]
+            label = f" ({edge['label']})" if edge.get("label") else ""
+            lines.append(f"- {short_labels.get(edge.get('fromNode'), '?')} {arrow} {short_labels.get(edge.get('toNode'), '?')}{label}")
+    return "\n".join(lines) if lines else "(Canvas vacío)"
+
+
+# Inicio de los datos del dibujo ("%%\n# Drawing" o "## Drawing" en versiones recientes del plugin)
+_EXCALIDRAW_DRAWING_RE = re.compile(r'^(?:%%[ \t]*\r?\n)?#{1,2} Drawing[ \t]*$', re.MULTILINE)
+_EXCALIDRAW_WARNING_RE = re.compile(r'^==⚠.*⚠==[ \t]*$', re.MULTILINE)
+_BLOCK_ID_RE = re.compile(r'[ \t]+\^[\w-]+[ \t]*$', re.MULTILINE)
+_FRONTMATTER_RE = re.compile(r'\A---[ \t]*\r?\n.*?^(?:---|\.\.\.)[ \t]*\r?\n?', re.DOTALL | re.MULTILINE)
+
+
+def extract_excalidraw(file_path: Path) -> str:
+    """
+    Dibujo de Excalidraw (.excalidraw.md): solo los textos del dibujo y los
+    archivos/enlaces incrustados, sin el JSON (a menudo comprimido) del dibujo.
+    """
+    text = read_file_content(file_path) or ""
+    text = _FRONTMATTER_RE.sub('', text, count=1)
+    drawing = _EXCALIDRAW_DRAWING_RE.search(text)
+    if drawing: text = text[:drawing.start()]
+    text = _BLOCK_ID_RE.sub('', _EXCALIDRAW_WARNING_RE.sub('', text))
+    lines = [line.rstrip() for line in text.splitlines() if line.strip() != "%%"]
+    compact: List[str] = []
+    for line in lines:
+        if line or (compact and compact[-1]): compact.append(line)
+    return "\n".join(compact).strip() or "(Dibujo sin textos)"
+
+
+def extract_excalidraw_json(file_path: Path) -> str:
+    """Dibujo de Excalidraw sin el plugin (.excalidraw, JSON): los textos de sus elementos en orden de lectura."""
+    data = json.loads(read_file_content(file_path) or "{}")
+    texts = [element for element in data.get("elements", []) if isinstance(element, dict) and element.get("type") == "text" and not element.get("isDeleted")]
+    texts.sort(key=lambda element: (element.get("y", 0), element.get("x", 0)))
+    return "\n".join((element.get("originalText") or element.get("text") or "").strip() for element in texts).strip() or "(Dibujo sin textos)"
+
+
+def _truncate_cell(value: str) -> str:
+    value = " ".join(value.split()).replace("|", "\\|")
+    return value if len(value) <= CSV_MAX_CELL_CHARS else value[:CSV_MAX_CELL_CHARS - 1] + "…"
+
+
+def extract_csv(file_path: Path) -> str:
+    """CSV/TSV como tabla Markdown: cabecera y las primeras CSV_MAX_ROWS filas, con el total de filas y columnas."""
+    with open(file_path, encoding='utf-8', errors='replace', newline='') as f:
+        sample = f.read(64 * 1024); f.seek(0)
+        try: dialect = csv.Sniffer().sniff(sample, delimiters=",;\t|")
+        except csv.Error: dialect = csv.excel_tab if file_path.suffix.lower() == ".tsv" else csv.excel
+        reader = csv.reader(f, dialect)
+        rows: List[List[str]] = []; total_rows = 0; total_columns = 0
+        for row in reader:
+            if not row: continue
+            total_rows += 1; total_columns = max(total_columns, len(row))
+            if len(rows) <= CSV_MAX_ROWS: rows.append(row)
+    if not rows: return "(CSV vacío)"
+    columns = min(total_columns, CSV_MAX_COLUMNS)
+    def table_row(row: List[str]) -> str:
+        cells = [_truncate_cell(cell) for cell in row[:columns]] + [""] * (columns - len(row[:columns]))
+        return "| " + " | ".join(cells) + " |"
+    lines = [table_row(rows[0]), "|" + "---|" * columns]
+    lines.extend(table_row(row) for row in rows[1:])
+    omitted = []
+    if total_rows - len(rows) > 0: omitted.append(f"{total_rows - len(rows)} filas más")
+    if total_columns > columns: omitted.append(f"{total_columns - columns} columnas más")
+    if omitted: lines.append(f"… ({', '.join(omitted)}; {total_rows - 1} filas de datos en total)")
+    return "\n".join(lines)
+
+
+def extract_pdf(file_path: Path) -> str:
+    """
+    Texto de un PDF, página a página. Requiere la biblioteca opcional pypdf.
+
+    Raises:
+        RuntimeError: Si pypdf no está instalado.
+    """
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        raise RuntimeError("se necesita la biblioteca 'pypdf' (pip install pypdf)")
+    pages: List[str] = []
+    for number, page in enumerate(PdfReader(str(file_path)).pages, start=1):
+        text = "\n".join(line.rstrip() for line in (page.extract_text() or "").splitlines() if line.strip())
+        if text: pages.append(f"[Página {number}]\n{text}")
+    return "\n\n".join(pages) or "(PDF sin texto extraíble)"
+
+
+register_extractor(".canvas", extract_canvas)
+register_extractor(".excalidraw.md", extract_excalidraw)
+register_extractor(".excalidraw", extract_excalidraw_json)
+register_extractor(".csv", extract_csv)
+register_extractor(".tsv", extract_csv)
+register_extractor(".pdf", extract_pdf, heavy=True)
+
+
+# --- Extracción con caché ---
+
+def _run_extractor(extractor: Extractor, file_path: Path) -> Tuple[Optional[str], Optional[str]]:
+    """(texto, error): los errores se devuelven como texto para poder informarlos desde el proceso principal."""
+    try:
+        return extractor.function(file_path), None
+    except Exception as e:
+        return None, str(e) or type(e).__name__
+
+
+def extract_many(
+    file_paths: List[Path],
+    max_workers: Optional[int] = None,
+    cancel_token: Optional[CancellationToken] = None,
+    cache: Optional[IndexCache] = None,
+) -> Dict[Path, Optional[str]]:
+    """
+    Extrae el texto de archivos con extractor registrado. Los resultados se
+    cachean por mtime/tamaño, así que cada versión de un archivo se convierte
+    una sola vez. Los extractores pesados (ej: PDF) se ejecutan en un pool de
+    procesos y el resto en el proceso actual.
+
+    Returns:
+        Diccionario ruta -> texto (None si la extracción falló; ya se avisó por stderr).
+    """
+    cache = cache or get_default_cache()
+    results: Dict[Path, Optional[str]] = {}
+    light: List[Tuple[Path, Extractor]] = []; heavy: List[Tuple[Path, Extractor]] = []
+    for file_path, cached in zip(file_paths, cache.get_many(CACHE_NAMESPACE, file_paths)):
+        extractor = get_extractor(file_path)
+        if extractor is None: continue
+        if cached is not None: results[file_path] = cached["text"]
+        else: (heavy if extractor.heavy else light).append((file_path, extractor))
+
+    def store(file_path: Path, stat_result: Optional[os.stat_result], outcome: Tuple[Optional[str], Optional[str]]):
+        text, error = outcome
+        results[file_path] = text
+        if error is not None: print(f"Advertencia: No se pudo extraer el texto de {file_path.name}: {error}", file=sys.stderr)
+        elif stat_result is not None: cache.put(CACHE_NAMESPACE, file_path, {"text": text}, stat_result)
+
+    def stat_or_none(file_path: Path) -> Optional[os.stat_result]:
+        # Se toma antes de extraer: si el archivo cambia mientras tanto, la entrada quedará obsoleta y se rehará
+        try: return os.stat(file_path)
+        except OSError: return None
+
+    if heavy:
+        workers = max_workers or min(len(heavy), os.cpu_count() or 1)
+        print(f"Extrayendo texto de {len(heavy)} archivos en {workers} procesos...", file=sys.stderr)
+        try:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = [(file_path, stat_or_none(file_path), executor.submit(_run_extractor, extractor, file_path)) for file_path, extractor in heavy]
+                try:
+                    for file_path, stat_result, future in futures:
+                        check_cancelled(cancel_token)
+                        store(file_path, stat_result, future.result())
+                finally:
+                    for _, _, future in futures: future.cancel()
+        except (OSError, RuntimeError) as e: # Sin soporte de procesos (ej: entorno restringido): en este proceso
+            print(f"Advertencia: Pool de procesos no disponible ({e}); extrayendo en el proceso actual.", file=sys.stderr)
+            light.extend((file_path, extractor) for file_path, extractor in heavy if file_path not in results)
+    for file_path, extractor in light:
+        check_cancelled(cancel_token)
+        stat_result = stat_or_none(file_path)
+        store(file_path, stat_result, _run_extractor(extractor, file_path))
+    cache.flush()
+    return results
@@ -1,14 +1,210 @@
 # file_handler.py
+import codecs
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import heapq
 import os
 from pathlib import Path
-from typing import List, Optional, Set
+import re
+import shutil
+from stat import S_ISREG
+import subprocess
+import threading
+from typing import Any, Callable, Deque, Dict, Iterable, Iterator, List, NamedTuple, Optional, Set, Tuple
 import sys
 
+from progress import (
+    CancellationToken, GenerationCancelled, ProgressCallback, ProgressInfo,
+    SCAN_REPORT_EVERY, check_cancelled, report_progress,
+)
+from defaults import FILE_ORDERS, SELECTION_SORTS
+from index_cache import IndexCache, get_default_cache
+from outline import SECTION_SEPARATOR
+
+# Directorios en curso por hilo en el recorrido paralelo (acota la cola de trabajo)
+SCAN_TASKS_PER_WORKER = 4
+# Segundos máximos para "git ls-files" antes de recurrir al recorrido del disco
+GIT_LS_FILES_TIMEOUT = 60
+
+
+def _walk_files_parallel(
+    root: Path,
+    workers: int,
+    cancel_token: Optional[CancellationToken] = None,
+    follow_symlinks: bool = False,
+) -> Iterator[Path]:
+    """Rutas de archivos de _walk_entries_parallel (sin stat)."""
+    return (file_path for file_path, _ in _walk_entries_parallel(root, workers, cancel_token, follow_symlinks))
+
+def _walk_entries_parallel(
+    root: Path,
+    workers: int,
+    cancel_token: Optional[CancellationToken] = None,
+    follow_symlinks: bool = False,
+    with_stat: bool = False,
+) -> Iterator[Tuple[Path, Optional[os.stat_result]]]:
+    """
+    Recorre root con os.scandir en varios hilos: cada directorio es una tarea y
+    sus subdirectorios se encolan como tareas nuevas. Como mucho hay
+    workers * SCAN_TASKS_PER_WORKER directorios en curso; el resto espera en la
+    cola. Útil en sistemas de archivos de red, donde cada listado es lento y el
+    tiempo se va en esperas, no en CPU.
+
+    Cada directorio se visita una sola vez por (dispositivo, inodo), lo que evita
+    ciclos de enlaces simbólicos o puntos de unión. Igual que Path.rglob, no entra
+    en directorios enlazados salvo con follow_symlinks=True.
+
+    Con with_stat=True, el stat de cada archivo se toma de su DirEntry dentro
+    del hilo que lista el directorio (en Windows viene gratis con el listado),
+    para que --max-files no repita un stat por archivo en el hilo principal.
+
+    Yields:
+        Tuplas (ruta, stat o None) de archivos (en orden arbitrario: el llamador
+        debe ordenar).
+    """
+    visited: Set[Tuple[int, int]] = set()
+    visited_lock = threading.Lock()
+
+    def scan_directory(directory: str) -> Tuple[List[Tuple[str, Optional[os.stat_result]]], List[str]]:
+        try:
+            st = os.stat(directory)
+            with visited_lock:
+                key = (st.st_dev, st.st_ino)
+                if key in visited: return [], [] # Ciclo o directorio ya visitado por otro camino
+                visited.add(key)
+            files: List[Tuple[str, Optional[os.stat_result]]] = []; subdirectories: List[str] = []
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=follow_symlinks): subdirectories.append(entry.path)
+                        elif entry.is_file(): files.append((entry.path, entry.stat() if with_stat else None))
+                    except OSError: continue
+            return files, subdirectories
+        except PermissionError: print(f"Advertencia: Permiso denegado en {directory}.", file=sys.stderr)
+        except OSError as e: print(f"Advertencia: No se pudo listar {directory}: {e}", file=sys.stderr)
+        return [], []
+
+    pending: Deque[str] = deque([str(root)])
+    max_in_flight = workers * SCAN_TASKS_PER_WORKER
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="scan") as executor:
+        in_flight = set()
+        try:
+            while pending or in_flight:
+                check_cancelled(cancel_token)
+                while pending and len(in_flight) < max_in_flight:
+                    in_flight.add(executor.submit(scan_directory, pending.popleft()))
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    files, subdirectories = future.result()
+                    pending.extend(subdirectories)
+                    for file_path, st in files: yield Path(file_path), st
+        finally:
+            for future in in_flight: future.cancel()
+
+def _list_git_files(vault_path: Path, pathspecs: List[str], include_untracked: bool = False) -> Optional[List[Path]]:
+    """
+    Lista los archivos de una bóveda versionada desde el índice de git
+    (git ls-files), sin recorrer el disco ni hacer stat de cada archivo: git
+    detecta los borrados con la información de stat que guarda en su índice.
+    Respeta .gitignore. Los archivos borrados del disco pero aún en el índice
+    se descartan, y los enlaces simbólicos cuentan solo si apuntan a un archivo
+    (como en el recorrido). include_untracked añade los no versionados (y no
+    ignorados).
+
+    Solo se usa si la bóveda es la raíz del repositorio (git rev-parse
+    --show-toplevel): en una subcarpeta de otro repositorio, o con la bóveda
+    dentro de un repositorio que la ignora, git no lista lo mismo que el disco.
+
+    Returns:
+        Rutas de archivos (vault_path / relativa, en orden arbitrario), o None si
+        la bóveda no es la raíz de un repositorio git, no hay archivos
+        versionados bajo los targets, git no está disponible o falla (el
+        llamador recorre el disco).
+    """
+    if shutil.which('git') is None: return None
+    try:
+        toplevel = subprocess.run(['git', '-C', str(vault_path), 'rev-parse', '--show-toplevel'], capture_output=True, timeout=GIT_LS_FILES_TIMEOUT)
+    except (OSError, subprocess.TimeoutExpired) as e:
+        print(f"Advertencia: git no disponible ({e}). Recorriendo el disco.", file=sys.stderr); return None
+    if toplevel.returncode != 0: print("Advertencia: la bóveda no está en un repositorio git. Recorriendo el disco.", file=sys.stderr); return None
+    if Path(os.fsdecode(toplevel.stdout.strip())).resolve() != vault_path.resolve():
+        print("Advertencia: la bóveda no es la raíz de su repositorio git. Recorriendo el disco.", file=sys.stderr); return None
+    # -t etiqueta cada entrada ('R' = borrada del disco, que aparece también como 'H'; '?' = no versionada)
+    # y -s añade el modo, que distingue archivos, enlaces y submódulos sin hacer stat
+    command = ['git', '--literal-pathspecs', '-C', str(vault_path), 'ls-files', '-z', '-t', '-s', '--cached', '--deleted']
+    if include_untracked: command += ['--others', '--exclude-standard']
+    try:
+        result = subprocess.run(command + ['--', *pathspecs], capture_output=True, timeout=GIT_LS_FILES_TIMEOUT)
+    except (OSError, subprocess.TimeoutExpired) as e:
+        print(f"Advertencia: git ls-files no disponible ({e}). Recorriendo el disco.", file=sys.stderr); return None
+    if result.returncode != 0:
+        error = result.stderr.decode('utf-8', errors='replace').strip().splitlines()
+        print(f"Advertencia: git ls-files falló ({error[0] if error else result.returncode}). Recorriendo el disco.", file=sys.stderr); return None
+    files: Set[str] = set(); deleted: Set[str] = set(); to_check: Set[str] = set(); tracked = False
+    for entry in result.stdout.split(b'\0'):
+        if not entry: continue
+        tag, _, rest = entry.partition(b' ')
+        if tag == b'?':
+            if not rest.endswith(b'/'): to_check.add(os.fsdecode(rest)) # "carpeta/" = repositorio anidado
+            continue
+        mode, _, relative = rest.partition(b'\t'); tracked = True
+        if tag == b'R': deleted.add(os.fsdecode(relative))
+        elif mode.startswith(b'100'): files.add(os.fsdecode(relative)) # 100644/100755: archivo regular
+        elif mode.startswith(b'120'): to_check.add(os.fsdecode(relative)) # Enlace: cuenta si apunta a un archivo
+        # 160000 = submódulo: su contenido no está en este índice
+    if not tracked: print("Advertencia: ningún archivo versionado en git bajo los targets. Recorriendo el disco.", file=sys.stderr); return None
+    files.update(relative for relative in to_check if (vault_path / relative).is_file())
+    # Ya ordenadas por componentes (como Path): el sort posterior solo confirma el orden
+    return [vault_path / relative for relative in sorted(files - deleted, key=lambda relative: relative.split('/'))]
+
+def _selection_key(vault_path: Path, sort: str) -> Callable[[Path, Optional[os.stat_result]], Tuple[Any, ...]]:
+    """
+    Clave de --max-files: los archivos con la clave menor se seleccionan.
+    'mtime' = modificados más recientemente, 'size' = más grandes, 'name' =
+    primeros por ruta relativa (la ruta también desempata, para que la
+    selección no dependa del orden del recorrido). Usa el stat que traiga el
+    recorrido y solo hace os.stat si no lo hay.
+
+    Raises:
+        ValueError: Si sort no es uno de SELECTION_SORTS.
+    """
+    if sort not in SELECTION_SORTS:
+        raise ValueError(f"Criterio de selección inválido '{sort}' (opciones: {', '.join(SELECTION_SORTS)})")
+    def key(file_path: Path, st: Optional[os.stat_result] = None) -> Tuple[Any, ...]:
+        try: relative = file_path.relative_to(vault_path).as_posix()
+        except ValueError: relative = file_path.as_posix()
+        if sort == 'name': return (relative,)
+        if st is None:
+            try: st = os.stat(file_path)
+            except OSError: return (0, relative) # Ilegible: al final
+        return (-(st.st_mtime_ns if sort == 'mtime' else st.st_size), relative)
+    return key
+
+def select_top_files(file_paths: Iterable[Path], vault_path: Path, max_files: int, sort: str = 'mtime') -> List[Path]:
+    """
+    Los max_files primeros archivos según sort (ver _selection_key), en orden
+    alfabético. file_paths puede ser un iterador: se consume con un montículo
+    acotado (heapq.nsmallest), así que la memoria es O(max_files).
+    """
+    return _select_top_entries(((file_path, None) for file_path in file_paths), vault_path, max_files, sort)
+
+def _select_top_entries(entries: Iterable[Tuple[Path, Optional[os.stat_result]]], vault_path: Path, max_files: int, sort: str) -> List[Path]:
+    """Como select_top_files, con el stat del recorrido junto a cada ruta (o None)."""
+    key = _selection_key(vault_path, sort)
+    return sorted(file_path for file_path, _ in heapq.nsmallest(max_files, entries, key=lambda entry: key(*entry)))
+
 def find_relevant_files(
     vault_path: Path,
     target_paths: List[str],
     extensions: List[str],
     excluded_extensions: List[str] = [], # <<< PARÁMETRO AÑADIDO >>>
+    progress_callback: Optional[ProgressCallback] = None,
+    cancel_token: Optional[CancellationToken] = None,
+    scan_workers: Optional[int] = None,
+    use_git_index: bool = False,
+    git_untracked: bool = False,
+    max_files: Optional[int] = None,
+    selection_sort: str = 'mtime',
 ) -> List[Path]:
     """
     Encuentra archivos dentro de la bóveda que coincidan con las extensiones
@@ -20,11 +216,30 @@ def find_relevant_files(
                       Vacía para buscar en toda la bóveda.
         extensions: Lista de extensiones a incluir (ej: ['.md', '.txt']).
         excluded_extensions: Lista de extensiones a excluir (ej: ['.log', '.tmp']).
+        progress_callback: (Opcional) Recibe un ProgressInfo(stage='scan') cada
+                           SCAN_REPORT_EVERY archivos recorridos y al terminar.
+        cancel_token: (Opcional) Se comprueba entre archivos; si se cancela se
+                      lanza GenerationCancelled.
+        scan_workers: (Opcional) Con 2 o más, recorre los directorios en paralelo
+                      (ver _walk_files_parallel). El resultado es el mismo.
+        use_git_index: Si la bóveda es la raíz de un repositorio git, los
+                       candidatos salen de git ls-files en lugar de recorrer el
+                       disco (ver _list_git_files): solo archivos versionados y
+                       no ignorados. Sin git, o sin archivos versionados, se
+                       recorre el disco.
+        git_untracked: Con el índice de git, incluye también los archivos no
+                       versionados (no ignorados por .gitignore).
+        max_files: (Opcional) Devuelve solo los max_files primeros según
+                   selection_sort ('mtime' = más recientes, 'size' = más
+                   grandes, 'name' = primeros por ruta). Se eligen durante el
+                   recorrido con un montículo acotado: la memoria es O(max_files)
+                   y solo los elegidos se leen después.
 
     Returns:
         Una lista ordenada de objetos Path apuntando a los archivos relevantes.
     """
     relevant_files: List[Path] = []
+    if max_files is not None: _selection_key(vault_path, selection_sort) # Valida el criterio antes de recorrer
     # Normalizar extensiones incluidas
     normalized_extensions = {f".{ext.lower().lstrip('.')}" for ext in extensions if ext}
     # Normalizar extensiones excluidas
@@ -41,6 +256,7 @@ def find_relevant_files(
     if not is_vault_search:
         vault_path_resolved = vault_path.resolve()
         for target in target_paths:
+             if not (vault_path / target).exists(): target = split_line_range(target)[0] # "archivo.py:120-260": el rango lo aplica split_section_targets
              try:
                  abs_target = (vault_path / target).resolve()
                  abs_target.relative_to(vault_path_resolved)
@@ -59,45 +275,392 @@ def find_relevant_files(
     else: print("En toda la bóveda.", file=sys.stderr)
 
     files_processed_count = 0
-    try:
-        for item in vault_path.rglob('*'):
-            if item.is_file():
-                files_processed_count += 1
-                item_suffix_lower = item.suffix.lower()
-
-                # <<< Comprobar INCLUSIÓN Y EXCLUSIÓN >>>
-                passes_inclusion = not normalized_extensions or item_suffix_lower in normalized_extensions
-                passes_exclusion = item_suffix_lower not in normalized_excluded_extensions # <<< LÓGICA AQUÍ >>>
-
-                if passes_inclusion and passes_exclusion: # <<< AMBAS DEBEN CUMPLIRSE >>>
-                    # Comprobar si está en los targets (si aplica)
-                    if is_vault_search:
-                        relevant_files.append(item)
-                    else:
-                        try:
-                            item_resolved = item.resolve()
-                            is_relevant = False
-                            for target in resolved_target_paths:
-                                if item_resolved == target or \
-                                   (target.is_dir() and item_resolved.is_relative_to(target)):
-                                     is_relevant = True
-                                     break
-                            if is_relevant:
-                                relevant_files.append(item)
-                        except Exception as e: print(f"Advertencia: Error procesando ruta {item}: {e}", file=sys.stderr)
+    progress = ProgressInfo(stage='scan')
+    # En repositorios git, git ls-files (limitado a los targets) sustituye al recorrido
+    git_files = _list_git_files(vault_path, [] if is_vault_search else [os.path.relpath(target, vault_path.resolve()) for target in resolved_target_paths], git_untracked) if use_git_index else None
+    parallel_scan = git_files is None and scan_workers is not None and scan_workers > 1
+    if git_files is not None: print(f"Listado desde el índice de git ({len(git_files)} archivos{', con no versionados' if git_untracked else ''}).", file=sys.stderr)
+    elif parallel_scan: print(f"Recorrido paralelo de directorios ({scan_workers} hilos).", file=sys.stderr)
+    matched_count = 0
+    def iter_relevant_files() -> Iterator[Tuple[Path, Optional[os.stat_result]]]:
+        nonlocal files_processed_count, matched_count
+        if git_files is not None: items = ((item, None) for item in git_files) # Sin stat: --max-files lo hace solo para los coincidentes
+        elif parallel_scan: items = _walk_entries_parallel(vault_path, scan_workers, cancel_token, with_stat=max_files is not None and selection_sort != 'name')
+        else: items = ((item, None) for item in vault_path.rglob('*'))
+        for item, st in items:
+            check_cancelled(cancel_token)
+            if not parallel_scan and git_files is None: # rglob: el mismo stat descarta directorios y sirve de clave a --max-files
+                try: st = os.stat(item)
+                except (OSError, ValueError): continue
+                if not S_ISREG(st.st_mode): continue
+            files_processed_count += 1
+            if files_processed_count % SCAN_REPORT_EVERY == 0:
+                progress.files_scanned = files_processed_count
+                progress.files_matched = matched_count
+                progress.current_path = item
+                report_progress(progress_callback, progress)
+            item_suffix_lower = item.suffix.lower()
 
+            # <<< Comprobar INCLUSIÓN Y EXCLUSIÓN >>>
+            passes_inclusion = not normalized_extensions or item_suffix_lower in normalized_extensions
+            passes_exclusion = item_suffix_lower not in normalized_excluded_extensions # <<< LÓGICA AQUÍ >>>
+
+            if passes_inclusion and passes_exclusion: # <<< AMBAS DEBEN CUMPLIRSE >>>
+                # Comprobar si está en los targets (si aplica)
+                if is_vault_search:
+                    matched_count += 1; yield item, st
+                else:
+                    try:
+                        item_resolved = item.resolve()
+                        is_relevant = False
+                        for target in resolved_target_paths:
+                            if item_resolved == target or \
+                               (target.is_dir() and item_resolved.is_relative_to(target)):
+                                 is_relevant = True
+                                 break
+                        if is_relevant:
+                            matched_count += 1; yield item, st
+                    except Exception as e: print(f"Advertencia: Error procesando ruta {item}: {e}", file=sys.stderr)
+
+    try:
+        if max_files is None:
+            for item, _ in iter_relevant_files(): relevant_files.append(item)
+        else:
+            # Montículo acotado: solo se guardan max_files candidatos mientras dura el recorrido
+            relevant_files = _select_top_entries(iter_relevant_files(), vault_path, max_files, selection_sort)
+            print(f"Selección --max-files: {len(relevant_files)} de {matched_count} archivos (por {selection_sort}).", file=sys.stderr)
+    except GenerationCancelled: raise
     except PermissionError: print(f"Error: Permiso denegado en {vault_path}.", file=sys.stderr)
     except Exception as e: print(f"Error inesperado buscando archivos: {e}", file=sys.stderr)
 
     relevant_files.sort()
+    progress.files_scanned = files_processed_count
+    progress.files_matched = len(relevant_files)
+    progress.current_path = None
+    report_progress(progress_callback, progress)
     print(f"Archivos procesados: {files_processed_count}", file=sys.stderr)
     print(f"Archivos relevantes encontrados: {len(relevant_files)}", file=sys.stderr)
     return relevant_files
 
+def split_section_targets(vault_path: Path, target_paths: List[str]) -> Tuple[List[str], Dict[str, List[str]]]:
+    """
+    Separa los targets de sección ("nota.md#Encabezado", "nota.md#Padre#Hijo")
+    y de rango de líneas ("archivo.py:120-260", "archivo.py:120-").
+
+    Un target que existe tal cual en la bóveda se trata como ruta normal aunque
+    contenga '#' o ':'. Si no existe, se separa el rango final o se parte en el
+    primer '#' y, si la parte de la ruta es un archivo, se considera target
+    parcial.
+
+    Returns:
+        Tupla (targets_de_búsqueda, secciones). targets_de_búsqueda incluye la
+        ruta de cada archivo con secciones (para que find_relevant_files lo
+        encuentre); secciones mapea la ruta relativa (posix) a los encabezados
+        o rangos pedidos, en orden. Los rangos se guardan con el separador
+        delante (":120-260", ver parse_line_range).
+    """
+    search_targets: List[str] = []
+    sections: Dict[str, List[str]] = {}
+    for target in target_paths:
+        path_part, line_range = split_line_range(target)
+        if line_range is not None and (vault_path / path_part).is_file() and not (vault_path / target).exists():
+            try:
+                key = (vault_path / path_part).resolve().relative_to(vault_path.resolve()).as_posix()
+                search_targets.append(path_part)
+                sections.setdefault(key, []).append(LINE_RANGE_SEPARATOR + str(line_range)); continue
+            except ValueError:
+                search_targets.append(target); continue
+        if SECTION_SEPARATOR not in target or (vault_path / target).exists():
+            search_targets.append(target); continue
+        path_part, section_spec = target.split(SECTION_SEPARATOR, 1)
+        file_path = vault_path / path_part
+        if not section_spec.strip() or not file_path.is_file():
+            search_targets.append(target); continue # find_relevant_files avisará si no es válido
+        try:
+            key = file_path.resolve().relative_to(vault_path.resolve()).as_posix()
+        except ValueError:
+            search_targets.append(target); continue
+        search_targets.append(path_part)
+        sections.setdefault(key, []).append(section_spec)
+    return search_targets, sections
+
+def order_files(file_paths: List[Path], vault_path: Path, order: str = 'name') -> List[Path]:
+    """
+    Ordena los archivos para el bloque de contenido. 'name' conserva el orden
+    alfabético de find_relevant_files. 'stable' pone primero los archivos que
+    llevan más tiempo sin modificarse y al final los editados recientemente
+    (desempate por ruta relativa), para que el inicio del prompt se repita
+    entre ejecuciones y aproveche la caché de prefijos del proveedor del LLM.
+
+    Raises:
+        ValueError: Si el orden no es uno de FILE_ORDERS.
+    """
+    if order not in FILE_ORDERS:
+        raise ValueError(f"Orden de archivos inválido '{order}' (opciones: {', '.join(FILE_ORDERS)})")
+    if order == 'name':
+        return file_paths
+    keyed: List[Tuple[int, str, Path]] = []
+    for file_path in file_paths:
+        try: mtime_ns = os.stat(file_path).st_mtime_ns
+        except OSError: mtime_ns = 0
+        try: relative = file_path.relative_to(vault_path).as_posix()
+        except ValueError: relative = file_path.as_posix()
+        keyed.append((mtime_ns, relative, file_path))
+    keyed.sort(key=lambda item: (item[0], item[1]))
+    return [file_path for _, _, file_path in keyed]
+
 def read_file_content(file_path: Path) -> Optional[str]:
     """Lee contenido de archivo (UTF-8 con fallback latin-1)."""
     try: return file_path.read_text(encoding='utf-8')
     except UnicodeDecodeError:
         try: return file_path.read_text(encoding='latin-1')
         except Exception as e: print(f"Error leyendo {file_path.name} con latin-1: {e}", file=sys.stderr); return None
-    except Exception as e: print(f"Error leyendo {file_path}: {e}", file=sys.stderr); return None
\ No newline at end of file
+    except Exception as e: print(f"Error leyendo {file_path}: {e}", file=sys.stderr); return None
+
+# --- Lectura parcial (cabeza/cola) para archivos gigantes ---
+
+SAMPLE_CHUNK_SIZE = 64 * 1024
+
+class FileSample(NamedTuple):
+    """Resultado de read_file_sampled. Si no hubo recorte, tail es None y head es el archivo completo."""
+    head: str
+    tail: Optional[str] = None
+    tail_start_line: int = 0   # Número (1-based) de la primera línea de tail
+    elided_lines: int = 0      # Líneas omitidas entre head y tail
+    elided_bytes: int = 0      # Bytes omitidos entre head y tail
+
+
+def _decode_bytes(data: bytes) -> str:
+    """Decodifica bytes como UTF-8 con fallback latin-1 (mismo criterio que read_file_content)."""
+    try: return data.decode('utf-8')
+    except UnicodeDecodeError: return data.decode('latin-1')
+
+
+def _decode_cut(data: bytes, cut_start: bool = False, cut_end: bool = False) -> str:
+    """
+    Como _decode_bytes para un trozo cortado a mitad de línea: descarta solo el
+    carácter UTF-8 partido en el borde cortado (bytes de continuación al inicio,
+    secuencia incompleta al final) en lugar de caer a latin-1 por él.
+    """
+    try: return data.decode('utf-8')
+    except UnicodeDecodeError: pass
+    trimmed = data
+    if cut_start:
+        skip = 0
+        while skip < min(3, len(trimmed)) and 0x80 <= trimmed[skip] <= 0xBF: skip += 1
+        trimmed = trimmed[skip:]
+    try:
+        if cut_end: return codecs.getincrementaldecoder('utf-8')().decode(trimmed, final=False)
+        return trimmed.decode('utf-8')
+    except UnicodeDecodeError: return data.decode('latin-1')
+
+
+def _read_head(f, byte_budget: Optional[int], line_budget: Optional[int]) -> bytes:
+    """Lee desde el inicio hasta agotar el presupuesto de bytes o de líneas; corta en un fin de línea si es posible."""
+    chunks: List[bytes] = []; read_bytes = 0; newlines = 0
+    while True:
+        size = SAMPLE_CHUNK_SIZE if byte_budget is None else min(SAMPLE_CHUNK_SIZE, byte_budget - read_bytes)
+        if size <= 0: break
+        chunk = f.read(size)
+        if not chunk: break
+        if line_budget is not None and newlines + chunk.count(b'\n') >= line_budget:
+            # Cortar justo después del salto de línea número line_budget
+            cut = -1
+            for _ in range(line_budget - newlines): cut = chunk.index(b'\n', cut + 1)
+            chunks.append(chunk[:cut + 1]); read_bytes += cut + 1
+            break
+        chunks.append(chunk); read_bytes += len(chunk); newlines += chunk.count(b'\n')
+    head = b"".join(chunks)
+    last_newline = head.rfind(b'\n')
+    return head[:last_newline + 1] if last_newline != -1 else head
+
+
+def _read_tail(f, file_size: int, start_limit: int, byte_budget: Optional[int], line_budget: Optional[int]) -> bytes:
+    """Lee hacia atrás desde el final (sin pasar de start_limit) hasta agotar el presupuesto; empieza tras un fin de línea si es posible."""
+    if byte_budget == 0 or line_budget == 0: return b""
+    chunks: List[bytes] = []; position = file_size; read_bytes = 0; newlines = 0
+    # El salto final del archivo no inicia una línea nueva; se necesitan line_budget + 1 saltos para acotar line_budget líneas
+    needed_newlines = None if line_budget is None else line_budget + 1
+    while position > start_limit:
+        size = min(SAMPLE_CHUNK_SIZE, position - start_limit)
+        if byte_budget is not None: size = min(size, byte_budget - read_bytes)
+        if size <= 0: break
+        position -= size; f.seek(position)
+        chunk = f.read(size)
+        chunks.append(chunk); read_bytes += len(chunk); newlines += chunk.count(b'\n')
+        if needed_newlines is not None and newlines >= needed_newlines: break
+    tail = b"".join(reversed(chunks))
+    if line_budget is not None:
+        # Conservar solo las últimas line_budget líneas
+        cut = len(tail) - 1 if tail.endswith(b'\n') else len(tail)
+        for _ in range(line_budget):
+            cut = tail.rfind(b'\n', 0, cut)
+            if cut == -1: break
+        if cut != -1: return tail[cut + 1:]
+    if position <= start_limit: return tail # Se alcanzó la cabeza: el corte ya está alineado
+    first_newline = tail.find(b'\n')
+    return tail[first_newline + 1:] if first_newline != -1 and first_newline + 1 < len(tail) else tail
+
+
+def _count_newlines(f, start: int, end: int) -> int:
+    """Cuenta saltos de línea en [start, end) por bloques binarios, sin decodificar ni conservar el contenido."""
+    f.seek(start); remaining = end - start; count = 0
+    buffer = bytearray(min(SAMPLE_CHUNK_SIZE * 16, max(remaining, 1))); view = memoryview(buffer)
+    while remaining > 0:
+        n = f.readinto(view[:min(len(buffer), remaining)])
+        if not n: break
+        count += buffer.count(b'\n', 0, n)
+        remaining -= n
+    return count
+
+
+def read_file_sampled(file_path: Path, max_bytes: Optional[int] = None, max_lines: Optional[int] = None) -> Optional[FileSample]:
+    """
+    Lee un archivo respetando límites de tamaño. Si supera max_bytes o max_lines,
+    solo carga la cabeza y la cola (entre las dos, como mucho el presupuesto)
+    mediante seek, sin decodificar la parte intermedia; de ésta solo se cuentan
+    los saltos de línea para que la numeración de la cola sea la original.
+    Si un corte cae a mitad de línea (una línea más larga que el presupuesto),
+    el trozo se marca con '…' en el lado cortado.
+
+    Returns:
+        FileSample, o None si hubo un error de lectura (ya impreso en stderr).
+    """
+    if max_bytes is None and max_lines is None:
+        content = read_file_content(file_path)
+        return FileSample(head=content) if content is not None else None
+    try:
+        file_size = file_path.stat().st_size
+        if max_bytes is not None and file_size <= max_bytes: max_bytes = None # Solo puede sobrar por líneas
+        if max_lines is None and max_bytes is None:
+            content = read_file_content(file_path)
+            return FileSample(head=content) if content is not None else None
+
+        head_bytes = tail_bytes = head_lines = tail_lines = None
+        # La cabeza se queda con la mitad redondeada hacia arriba: head + tail nunca supera el límite
+        if max_bytes is not None: head_bytes = max((max_bytes + 1) // 2, 1); tail_bytes = max(max_bytes - head_bytes, 0)
+        if max_lines is not None: head_lines = max((max_lines + 1) // 2, 1); tail_lines = max(max_lines - head_lines, 0)
+
+        with open(file_path, 'rb') as f:
+            head = _read_head(f, head_bytes, head_lines)
+            head_end = len(head)
+            tail = _read_tail(f, file_size, head_end, tail_bytes, tail_lines)
+            tail_start = file_size - len(tail)
+            if tail_start <= head_end:
+                # No hay nada que omitir: el archivo cabe dentro de los límites
+                return FileSample(head=_decode_bytes(head + tail))
+            elided_newlines = _count_newlines(f, head_end, tail_start)
+            # ¿Los cortes caen a mitad de línea? (la cabeza no acaba en salto, o la cola no empieza tras uno)
+            head_cut = not head.endswith(b'\n')
+            f.seek(tail_start - 1)
+            tail_cut = bool(tail) and f.read(1) != b'\n'
+            last_line_open = False
+            if not tail:
+                f.seek(file_size - 1)
+                last_line_open = f.read(1) != b'\n'
+        # Líneas completas omitidas: el primer salto omitido cierra la línea cortada de la cabeza,
+        # y la última línea sin salto final cuenta si no hay cola que la muestre
+        head_line_count = head.count(b'\n') + head_cut
+        elided_lines = max(elided_newlines - head_cut, 0) + (last_line_open and (elided_newlines > 0 or not head_cut))
+        tail_start_line = head_line_count + elided_lines + 1 if elided_newlines or not head_cut else head_line_count
+        head_text = _decode_cut(head, cut_end=head_cut) + ("…" if head_cut and head else "")
+        tail_text = ("…" if tail_cut else "") + _decode_cut(tail, cut_start=tail_cut)
+        return FileSample(
+            head=head_text,
+            tail=tail_text,
+            tail_start_line=tail_start_line,
+            elided_lines=elided_lines,
+            elided_bytes=tail_start - head_end,
+        )
+    except Exception as e: print(f"Error leyendo {file_path}: {e}", file=sys.stderr); return None
+
+
+# --- Rangos de líneas ("archivo.py:120-260") ---
+
+# Separador entre la ruta y el rango en targets; en section_targets el rango se guarda como ":120-260"
+LINE_RANGE_SEPARATOR = ":"
+_LINE_RANGE_RE = re.compile(r'(\d+)(?:-(\d*))?')
+# El índice de offsets guarda el byte donde empieza cada LINE_INDEX_STRIDE líneas
+LINE_INDEX_STRIDE = 256
+LINE_INDEX_NAMESPACE = "line-offsets-v1"
+
+
+class LineRange(NamedTuple):
+    """Rango de líneas (1-based, inclusivo) de un target 'archivo:120-260'."""
+    first: int
+    last: Optional[int] # None = hasta el final del archivo
+
+    def __str__(self) -> str:
+        if self.last == self.first: return str(self.first)
+        return f"{self.first}-{self.last if self.last is not None else ''}"
+
+
+def parse_line_range(text: str) -> Optional[LineRange]:
+    """'120-260', '120' (solo esa línea) o '120-' (hasta el final). None si no es un rango válido."""
+    match = _LINE_RANGE_RE.fullmatch(text.strip())
+    if not match: return None
+    first = int(match.group(1))
+    last = first if match.group(2) is None else (int(match.group(2)) if match.group(2) else None)
+    if first < 1 or (last is not None and last < first): return None
+    return LineRange(first, last)
+
+
+def split_line_range(target: str) -> Tuple[str, Optional[LineRange]]:
+    """Separa 'ruta:120-260' en ('ruta', LineRange(120, 260)); sin rango válido devuelve (target, None)."""
+    path_part, separator, range_part = target.rpartition(LINE_RANGE_SEPARATOR)
+    line_range = parse_line_range(range_part) if separator and path_part else None
+    return (path_part, line_range) if line_range is not None else (target, None)
+
+
+def _seek_line(f, offset: int, line: int, target_line: int, checkpoints: List[int]) -> Tuple[int, int]:
+    """
+    Avanza en binario desde `offset` (inicio de la línea `line`) hasta el inicio
+    de target_line, añadiendo a checkpoints los puntos de control que pase.
+
+    Returns:
+        (offset, línea) alcanzados; la línea es menor que target_line si el
+        archivo termina antes.
+    """
+    f.seek(offset)
+    while line < target_line:
+        chunk = f.read(SAMPLE_CHUNK_SIZE)
+        if not chunk: break
+        position = 0
+        while line < target_line:
+            newline = chunk.find(b'\n', position)
+            if newline == -1: break
+            position = newline + 1; line += 1
+            if line == len(checkpoints) * LINE_INDEX_STRIDE + 1: checkpoints.append(offset + position)
+        if line == target_line: return offset + position, line
+        offset += len(chunk)
+    return offset, line
+
+
+def read_line_range(file_path: Path, line_range: LineRange, cache: Optional[IndexCache] = None) -> Optional[str]:
+    """
+    Lee solo las líneas de line_range. Salta con seek al punto de control más
+    cercano de un índice de offsets (uno cada LINE_INDEX_STRIDE líneas,
+    guardado en la caché por versión del archivo) y avanza en binario hasta el
+    rango; solo se decodifica el rango. Cada lectura amplía el índice hasta
+    donde llegó, así que las siguientes sobre el mismo archivo apenas recorren.
+
+    Returns:
+        El texto del rango ("" si empieza después del final del archivo), o
+        None si hubo un error de lectura (ya impreso en stderr).
+    """
+    cache = cache or get_default_cache()
+    try:
+        st = os.stat(file_path)
+        checkpoints: List[int] = cache.get(LINE_INDEX_NAMESPACE, file_path, st) or [0]
+        known_checkpoints = len(checkpoints)
+        index = min((line_range.first - 1) // LINE_INDEX_STRIDE, known_checkpoints - 1)
+        with open(file_path, 'rb') as f:
+            start, line = _seek_line(f, checkpoints[index], index * LINE_INDEX_STRIDE + 1, line_range.first, checkpoints)
+            if line < line_range.first: data = b""
+            elif line_range.last is None: f.seek(start); data = f.read()
+            else:
+                end, _ = _seek_line(f, start, line, line_range.last + 1, checkpoints)
+                f.seek(start); data = f.read(end - start)
+        if len(checkpoints) > known_checkpoints: cache.put(LINE_INDEX_NAMESPACE, file_path, checkpoints, st)
+        return _decode_bytes(data)
+    except Exception as e: print(f"Error leyendo {file_path}: {e}", file=sys.stderr); return None
@@ -1,26 +1,20 @@
 # formatter.py
 from pathlib import Path
-from typing import Optional, List
+import re
+import threading
+from typing import BinaryIO, Dict, Optional, List, Tuple
 import sys
 
 # Reutilizamos la función de lectura de file_handler
-from file_handler import read_file_content
+from file_handler import LINE_RANGE_SEPARATOR, LineRange, read_file_sampled, read_line_range
+from outline import get_outline, read_section
+from transclusion import Transcluder
 
 # Constante para los separadores
 SEPARATOR = "-" * 80 # Ajusta la longitud si lo deseas
 
-def format_file_content(file_path: Path, vault_path: Path) -> Optional[str]:
-    """
-    Lee el contenido de un archivo, lo formatea con números de línea y encabezado/pie.
-
-    Args:
-        file_path: Ruta absoluta al archivo.
-        vault_path: Ruta absoluta a la raíz de la bóveda.
-
-    Returns:
-        Un string con el contenido formateado, o un mensaje de error formateado si hubo
-        un error de lectura. Devuelve None solo si ocurre un error catastrófico aquí.
-    """
+def _display_path(file_path: Path, vault_path: Path, root_label: Optional[str] = None) -> str:
+    """Ruta relativa (posix) usada en el encabezado del bloque, con root_label opcional."""
     # Intentar obtener ruta relativa para el encabezado
     try:
         relative_path = file_path.relative_to(vault_path).as_posix()
@@ -34,29 +28,308 @@ def format_file_content(file_path: Path, vault_path: Path) -> Optional[str]:
         print(f"Advertencia: Error inesperado al calcular ruta relativa para {file_path.name}: {e}", file=sys.stderr)
 
 
+    if root_label: relative_path = f"{root_label}/{relative_path}"
+    return relative_path
+
+
+def format_file_content(
+    file_path: Path,
+    vault_path: Path,
+    root_label: Optional[str] = None,
+    max_file_bytes: Optional[int] = None,
+    max_file_lines: Optional[int] = None,
+    transcluder: Optional[Transcluder] = None,
+    line_range: Optional[LineRange] = None,
+) -> Optional[str]:
+    """
+    Lee el contenido de un archivo, lo formatea con números de línea y encabezado/pie.
+
+    Args:
+        file_path: Ruta absoluta al archivo.
+        vault_path: Ruta absoluta a la raíz de la bóveda.
+        root_label: (Opcional) Prefijo para la ruta del encabezado (ej: nombre de
+                    la bóveda en generación multi-bóveda).
+        max_file_bytes / max_file_lines: (Opcional) Límites por archivo. Si se
+                    superan, solo se incluyen cabeza y cola, con una marca del
+                    rango omitido y la numeración original.
+        transcluder: (Opcional) Expande las incrustaciones ![[nota]]: su
+                    contenido se inserta tras la línea, marcado con '>'.
+        line_range: (Opcional) Solo esas líneas (target "archivo:120-260"),
+                    leídas con seek (ver read_line_range) y numeradas con su
+                    número original. Ignora max_file_bytes/max_file_lines.
+
+    Returns:
+        Un string con el contenido formateado, o un mensaje de error formateado si hubo
+        un error de lectura. Devuelve None solo si ocurre un error catastrófico aquí.
+    """
+    relative_path = _display_path(file_path, vault_path, root_label)
+
     header = f"\n{SEPARATOR}\n/{relative_path}:\n{SEPARATOR}\n"
     footer = f"{SEPARATOR}" # Solo una línea al final
 
-    content = read_file_content(file_path)
-    if content is None:
-        # read_file_content ya imprimió el error, devolvemos un bloque indicando el fallo
+    if line_range is not None:
+        header = f"\n{SEPARATOR}\n/{relative_path}{LINE_RANGE_SEPARATOR}{line_range}:\n{SEPARATOR}\n"
+        text = read_line_range(file_path, line_range)
+        if text is None: return f"{header} *** Error al leer el contenido del archivo ***\n{footer}\n"
+        lines = text.splitlines()
+        if not lines: return f"{header} (Rango fuera del archivo)\n{footer}\n"
+        width = max(len(str(line_range.first + len(lines) - 1)), 3)
+        return header + "\n".join(_number_lines(lines, line_range.first, width, transcluder, file_path)) + "\n" + footer + "\n"
+
+    sample = read_file_sampled(file_path, max_bytes=max_file_bytes, max_lines=max_file_lines)
+    if sample is None:
+        # read_file_sampled ya imprimió el error, devolvemos un bloque indicando el fallo
         return f"{header} *** Error al leer el contenido del archivo ***\n{footer}\n"
 
-    lines = content.splitlines()
-    if not lines:
+    lines = sample.head.splitlines()
+    tail_lines = sample.tail.splitlines() if sample.tail is not None else []
+    if not lines and not tail_lines:
         return f"{header} (Archivo vacío)\n{footer}\n"
 
-    # Calcular padding basado en el número total de líneas
+    # Calcular padding basado en el número total de líneas (incluidas las omitidas)
     # Asegurar un mínimo de ancho por si acaso (ej. 3)
-    max_line_num = len(lines)
+    max_line_num = sample.tail_start_line + len(tail_lines) - 1 if sample.tail is not None else len(lines)
     max_line_num_width = max(len(str(max_line_num)), 3)
 
+    formatted_lines = _number_lines(lines, 1, max_line_num_width, transcluder, file_path)
+    if sample.tail is not None:
+        # Marcar el rango omitido; la cola conserva sus números de línea originales
+        first_elided = len(lines) + 1
+        last_elided = sample.tail_start_line - 1
+        if last_elided >= first_elided:
+            omitted = f"líneas {first_elided}-{last_elided} omitidas ({sample.elided_lines} líneas, {sample.elided_bytes} bytes)"
+        else:
+            omitted = f"{sample.elided_bytes} bytes omitidos" # El corte cae dentro de una misma línea
+        formatted_lines.append(f"{'⋮'.rjust(max_line_num_width)} | … [{omitted}] …")
+        formatted_lines.extend(_number_lines(tail_lines, sample.tail_start_line, max_line_num_width, transcluder, file_path))
+
+    # Unir todo con saltos de línea consistentes
+    return header + "\n".join(formatted_lines) + "\n" + footer + "\n"
+
+
+def _number_lines(
+    lines: List[str],
+    first_line_number: int,
+    width: int,
+    transcluder: Optional[Transcluder] = None,
+    source: Optional[Path] = None,
+    section: Optional[str] = None,
+) -> List[str]:
+    """
+    Antepone a cada línea su número (alineado a width) y el separador ' | '.
+    Con transcluder, tras cada línea con incrustaciones se insertan las líneas
+    expandidas, con '>' en lugar del número.
+    """
     formatted_lines: List[str] = []
-    for i, line in enumerate(lines):
-        line_num_str = str(i + 1).rjust(max_line_num_width)
+    embed_marker = '>'.rjust(width)
+    for i, line in enumerate(lines, start=first_line_number):
+        line_num_str = str(i).rjust(width)
         # Evitar añadir espacios extra si la línea está vacía
         formatted_line = f"{line_num_str} | {line}" if line.strip() else f"{line_num_str} |"
         formatted_lines.append(formatted_line)
+        if transcluder is not None and '![[' in line:
+            formatted_lines.extend(f"{embed_marker} | {embedded}" if embedded.strip() else f"{embed_marker} |" for embedded in transcluder.expand_line(line, source, section))
+    return formatted_lines
 
-    # Unir todo con saltos de línea consistentes
-    return header + "\n".join(formatted_lines) + "\n" + footer + "\n"
\ No newline at end of file
+
+
+# --- Ruta rápida sobre bytes (UTF-8) ---
+# Produce exactamente la misma salida que format_file_content, pero trabaja sobre
+# bytes: separa líneas con split() en C y escribe prefijos + líneas directamente
+# en el buffer de salida, sin crear strings Python por línea ni re-codificar.
+
+# Secuencias que str.splitlines()/str.strip() tratan como salto de línea o espacio
+# y bytes.split(b'\n') no: si aparecen, se usa la ruta basada en str.
+_FAST_PATH_BLOCKERS_ASCII = (b'\x0b', b'\x0c', b'\x1c', b'\x1d', b'\x1e', b'\x1f')
+# Las multibyte se agrupan por byte inicial: memchr descarta el caso común antes de usar la regex
+_FAST_PATH_BLOCKERS_UTF8 = (
+    (b'\xc2', re.compile(rb'\xc2[\x85\xa0]')),                                    # U+0085, U+00A0
+    (b'\xe1', re.compile(rb'\xe1\x9a\x80')),                                       # U+1680
+    (b'\xe2', re.compile(rb'\xe2(?:\x80[\x80-\x8a\xa8\xa9\xaf]|\x81\x9f)')),          # U+2000-200A, 2028, 2029, 202F, 205F
+    (b'\xe3', re.compile(rb'\xe3\x80\x80')),                                       # U+3000
+)
+# Tamaño de bloque al leer un archivo con --max-file-lines (se deja de leer en cuanto sobra una línea)
+LINE_LIMIT_CHUNK_SIZE = 1024 * 1024
+
+# Prefijos "\n  N | " / "\n  N |" ya construidos, por ancho; se comparten entre archivos.
+# Llevan el salto de línea delante para poder intercalarlos con las líneas sin copias extra.
+_PREFIX_CACHE_MAX_LINES = 1_000_000
+_prefix_cache: Dict[int, Tuple[List[bytes], List[bytes]]] = {}
+_prefix_cache_lock = threading.Lock()
+
+
+def _line_prefixes(width: int, count: int) -> Tuple[List[bytes], List[bytes]]:
+    """Devuelve (prefijos_con_contenido, prefijos_vacíos) para al menos `count` líneas."""
+    with _prefix_cache_lock:
+        full, bare = _prefix_cache.get(width, ([], []))
+        if len(full) < count:
+            new_full = [b"\n%*d | " % (width, i) for i in range(len(full) + 1, count + 1)]
+            if count > _PREFIX_CACHE_MAX_LINES: # Demasiado grande para cachear
+                return full + new_full, bare + [prefix[:-1] for prefix in new_full]
+            full = full + new_full
+            bare = bare + [prefix[:-1] for prefix in new_full]
+            _prefix_cache[width] = (full, bare)
+        return full, bare
+
+
+def _is_fast_path_eligible(data: bytes) -> bool:
+    """True si data es UTF-8 válido y bytes.split(b'\\n') equivale a str.splitlines() para él."""
+    if not data.isascii():
+        try: data.decode('utf-8')
+        except UnicodeDecodeError: return False # Necesita fallback latin-1
+        for lead_byte, pattern in _FAST_PATH_BLOCKERS_UTF8:
+            if lead_byte in data and pattern.search(data): return False
+    if any(blocker in data for blocker in _FAST_PATH_BLOCKERS_ASCII): return False
+    if b'\r' in data and data.count(b'\r') != data.count(b'\r\n'): return False # '\r' suelto
+    return True
+
+
+def _read_within_lines(file_path: Path, max_lines: int) -> Optional[bytes]:
+    """
+    Lee el archivo por bloques contando saltos de línea y devuelve su contenido
+    si tiene como mucho max_lines líneas; si tiene más, deja de leer en cuanto
+    lo sabe y devuelve None (el archivo grande se muestrea, no se carga entero).
+    """
+    chunks: List[bytes] = []; newlines = 0
+    with open(file_path, 'rb') as f:
+        while True:
+            chunk = f.read(LINE_LIMIT_CHUNK_SIZE)
+            if not chunk: break
+            newlines += chunk.count(b'\n')
+            if newlines > max_lines: return None
+            chunks.append(chunk)
+    if newlines == max_lines and chunks and not chunks[-1].endswith(b'\n'): return None # Una línea más, sin salto final
+    return b"".join(chunks)
+
+
+def write_file_content(
+    out: BinaryIO,
+    file_path: Path,
+    vault_path: Path,
+    root_label: Optional[str] = None,
+    max_file_bytes: Optional[int] = None,
+    max_file_lines: Optional[int] = None,
+    transcluder: Optional[Transcluder] = None,
+) -> int:
+    """
+    Escribe en `out` (BytesIO o archivo binario) el bloque formateado de un
+    archivo, en UTF-8 y con la misma forma que format_file_content.
+
+    Para archivos UTF-8 dentro de los límites usa la ruta rápida sobre bytes;
+    si el archivo necesita re-codificación (latin-1), contiene separadores de
+    línea especiales, supera max_file_bytes/max_file_lines o tiene
+    incrustaciones que expandir (transcluder), delega en format_file_content.
+    En notas grandes la ruta rápida formatea unas 2 veces más deprisa (ver
+    tests/test_formatter.py); el resto del coste ya son llamadas en C.
+
+    Returns:
+        Número de bytes escritos.
+    """
+    data: Optional[bytes] = None
+    try:
+        if max_file_bytes is None or file_path.stat().st_size <= max_file_bytes:
+            data = file_path.read_bytes() if max_file_lines is None else _read_within_lines(file_path, max_file_lines)
+    except Exception:
+        data = None # format_file_content informará del error de lectura
+    if data is not None and transcluder is not None and b'![[' in data:
+        data = None
+    if data is None or not _is_fast_path_eligible(data):
+        formatted = format_file_content(file_path, vault_path, root_label, max_file_bytes, max_file_lines, transcluder)
+        encoded = formatted.encode('utf-8') if formatted else b""
+        out.write(encoded)
+        return len(encoded)
+
+    relative_path = _display_path(file_path, vault_path, root_label)
+    header = f"\n{SEPARATOR}\n/{relative_path}:\n{SEPARATOR}".encode('utf-8') # El "\n" final lo aporta cada prefijo
+    footer = f"\n{SEPARATOR}\n".encode('utf-8')
+
+    if b'\r' in data: data = data.replace(b'\r\n', b'\n')
+    lines = data.split(b'\n')
+    if lines and lines[-1] == b'': lines.pop() # Igual que splitlines(): sin línea vacía final
+    if b' \n' in data or b'\t\n' in data or data[-1:] in (b' ', b'\t'):
+        # Puede haber líneas solo con espacios/tabs: str.strip() las considera vacías ("N |")
+        lines = [line if line.strip() else b'' for line in lines]
+    if not lines:
+        block = header + "\n (Archivo vacío)".encode('utf-8') + footer
+        out.write(block)
+        return len(block)
+
+    width = max(len(str(len(lines))), 3)
+    full_prefixes, bare_prefixes = _line_prefixes(width, len(lines))
+    # Intercalar prefijo/línea por asignación de slices (en C) y escribir la lista tal cual
+    parts: List[Optional[bytes]] = [None] * (2 * len(lines))
+    parts[0::2] = [full if line else bare for full, bare, line in zip(full_prefixes, bare_prefixes, lines)]
+    parts[1::2] = lines
+
+    start = out.tell()
+    out.write(header)
+    out.writelines(parts)
+    out.write(footer)
+    return out.tell() - start
+
+
+# --- Esquema de encabezados y secciones ---
+
+def format_file_outline(file_path: Path, vault_path: Path, root_label: Optional[str] = None) -> str:
+    """
+    Formatea el esquema de encabezados de un archivo (modo 'outline'): una línea
+    por encabezado, con su número de línea original. Usa la caché de esquemas,
+    por lo que un archivo sin cambios no se vuelve a leer.
+    """
+    relative_path = _display_path(file_path, vault_path, root_label)
+    header = f"\n{SEPARATOR}\n/{relative_path}:\n{SEPARATOR}\n"
+    footer = f"{SEPARATOR}"
+
+    file_outline = get_outline(file_path)
+    if file_outline is None:
+        return f"{header} *** Error al leer el contenido del archivo ***\n{footer}\n"
+    headings, _ = file_outline
+    if not headings:
+        return f"{header} (Sin encabezados)\n{footer}\n"
+
+    width = max(len(str(headings[-1].line)), 3)
+    formatted_lines = [f"{str(h.line).rjust(width)} | {'#' * h.level} {h.title}" for h in headings]
+    return header + "\n".join(formatted_lines) + "\n" + footer + "\n"
+
+
+def format_file_section(file_path: Path, vault_path: Path, section_spec: str, root_label: Optional[str] = None, transcluder: Optional[Transcluder] = None) -> str:
+    """
+    Formatea solo una sección de un archivo (target "nota.md#Encabezado"),
+    leyendo únicamente sus bytes y conservando la numeración original.
+    """
+    relative_path = _display_path(file_path, vault_path, root_label)
+    header = f"\n{SEPARATOR}\n/{relative_path}#{section_spec}:\n{SEPARATOR}\n"
+    footer = f"{SEPARATOR}"
+
+    section = read_section(file_path, section_spec)
+    if section is None:
+        print(f"Advertencia: Sección '{section_spec}' no encontrada en {file_path.name}.", file=sys.stderr)
+        return f"{header} *** Sección no encontrada ***\n{footer}\n"
+    text, first_line = section
+    lines = text.splitlines()
+    width = max(len(str(first_line + len(lines) - 1)), 3)
+    return header + "\n".join(_number_lines(lines, first_line, width, transcluder, file_path, section_spec)) + "\n" + footer + "\n"
+
+
+def format_extracted_content(file_path: Path, vault_path: Path, text: Optional[str], root_label: Optional[str] = None) -> str:
+    """Formatea el texto obtenido por un extractor (ver extractors) como un bloque numerado más."""
+    relative_path = _display_path(file_path, vault_path, root_label)
+    header = f"\n{SEPARATOR}\n/{relative_path}:\n{SEPARATOR}\n"
+    footer = f"{SEPARATOR}"
+    if text is None:
+        return f"{header} *** No se pudo extraer el texto del archivo ***\n{footer}\n"
+    lines = text.splitlines()
+    if not lines:
+        return f"{header} (Archivo vacío)\n{footer}\n"
+    width = max(len(str(len(lines))), 3)
+    return header + "\n".join(_number_lines(lines, 1, width)) + "\n" + footer + "\n"
+
+
+def format_near_duplicates(groups: List[Tuple[Path, List[Path]]], vault_path: Path, root_label: Optional[str] = None) -> str:
+    """Bloque que lista los casi-duplicados omitidos, junto al archivo que sí se incluyó."""
+    formatted_lines = []
+    for representative, duplicates in groups:
+        formatted_lines.append(f"/{_display_path(representative, vault_path, root_label)} (incluido)")
+        formatted_lines.extend(f"  ≈ /{_display_path(duplicate, vault_path, root_label)}" for duplicate in duplicates)
+    return (f"\n{SEPARATOR}\nCasi-duplicados omitidos (solo se incluyó un archivo por grupo):\n{SEPARATOR}\n"
+            + "\n".join(formatted_lines) + "\n" + SEPARATOR + "\n")
@@ -2,6 +2,9 @@
 import streamlit as st
 from pathlib import Path
 import sys
+import shutil
+import tempfile
+import time
 import traceback
 from typing import Optional, Dict, Any, List, Set, Tuple
 
@@ -9,6 +12,25 @@ from typing import Optional, Dict, Any, List, Set, Tuple
 import prompt_handler
 import config_handler
 import core
+from defaults import DEFAULT_EXTENSIONS, DEFAULT_NEAR_DUPLICATE_THRESHOLD
+from progress import CancellationToken, GenerationCancelled, ProgressInfo
+import tag_index
+import dir_index
+import file_handler
+import prompt_prefix
+import prompt_preview
+import redaction
+import transclusion
+
+# El prompt generado se guarda en disco (no en la página); la vista previa muestra una página de bloques
+RESULTS_DIR = Path(tempfile.gettempdir()) / "obsidian_context_builder"
+# Prompts sin tocar desde hace más de esto se consideran de sesiones abandonadas
+RESULTS_MAX_AGE_SECONDS = 24 * 60 * 60
+PREVIEW_BLOCKS_PER_PAGE = 20
+PREVIEW_BLOCK_BYTES = 32 * 1024
+PREVIEW_LARGEST_BLOCKS = 10
+# Entradas máximas que el explorador muestra por directorio
+BROWSER_MAX_ENTRIES = 200
 
 # <<< MODIFICADO: Importar lógica central y constantes DESDE core.py >>>
 try:
@@ -17,7 +39,6 @@ try:
         generate_prompt_core,
         DEFAULT_PLACEHOLDERS, # Aunque no se use directamente, puede ser útil para debug/futuro
         generate_hierarchical_tags, # Ídem
-        DEFAULT_EXTENSIONS
     )
 except ImportError as e:
     st.error(f"Error crítico al importar desde core: {e}. Asegúrate que core.py existe.")
@@ -47,15 +68,153 @@ def validate_and_get_targets(target_input_str: str, vault_path: Path) -> Tuple[L
     vault_path_resolved = vault_path.resolve()
     for raw_target in raw_targets:
         try:
-            target_path = Path(raw_target)
+            section_suffix = ""; range_path, line_range = file_handler.split_line_range(raw_target)
+            if line_range is not None and not Path(raw_target).exists() and not (vault_path_resolved / raw_target).exists():
+                raw_path = range_path; section_suffix = file_handler.LINE_RANGE_SEPARATOR + str(line_range) # Target de rango: "archivo.py:120-260"
+            elif '#' in raw_target and not (vault_path_resolved / raw_target).exists():
+                raw_path, section = raw_target.split('#', 1); section_suffix = '#' + section # Target de sección: "nota.md#Encabezado"
+            else: raw_path = raw_target
+            target_path = Path(raw_path)
             if not target_path.is_absolute(): abs_path = (vault_path_resolved / target_path).resolve()
             else: abs_path = target_path.resolve()
-            if abs_path.exists() and abs_path.is_relative_to(vault_path_resolved):
-                 valid_relative_targets.append(abs_path.relative_to(vault_path_resolved).as_posix())
+            if abs_path.exists() and abs_path.is_relative_to(vault_path_resolved) and (not section_suffix or abs_path.is_file()):
+                 valid_relative_targets.append(abs_path.relative_to(vault_path_resolved).as_posix() + section_suffix)
             else: invalid_targets.append(raw_target)
         except Exception as e: invalid_targets.append(raw_target); print(f"Error validando target '{raw_target}': {e}", file=sys.stderr)
     return valid_relative_targets, invalid_targets
 
+def make_progress_callback(progress_bar, min_interval: float = 0.1):
+    """Crea un callback que refleja el ProgressInfo de core en una barra st.progress (limitando la frecuencia de refresco)."""
+    last_update = [0.0]
+    def callback(info: ProgressInfo):
+        now = time.monotonic()
+        is_final = info.current_path is None or (info.stage == 'format' and info.files_formatted == info.files_total)
+        if not is_final and now - last_update[0] < min_interval: return
+        last_update[0] = now
+        if info.stage == 'scan':
+            progress_bar.progress(0.0, text=f"🔎 Buscando... {info.files_scanned} archivos recorridos, {info.files_matched} coincidencias")
+        else:
+            fraction = info.files_formatted / info.files_total if info.files_total else 1.0
+            progress_bar.progress(min(fraction, 1.0), text=f"📝 Formateando {info.files_formatted}/{info.files_total} ({info.bytes_so_far / 1024:.1f} KiB)")
+    return callback
+
+def cancel_generation():
+    token = st.session_state.get('cancel_token')
+    if token is not None: token.cancel()
+
+def discard_prompt_results():
+    """Borra del disco los prompts de la generación anterior de esta sesión."""
+    for result in st.session_state.pop('prompt_results', None) or []: Path(result['path']).unlink(missing_ok=True)
+    st.session_state.pop('radio_prompt_result', None); st.session_state.pop('input_preview_page', None); reset_prompt_download()
+
+def prune_stale_results(max_age: float = RESULTS_MAX_AGE_SECONDS):
+    """
+    Borra de RESULTS_DIR los prompts con más de max_age segundos. Streamlit no
+    avisa cuando una sesión se abandona (pestaña cerrada), así que sus archivos
+    se limpian al iniciar la siguiente sesión.
+    """
+    cutoff = time.time() - max_age; removed = 0
+    for path in RESULTS_DIR.glob("prompt_*.txt"): # Sin RESULTS_DIR no hay nada que borrar
+        try:
+            if path.stat().st_mtime < cutoff: path.unlink(); removed += 1
+        except OSError: continue # Borrado por otra sesión o sin permisos
+    if removed: print(f"Borrados {removed} prompts antiguos de {RESULTS_DIR}.", file=sys.stderr)
+
+def prepare_prompt_download(path: str):
+    st.session_state.download_ready_path = path
+
+def reset_prompt_download():
+    st.session_state.pop('download_ready_path', None)
+
+def render_prompt_results(results: List[Dict[str, Any]]):
+    """Con varias plantillas (mismo contexto), elige cuál de los prompts se muestra."""
+    if len(results) > 1:
+        names = [result['name'] for result in results]
+        selected_name = st.radio("Prompt a mostrar", names, format_func=lambda name: f"📄 {name.split(': ', 1)[-1]}", horizontal=True, key='radio_prompt_result')
+        render_prompt_result(results[names.index(selected_name)])
+    else: render_prompt_result(results[0])
+
+def render_prompt_result(result: Dict[str, Any]):
+    """
+    Muestra el prompt guardado en disco: estadísticas, los bloques más grandes y
+    una página de bloques por archivo (cada uno recortado a PREVIEW_BLOCK_BYTES).
+    Solo se lee y envía al navegador la página visible, así que volver a
+    ejecutar la página no reenvía el prompt completo; el archivo entero solo se
+    lee al pulsar "Preparar descarga".
+    """
+    prompt_path = Path(result['path'])
+    if not prompt_path.exists(): st.warning("El prompt generado ya no está disponible. Vuelve a generarlo."); return
+    blocks: List[prompt_preview.PromptBlock] = result['blocks']; prompt_size = result['size']
+    st.subheader("Resultado")
+    col_size, col_blocks, col_tokens = st.columns(3)
+    col_size.metric("Tamaño", f"{prompt_size / 1024:,.1f} KB" if prompt_size < 1024 * 1024 else f"{prompt_size / 1024 / 1024:,.1f} MB")
+    col_blocks.metric("Bloques de archivo", sum(1 for b in blocks if b.label not in (prompt_preview.PREAMBLE_LABEL, prompt_preview.EPILOGUE_LABEL)))
+    col_tokens.metric("Tokens (aprox.)", f"{prompt_size // core.BYTES_PER_TOKEN:,}")
+    # El archivo solo se lee (y se envía al navegador) en la ejecución en que se pide la descarga
+    if st.session_state.get('download_ready_path') == result['path']:
+        st.download_button("⬇️ Descargar prompt", data=prompt_path.read_bytes(), file_name=result['file_name'], mime="text/plain", key='download_prompt_result', on_click=reset_prompt_download)
+    else: st.button("📦 Preparar descarga", key='button_prepare_download', on_click=prepare_prompt_download, args=(result['path'],))
+    if len(blocks) > 1:
+        with st.expander("📊 Bloques más grandes"):
+            largest = sorted(blocks, key=lambda b: b.size, reverse=True)[:PREVIEW_LARGEST_BLOCKS]
+            st.table([{"Bloque": b.label, "KB": round(b.size / 1024, 1), "% del prompt": round(100 * b.size / prompt_size, 1)} for b in largest])
+
+    label_filter = st.text_input("Filtrar bloques por ruta", key='input_preview_filter', placeholder="Proyectos/").strip().lower()
+    visible_blocks = [b for b in blocks if label_filter in b.label.lower()] if label_filter else blocks
+    page_count = max(1, -(-len(visible_blocks) // PREVIEW_BLOCKS_PER_PAGE))
+    page = int(st.number_input(f"Página (de {page_count})", min_value=1, max_value=page_count, value=1, step=1, key='input_preview_page')) if page_count > 1 else 1
+    first = (min(page, page_count) - 1) * PREVIEW_BLOCKS_PER_PAGE
+    for block in visible_blocks[first:first + PREVIEW_BLOCKS_PER_PAGE]:
+        with st.expander(f"{block.label} · {block.size / 1024:,.1f} KB"):
+            text, truncated = prompt_preview.read_block(prompt_path, block, PREVIEW_BLOCK_BYTES)
+            st.code(text, language=None)
+            if truncated: st.caption(f"Mostrando los primeros {PREVIEW_BLOCK_BYTES // 1024} KB del bloque. Descarga el prompt para obtenerlo completo.")
+    if not visible_blocks: st.caption("Ningún bloque coincide con el filtro.")
+
+
+# --- Explorador de directorios (carga perezosa: solo se listan las carpetas expandidas) ---
+def get_current_vault_path() -> Optional[Path]:
+    """Ruta de la bóveda seleccionada en la barra lateral, o None si no es un directorio válido."""
+    if st.session_state.get('vault_selection_mode') == "Manual": path_str = st.session_state.get('manual_vault_path', '').strip().strip('"')
+    else: path_str = st.session_state.get('saved_vaults', {}).get(st.session_state.get('selected_vault_name'), '')
+    if not path_str: return None
+    try: vault_path = Path(path_str).resolve()
+    except OSError: return None
+    return vault_path if vault_path.is_dir() else None
+
+def toggle_browser_dir(relative_path: str):
+    expanded: Set[str] = st.session_state.browser_expanded
+    if relative_path in expanded: expanded.discard(relative_path)
+    else: expanded.add(relative_path)
+
+def toggle_browser_selection(relative_path: str):
+    if st.session_state.get(f"browser_select_{relative_path}"): st.session_state.browser_selected.add(relative_path)
+    else: st.session_state.browser_selected.discard(relative_path)
+
+def clear_browser_selection():
+    for relative_path in st.session_state.browser_selected: st.session_state.pop(f"browser_select_{relative_path}", None)
+    st.session_state.browser_selected = set()
+
+def render_directory_browser(vault_path: Path, relative_dir: str = "", depth: int = 0):
+    """Muestra un nivel del árbol; las subcarpetas solo se listan al expandirlas."""
+    extensions = st.session_state.get('input_extensions_main', " ".join(DEFAULT_EXTENSIONS)).split()
+    excluded_extensions = st.session_state.get('input_excluded_extensions_main', "").split()
+    subtree_totals = st.session_state.get('check_browser_subtree_totals', False)
+    entries = dir_index.list_directory(vault_path, relative_dir, extensions or DEFAULT_EXTENSIONS, excluded_extensions, subtree_totals=subtree_totals)
+    indent = "\u2003" * depth
+    for entry in entries[:BROWSER_MAX_ENTRIES]:
+        col_toggle, col_entry = st.columns([1, 12])
+        if entry.is_dir:
+            expanded = entry.relative_path in st.session_state.browser_expanded
+            col_toggle.button("▾" if expanded else "▸", key=f"browser_toggle_{entry.relative_path}", on_click=toggle_browser_dir, args=(entry.relative_path,))
+            subdirs = f", {entry.dir_count} carpetas" if entry.dir_count and not subtree_totals else ""
+            label = f"{indent}📁 {entry.name} ({entry.file_count} archivos{' en total' if subtree_totals else ''}, {entry.total_bytes / 1024:.1f} KiB{subdirs})"
+        else:
+            expanded = False; label = f"{indent}📄 {entry.name} ({entry.total_bytes / 1024:.1f} KiB)"
+        col_entry.checkbox(label, value=entry.relative_path in st.session_state.browser_selected, key=f"browser_select_{entry.relative_path}", on_change=toggle_browser_selection, args=(entry.relative_path,))
+        if expanded: render_directory_browser(vault_path, entry.relative_path, depth + 1)
+    if len(entries) > BROWSER_MAX_ENTRIES: st.caption(f"{indent}… {len(entries) - BROWSER_MAX_ENTRIES} entradas más (usa el área de rutas para seleccionarlas)")
+
 # --- Mapeo de Plantillas a Categorías ---
 TEMPLATE_CATEGORIES = { # ... (sin cambios) ...
     "AnalizarContenido": "🔍 Análisis", "ResumenConceptosClave": "🔍 Análisis", "ValidarRigorAcademico": "🔍 Análisis", "IdentificarNotasHuerfanas":"🔍 Análisis",
@@ -84,6 +243,7 @@ def get_categorized_templates(available_templates: Dict[str, str]) -> Tuple[List
 if 'config_loaded' not in st.session_state:
     # ... (código de inicialización sin cambios) ...
     print("--- Initializing Session State ---")
+    prune_stale_results()
     st.session_state.config = config_handler.load_config(); st.session_state.saved_vaults = config_handler.get_vaults()
     st.session_state.available_templates = prompt_handler.get_available_templates(); last_vault_info = config_handler.get_last_vault()
     st.session_state.last_vault_name = last_vault_info[0] if last_vault_info else None
@@ -102,6 +262,7 @@ if 'config_loaded' not in st.session_state:
             stem = default_template_key.split("Archivo: ", 1)[1]; st.session_state.selected_category = TEMPLATE_CATEGORIES.get(stem, DEFAULT_CATEGORY); st.session_state.selected_template_name = default_template_key
         elif sorted_categories : st.session_state.selected_category = sorted_categories[0]
     st.session_state.config_loaded = True; print("--- Session State Initialized ---")
+st.session_state.setdefault('browser_expanded', set()); st.session_state.setdefault('browser_selected', set()); st.session_state.setdefault('browser_vault', None)
 
 # --- Barra Lateral (Configuración Principal) ---
 with st.sidebar:
@@ -148,6 +309,7 @@ with st.sidebar:
     selected_template_key = display_to_key_map.get(selected_template_display)
     if selected_template_key and selected_template_key != st.session_state.get('selected_template_name'):
         st.session_state.selected_template_name = selected_template_key; st.rerun()
+    extra_template_names = st.multiselect( "Plantillas adicionales (mismo contexto)", options=sorted(st.session_state.available_templates), format_func=lambda key: f"📄 {key.split(': ', 1)[-1]}", key='ms_extra_templates', help="Se renderizan con el contexto de la plantilla principal, que se calcula una sola vez. Cada prompt se previsualiza, descarga y guarda por separado." )
     st.divider()
     st.subheader("Nota Objetivo")
     output_note_path_str = st.text_input( "Ruta Relativa (Opcional)", placeholder="Carpeta/NotaObjetivo.md", key='input_output_note_path', help="Ruta DENTRO de bóveda. Necesaria para {ruta_destino} y {etiqueta_jerarquica_N}." ).strip()
@@ -161,11 +323,50 @@ with st.sidebar:
 col1, col2 = st.columns(2)
 with col1:
     st.subheader("🎯 Rutas de Contexto (Targets)")
-    target_paths_input_str = st.text_area( "Pegar Rutas (1 por línea)", height=150, key='input_target_paths_manual', placeholder="Ejemplos:\nAsignaturas/Cálculo\nNotas Diarias/2024-01-15.md\n\n(Vacío = toda la bóveda)", help="Pega rutas relativas/absolutas." )
+    target_paths_input_str = st.text_area( "Pegar Rutas (1 por línea)", height=150, key='input_target_paths_manual', placeholder="Ejemplos:\nAsignaturas/Cálculo\nNotas Diarias/2024-01-15.md\nProyectos/Plan.md#Objetivos\nscripts/main.py:120-260\n\n(Vacío = toda la bóveda)", help="Pega rutas relativas/absolutas. 'nota.md#Encabezado' incluye solo esa sección; 'archivo.py:120-260' solo esas líneas." )
+    with st.expander("📂 Explorar bóveda (seleccionar targets)"):
+        browser_vault_path = get_current_vault_path()
+        if browser_vault_path != st.session_state.browser_vault: # Otra bóveda: descartar el estado del árbol
+            clear_browser_selection(); st.session_state.browser_expanded = set(); st.session_state.browser_vault = browser_vault_path
+        if browser_vault_path is None: st.info("Selecciona una bóveda válida para explorarla.")
+        else:
+            st.checkbox("Totales de subcarpetas completos", value=False, key='check_browser_subtree_totals', help="Cuenta archivos y tamaño de todo el subárbol de cada carpeta (recorre la bóveda). Sin marcar, solo su contenido directo.")
+            render_directory_browser(browser_vault_path)
+            col_selected, col_clear = st.columns([3, 1])
+            col_selected.caption(f"{len(st.session_state.browser_selected)} seleccionados (se suman a las rutas pegadas)")
+            col_clear.button("Limpiar selección", key='browser_clear_button', on_click=clear_browser_selection, disabled=not st.session_state.browser_selected)
     st.subheader("⚙️ Opciones de Generación")
     extensions_str = st.text_input( "Extensiones a INCLUIR", " ".join(DEFAULT_EXTENSIONS), key='input_extensions_main', help="Separar con espacio." )
     excluded_extensions_str = st.text_input( "Extensiones a EXCLUIR", "", key='input_excluded_extensions_main', placeholder=".log .tmp .bak", help="Separar con espacio." )
-    output_mode = st.selectbox( "Modo Contexto", ['both', 'tree', 'content'], index=0, key='select_output_mode_main', help="Qué incluir en {contexto_extraido}" )
+    col_tags, col_where = st.columns(2)
+    tag_filters_str = col_tags.text_input( "Solo notas con etiquetas", "", key='input_tag_filters', placeholder="fisica/mecanica examen", help="Separar con espacio. Deben cumplirse todas; incluye subetiquetas." )
+    where_filters_str = col_where.text_input( "Solo notas con propiedades", "", key='input_where_filters', placeholder="status=draft, curso=2024", help="clave=valor del frontmatter, separados por coma. Deben cumplirse todos." )
+    output_mode = st.selectbox( "Modo Contexto", ['both', 'tree', 'content', 'outline'], index=0, key='select_output_mode_main', help="Qué incluir en {contexto_extraido}. 'outline' = solo el esquema de encabezados de cada archivo." )
+    file_order = st.selectbox( "Orden del contenido", file_handler.FILE_ORDERS, index=0, key='select_file_order', help="'stable' = archivos menos modificados primero y recientes al final: el inicio del prompt se repite entre ejecuciones (caché de prefijos del LLM)." )
+    col_depth, col_collapse = st.columns(2)
+    tree_max_depth = col_depth.number_input( "Profundidad máx. árbol (0 = sin límite)", min_value=0, value=0, step=1, key='input_tree_max_depth', help="Niveles más profundos se resumen en una línea." )
+    tree_collapse = col_collapse.number_input( "Colapsar dirs con más de N entradas (0 = nunca)", min_value=0, value=0, step=10, key='input_tree_collapse', help="Evita árboles enormes en carpetas con miles de archivos." )
+    col_max_kb, col_max_lines = st.columns(2)
+    max_file_kb = col_max_kb.number_input( "Máx. KB por archivo (0 = sin límite)", min_value=0, value=0, step=64, key='input_max_file_kb', help="Archivos mayores: solo cabeza y cola." )
+    max_file_lines = col_max_lines.number_input( "Máx. líneas por archivo (0 = sin límite)", min_value=0, value=0, step=100, key='input_max_file_lines', help="Archivos mayores: solo cabeza y cola." )
+    col_dedupe, col_similarity = st.columns(2)
+    dedupe_enabled = col_dedupe.checkbox( "Omitir casi-duplicados", value=False, key='check_dedupe', help="Incluye una sola nota por grupo de notas casi idénticas y lista el resto." )
+    use_extractors = st.checkbox( "Extraer texto de canvas, Excalidraw, CSV y PDF", value=False, key='check_use_extractors', help="Canvas como esquema de nodos y conexiones, CSV como tabla truncada, PDF como texto (requiere pypdf). Añade sus extensiones arriba para incluirlos." )
+    col_embeds, col_embed_depth = st.columns(2)
+    expand_embeds = col_embeds.checkbox( "Expandir notas incrustadas (![[nota]])", value=False, key='check_expand_embeds', help="Inserta el contenido de cada nota o sección incrustada tras la línea que la incrusta (marcado con '>'). Las incrustaciones circulares se omiten." )
+    embed_depth = col_embed_depth.number_input( "Niveles de incrustación", min_value=1, max_value=10, value=transclusion.DEFAULT_TRANSCLUSION_DEPTH, step=1, key='input_embed_depth', disabled=not expand_embeds )
+    col_redact, col_redact_literals = st.columns(2)
+    redact_enabled = col_redact.checkbox( "Redactar secretos y datos personales", value=False, key='check_redact', help=f"Sustituye {', '.join(redaction.BUILTIN_PATTERNS)} y los patrones de la sección 'redaction' de la configuración por {redaction.REPLACEMENT.format(name='patrón')}." )
+    redact_literals_str = col_redact_literals.text_input( "Textos a redactar (separados por coma)", placeholder="Zafiro, Ana Pérez", key='input_redact_literals', disabled=not redact_enabled )
+    col_max_files, col_selection_sort = st.columns(2)
+    max_files = col_max_files.number_input( "Máx. archivos (0 = todos)", min_value=0, value=0, step=10, key='input_max_files', help="Incluye solo los N primeros según el criterio (ej: las N notas editadas más recientemente). Solo esos se leen." )
+    selection_sort = col_selection_sort.selectbox( "Criterio", options=list(file_handler.SELECTION_SORTS), format_func={'mtime': "Más recientes", 'size': "Más grandes", 'name': "Por nombre"}.get, key='select_selection_sort', disabled=not max_files )
+    col_git, col_git_untracked = st.columns(2)
+    use_git_index = col_git.checkbox( "Listar desde el índice de git", value=False, key='check_use_git_index', help="Si la bóveda es la raíz de un repositorio git, los archivos salen de 'git ls-files' (rápido, respeta .gitignore, solo versionados) en lugar de recorrer el disco. Sin git, o sin archivos versionados, se recorre el disco." )
+    git_untracked = col_git_untracked.checkbox( "Incluir no versionados", value=False, key='check_git_untracked', disabled=not use_git_index, help="Añade los archivos que git aún no sigue (salvo los ignorados)." )
+    scan_workers = st.number_input( "Hilos para recorrer directorios (0/1 = secuencial)", min_value=0, max_value=64, value=0, step=1, key='input_scan_workers', help="Acelera la búsqueda en unidades de red o sincronizadas, donde listar cada carpeta es lento." )
+    max_memory_mb = st.number_input( "Memoria máx. para el prompt en MB (0 = sin límite)", min_value=0, value=0, step=64, key='input_max_memory_mb', help="Por encima, el contenido se vuelca a un archivo temporal mientras se genera. El prompt final siempre se guarda en disco y se previsualiza por bloques." )
+    dedupe_threshold = col_similarity.slider( "Similitud mínima", min_value=0.5, max_value=1.0, value=DEFAULT_NEAR_DUPLICATE_THRESHOLD, step=0.05, key='slider_dedupe_threshold', disabled=not dedupe_enabled )
 with col2:
     st.subheader("📄 Previsualización y Salida")
     output_file_str = st.text_input( "Guardar Prompt en Archivo (opcional)", placeholder="/ruta/prompt.txt", key='input_output_file_main' ).strip()
@@ -181,7 +382,12 @@ vault_ready = False
 if st.session_state.vault_selection_mode == "Guardada": vault_ready = st.session_state.get('selected_vault_name') is not None
 elif st.session_state.vault_selection_mode == "Manual": vault_ready = st.session_state.get('manual_vault_path') != ""
 
-if st.button("🚀 Generar Prompt", type="primary", use_container_width=True, disabled=not vault_ready):
+col_generate, col_estimate, col_cancel = st.columns([4, 1, 1])
+generate_clicked = col_generate.button("🚀 Generar Prompt", type="primary", use_container_width=True, disabled=not vault_ready)
+estimate_clicked = col_estimate.button("📊 Estimar", use_container_width=True, disabled=not vault_ready, help="Archivos, bytes y tokens de la selección, sin leer ningún archivo.")
+col_cancel.button("⏹️ Cancelar", use_container_width=True, on_click=cancel_generation, key='cancel_generation_button')
+
+if generate_clicked or estimate_clicked:
     final_vault_name = None; vault_path: Optional[Path] = None; used_manual_path = False
     # [Validación de bóveda igual que antes]
     if st.session_state.vault_selection_mode == "Guardada":
@@ -195,20 +401,48 @@ if st.button("🚀 Generar Prompt", type="primary", use_container_width=True, di
         except: st.error(f"Ruta manual '{manual_path_str}' inválida"); st.stop()
         final_vault_name = f"(Ruta Manual: {vault_path.name})"; used_manual_path = True
 
-    final_template_name = st.session_state.get('selected_template_name'); assert final_template_name, "Plantilla no seleccionada"
+    final_template_name = st.session_state.get('selected_template_name'); assert final_template_name or estimate_clicked, "Plantilla no seleccionada"
     # output_note_path_str es opcional ahora
 
     try:
         valid_targets, invalid_targets = validate_and_get_targets(target_paths_input_str, vault_path)
         if invalid_targets: st.warning(f"Ignorando rutas inválidas: {[inv for inv in invalid_targets]}")
+        if st.session_state.browser_vault == vault_path: valid_targets = valid_targets + sorted(st.session_state.browser_selected - set(valid_targets)) # Ya son relativas y existentes
         if not valid_targets and target_paths_input_str.strip(): st.warning("⚠️ Usando toda la bóveda.")
         elif not valid_targets and not target_paths_input_str.strip(): st.info("ℹ️ Usando toda la bóveda.")
 
-        template_content = prompt_handler.load_template(final_template_name)
         input_extensions = [e.strip() for e in extensions_str.split() if e.strip()]
-        extensions = [f".{e.lstrip('.')}" for e in input_extensions] if input_extensions else core.DEFAULT_EXTENSIONS
+        extensions = [f".{e.lstrip('.')}" for e in input_extensions] if input_extensions else DEFAULT_EXTENSIONS
         input_excluded_extensions = [e.strip() for e in excluded_extensions_str.split() if e.strip()]
         excluded_extensions = [f".{e.lstrip('.')}" for e in input_excluded_extensions]
+        tag_filters = tag_filters_str.replace(',', ' ').split()
+        where_filters = [tag_index.parse_where(w) for w in where_filters_str.split(',') if w.strip()] # ValueError si el formato es inválido
+        redactor = redaction.Redactor.from_config(config_handler.get_redaction_config(), [l.strip() for l in redact_literals_str.split(',') if l.strip()]) if redact_enabled else None # ValueError si un patrón es inválido
+        generation_options = core.GenerationOptions(
+            excluded_extensions=excluded_extensions,
+            tree_max_depth=int(tree_max_depth) or None, tree_collapse_threshold=int(tree_collapse) or None,
+            max_file_bytes=int(max_file_kb) * 1024 or None, max_file_lines=int(max_file_lines) or None,
+            near_duplicate_threshold=dedupe_threshold if dedupe_enabled else None,
+            tag_filters=tag_filters, where_filters=where_filters, scan_workers=int(scan_workers) or None,
+            use_git_index=use_git_index, git_untracked=git_untracked, max_files=int(max_files) or None, selection_sort=selection_sort,
+            file_order=file_order, use_extractors=use_extractors, redactor=redactor,
+            transclusion_depth=int(embed_depth) if expand_embeds else None,
+        )
+
+        if estimate_clicked:
+            # Vista previa rápida: solo stat e índice, sin abrir archivos
+            with st.spinner("📊 Estimando..."):
+                estimate = core.estimate_selection(vault_path, valid_targets, extensions, output_mode, generation_options)
+            col_files, col_bytes, col_tokens = st.columns(3)
+            col_files.metric("Archivos", f"{estimate.files:,}"); col_bytes.metric("Tamaño total", f"{estimate.total_bytes / 1024 / 1024:.2f} MB"); col_tokens.metric("Tokens estimados", f"~{estimate.estimated_tokens:,}")
+            if estimate.unindexed_files: st.caption(f"{estimate.unindexed_files} notas sin indexar se contaron sin aplicar los filtros de etiquetas/propiedades.")
+            if estimate.largest_files:
+                st.caption("Archivos más grandes"); st.table([{"Ruta": path, "KB": round(size / 1024, 1)} for path, size in estimate.largest_files])
+            st.stop()
+
+        template_content = prompt_handler.load_template(final_template_name)
+        result_names = [final_template_name] + [name for name in extra_template_names if name != final_template_name]
+        extra_template_contents = [prompt_handler.load_template(name) for name in result_names[1:]]
 
         output_note_path_relative: Optional[Path] = None
         if output_note_path_str:
@@ -219,23 +453,50 @@ if st.button("🚀 Generar Prompt", type="primary", use_container_width=True, di
             except ValueError: st.error(f"Ruta destino '{output_note_path_str}' no en bóveda."); st.stop()
             except Exception as e: st.error(f"Error procesando ruta destino: {e}"); st.stop()
 
-        with st.spinner("⚙️ Generando contexto y prompt..."):
+        st.session_state.cancel_token = CancellationToken()
+        progress_bar = st.progress(0.0, text="⚙️ Generando contexto y prompt...")
+        discard_prompt_results()
+        RESULTS_DIR.mkdir(parents=True, exist_ok=True)
+        # Un archivo por plantilla; el contexto se calcula una vez y se renderiza en todas
+        prompt_files = [tempfile.NamedTemporaryFile(prefix="prompt_", suffix=".txt", dir=RESULTS_DIR, delete=False) for _ in result_names]
+        prompt_file = prompt_files[0]
+        prefix_writer = prompt_prefix.HashingWriter(prompt_file) if file_order == 'stable' else None
+        try:
             # <<< LLAMADA A core.py >>>
-            final_prompt = core.generate_prompt_core(
+            core.generate_prompt_core(
                  vault_path=vault_path, target_paths=valid_targets, extensions=extensions,
                  output_mode=output_mode, output_note_path=output_note_path_relative, # Puede ser None
-                 template_string=template_content, excluded_extensions=excluded_extensions
+                 template_string=template_content, options=generation_options,
+                 progress_callback=make_progress_callback(progress_bar), cancel_token=st.session_state.cancel_token,
+                 output_stream=prefix_writer or prompt_file, max_memory=int(max_memory_mb) * 1024 * 1024 or None,
+                 extra_templates=list(zip(extra_template_contents, prompt_files[1:]))
             )
+        except BaseException as e:
+            for f in prompt_files: f.close(); Path(f.name).unlink(missing_ok=True)
+            if not isinstance(e, GenerationCancelled): raise
+            progress_bar.empty(); st.warning("⏹️ Generación cancelada."); st.stop()
+        for f in prompt_files: f.close()
+        progress_bar.empty()
+        st.session_state.prompt_results = [
+            {'name': name, 'path': f.name, 'size': Path(f.name).stat().st_size, 'blocks': prompt_preview.index_prompt_file(Path(f.name)),
+             'file_name': prompt_handler.template_output_path(Path("prompt.txt"), name).name if len(result_names) > 1 else "prompt.txt"}
+            for name, f in zip(result_names, prompt_files)
+        ]
 
         st.success("✅ ¡Prompt generado!")
-        st.subheader("Resultado")
-        st.text_area("Prompt Final:", final_prompt, height=400, key="prompt_output_area_gui_result")
+        if file_order == 'stable':
+            prefix_key = prompt_prefix.run_key([vault_path], template_content)
+            prefix_report = prompt_prefix.compare_and_store(prefix_key, prefix_writer.fingerprint)
+            st.caption(f"♻️ {prompt_prefix.format_report(prefix_report)}")
+        if redactor is not None: st.caption(f"🔒 Redacciones: {redactor.summary()}")
 
         if output_file_str:
             try:
                 output_path = Path(output_file_str); output_path = (Path.cwd() / output_path).resolve() if not output_path.is_absolute() else output_path.resolve()
-                output_path.parent.mkdir(parents=True, exist_ok=True); output_path.write_text(final_prompt, encoding='utf-8')
-                st.success(f"💾 Prompt guardado en: `{output_path}`")
+                output_path.parent.mkdir(parents=True, exist_ok=True)
+                for result in st.session_state.prompt_results:
+                    result_output_path = prompt_handler.template_output_path(output_path, result['name']) if len(result_names) > 1 else output_path
+                    shutil.copyfile(result['path'], result_output_path); st.success(f"💾 Prompt guardado en: `{result_output_path}`")
             except Exception as e: st.error(f"❌ Error guardando archivo: {e}")
 
         if not used_manual_path and st.session_state.vault_selection_mode == "Guardada":
@@ -246,6 +507,9 @@ if st.button("🚀 Generar Prompt", type="primary", use_container_width=True, di
     except AssertionError as ae: st.error(f"❌ Error: {ae}")
     except Exception as e: st.error(f"❌ Error Inesperado:"); st.exception(e)
 
+# El resultado se dibuja desde el disco en cada ejecución de la página (también sin pulsar "Generar")
+if st.session_state.get('prompt_results'): render_prompt_results(st.session_state.prompt_results)
+
 
 # --- Sección de Gestión de Bóvedas ---
 # ... (código sin cambios) ...
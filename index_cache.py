@@ -0,0 +1,162 @@
+# index_cache.py
+import atexit
+import json
+import os
+from pathlib import Path
+import sqlite3
+import sys
+import threading
+from typing import Any, Dict, List, Optional
+
+# Nombre más específico para evitar conflictos (junto al archivo de configuración)
+CACHE_FILENAME = "obsidian_context_builder_cache.sqlite3"
+# Escrituras acumuladas antes de confirmar la transacción
+COMMIT_EVERY = 256
+
+
+def get_cache_path() -> Path:
+    """Determina la ruta del archivo de caché persistente (junto al script)."""
+    try:
+        script_dir = Path(__file__).parent.resolve()
+    except NameError:
+        # Fallback para ejecución interactiva o empaquetada
+        script_dir = Path.cwd()
+    return script_dir / CACHE_FILENAME
+
+
+class IndexCache:
+    """
+    Caché persistente (SQLite) de datos derivados de archivos de la bóveda:
+    esquemas de encabezados, índices, firmas... Cada entrada se guarda por
+    (namespace, ruta) junto con el mtime y tamaño del archivo, y solo se
+    devuelve si el archivo no ha cambiado desde entonces.
+
+    Si la base de datos no se puede abrir (ej: directorio de solo lectura), la
+    caché funciona en memoria durante la ejecución.
+    """
+    def __init__(self, db_path: Optional[Path] = None):
+        self.db_path = db_path or get_cache_path()
+        self._lock = threading.Lock()
+        self._pending_writes = 0
+        try:
+            self._conn = self._open(str(self.db_path))
+        except sqlite3.Error as e:
+            print(f"Advertencia: No se pudo abrir la caché {self.db_path} ({e}). Se usará caché en memoria.", file=sys.stderr)
+            self._conn = self._open(":memory:")
+
+    @staticmethod
+    def _open(database: str) -> sqlite3.Connection:
+        conn = sqlite3.connect(database, check_same_thread=False)
+        try: conn.execute("PRAGMA journal_mode=WAL"); conn.execute("PRAGMA synchronous=NORMAL")
+        except sqlite3.Error: pass
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " namespace TEXT NOT NULL, path TEXT NOT NULL,"
+            " mtime_ns INTEGER NOT NULL, size INTEGER NOT NULL, value TEXT NOT NULL,"
+            " PRIMARY KEY (namespace, path))"
+        )
+        conn.commit()
+        return conn
+
+    @staticmethod
+    def _key(file_path: Path) -> str:
+        return os.path.abspath(file_path)
+
+    def get(self, namespace: str, file_path: Path, stat_result: Optional[os.stat_result] = None) -> Optional[Any]:
+        """Devuelve el valor guardado si el archivo no cambió (mismo mtime y tamaño); si no, None."""
+        try:
+            st = stat_result or os.stat(file_path)
+        except OSError:
+            return None
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT mtime_ns, size, value FROM entries WHERE namespace = ? AND path = ?",
+                (namespace, self._key(file_path)),
+            ).fetchone()
+        if row is None or row[0] != st.st_mtime_ns or row[1] != st.st_size:
+            return None
+        return json.loads(row[2])
+
+    def get_many(self, namespace: str, file_paths: List[Path]) -> List[Optional[Any]]:
+        """Como get() para muchos archivos a la vez, con una sola consulta (para selecciones de miles de notas)."""
+        with self._lock:
+            rows = {
+                path: (mtime_ns, size, value)
+                for path, mtime_ns, size, value in self._conn.execute(
+                    "SELECT path, mtime_ns, size, value FROM entries WHERE namespace = ?", (namespace,)
+                )
+            }
+        results: List[Optional[Any]] = []
+        for file_path in file_paths:
+            row = rows.get(self._key(file_path))
+            try:
+                st = os.stat(file_path) if row is not None else None
+            except OSError:
+                st = None
+            results.append(json.loads(row[2]) if st is not None and row[0] == st.st_mtime_ns and row[1] == st.st_size else None)
+        return results
+
+    def put(self, namespace: str, file_path: Path, value: Any, stat_result: Optional[os.stat_result] = None):
+        """Guarda (o reemplaza) el valor asociado al estado actual del archivo."""
+        try:
+            st = stat_result or os.stat(file_path)
+        except OSError:
+            return
+        with self._lock:
+            try:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO entries (namespace, path, mtime_ns, size, value) VALUES (?, ?, ?, ?, ?)",
+                    (namespace, self._key(file_path), st.st_mtime_ns, st.st_size, json.dumps(value, ensure_ascii=False)),
+                )
+                self._count_write()
+            except sqlite3.Error as e:
+                print(f"Advertencia: No se pudo escribir en la caché ({e}).", file=sys.stderr)
+
+    def _count_write(self):
+        """Cuenta una escritura (con el lock tomado) y confirma la transacción cada COMMIT_EVERY."""
+        self._pending_writes += 1
+        if self._pending_writes >= COMMIT_EVERY:
+            self._conn.commit(); self._pending_writes = 0
+
+    def get_value(self, namespace: str, key: str) -> Optional[Any]:
+        """Valor guardado con put_value bajo una clave arbitraria (no asociada a un archivo)."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM entries WHERE namespace = ? AND path = ?", (namespace, key),
+            ).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def put_value(self, namespace: str, key: str, value: Any):
+        """Guarda (o reemplaza) un valor bajo una clave arbitraria, sin validación por mtime/tamaño."""
+        with self._lock:
+            try:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO entries (namespace, path, mtime_ns, size, value) VALUES (?, ?, 0, 0, ?)",
+                    (namespace, key, json.dumps(value, ensure_ascii=False)),
+                )
+                self._count_write()
+            except sqlite3.Error as e:
+                print(f"Advertencia: No se pudo escribir en la caché ({e}).", file=sys.stderr)
+
+    def flush(self):
+        """Confirma las escrituras pendientes."""
+        with self._lock:
+            if self._pending_writes:
+                try: self._conn.commit()
+                except sqlite3.Error as e: print(f"Advertencia: No se pudo guardar la caché ({e}).", file=sys.stderr)
+                self._pending_writes = 0
+
+
+_default_caches: Dict[Path, IndexCache] = {}
+_default_caches_lock = threading.Lock()
+
+
+def get_default_cache() -> IndexCache:
+    """Devuelve la instancia compartida de la caché persistente (se abre al primer uso)."""
+    path = get_cache_path()
+    with _default_caches_lock:
+        cache = _default_caches.get(path)
+        if cache is None:
+            cache = _default_caches[path] = IndexCache(path)
+            atexit.register(cache.flush)
+        return cache
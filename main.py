@@ -1,13 +1,21 @@
 # main.py
 import argparse
 from pathlib import Path
+import re
+import signal
 import sys
-from typing import List, Optional, Dict, Tuple
+from typing import TYPE_CHECKING, BinaryIO, List, Optional, Dict, Tuple
 
-# Importar módulos propios necesarios para CLI
+# Importar módulos propios necesarios para CLI. El pipeline de generación (core
+# y sus dependencias, incluida la redacción) se importa en main() solo si se va
+# a generar: --help y las acciones de gestión no lo cargan.
 import prompt_handler
 import config_handler
-import core # Importar la lógica central
+import defaults
+
+if TYPE_CHECKING: # Solo para las anotaciones
+    import core
+    from progress import ProgressInfo
 
 # --- FUNCIONES INTERACTIVAS (Permanecen aquí) ---
 def select_vault_interactive(vaults: Dict[str, str]) -> Optional[Tuple[str, Path]]:
@@ -50,6 +58,68 @@ def select_template_interactive(templates: Dict[str, str]) -> Optional[str]:
 
 # --- FIN FUNCIONES INTERACTIVAS ---
 
+SIZE_SUFFIXES = {'': 1, 'B': 1, 'K': 1024, 'KB': 1024, 'M': 1024 ** 2, 'MB': 1024 ** 2, 'G': 1024 ** 3, 'GB': 1024 ** 3}
+
+def parse_byte_size(value: str) -> int:
+    """Tipo argparse para tamaños: '500000', '64K', '2M', '1G'."""
+    text = value.strip().upper()
+    number = text.rstrip('KMGB')
+    suffix = text[len(number):]
+    try:
+        size = int(float(number) * SIZE_SUFFIXES[suffix])
+        if size <= 0: raise ValueError
+        return size
+    except (KeyError, ValueError):
+        raise argparse.ArgumentTypeError(f"Tamaño inválido: '{value}' (ej: 500000, 64K, 2M)")
+
+def format_byte_size(size: int) -> str:
+    """Tamaño legible (ej: '1.5 MB')."""
+    for unit in ('B', 'KB', 'MB'):
+        if size < 1024: return f"{size:.0f} {unit}" if unit == 'B' else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GB"
+
+def print_estimate_cli(estimate: 'core.SelectionEstimate'):
+    """Muestra el resultado de --estimate."""
+    print("\n--- Estimación (sin leer archivos) ---")
+    print(f"Archivos: {estimate.files}"); print(f"Tamaño total: {format_byte_size(estimate.total_bytes)}"); print(f"Tokens estimados: ~{estimate.estimated_tokens:,}")
+    if estimate.unindexed_files: print(f"Aviso: {estimate.unindexed_files} notas sin indexar se contaron sin aplicar --tag/--where.")
+    if estimate.largest_files:
+        print("Archivos más grandes:"); width = max(len(format_byte_size(size)) for _, size in estimate.largest_files)
+        for path, size in estimate.largest_files: print(f"  {format_byte_size(size).rjust(width)}  {path}")
+
+def parse_where_filter(value: str) -> Tuple[str, str]:
+    """Tipo argparse para filtros de frontmatter 'clave=valor'."""
+    import tag_index
+    try: return tag_index.parse_where(value)
+    except ValueError as e: raise argparse.ArgumentTypeError(str(e))
+
+def parse_redact_regex(value: str) -> Tuple[str, str]:
+    """Tipo argparse para --redact-regex '[NOMBRE=]EXPRESIÓN' (sin nombre: 'regex')."""
+    name, separator, expression = value.partition('=')
+    if not separator or not re.fullmatch(r"\w+", name): name, expression = "regex", value
+    if not expression: raise argparse.ArgumentTypeError(f"Expresión vacía en '{value}'")
+    return name, expression
+
+def parse_similarity(value: str) -> float:
+    """Tipo argparse para umbrales de similitud (0 < x <= 1)."""
+    try:
+        threshold = float(value)
+        if not 0 < threshold <= 1: raise ValueError
+        return threshold
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Umbral inválido: '{value}' (ej: 0.8)")
+
+def print_progress_cli(info: 'ProgressInfo'):
+    """Callback de progreso para la CLI: reescribe una única línea en stderr."""
+    if info.stage == 'scan':
+        line = f"  Buscando... {info.files_scanned} archivos recorridos, {info.files_matched} coincidencias"
+    else:
+        pct = (info.files_formatted * 100 // info.files_total) if info.files_total else 100
+        line = f"  Formateando... {info.files_formatted}/{info.files_total} ({pct}%) - {info.bytes_so_far / 1024:.1f} KiB"
+    end = "\n" if info.current_path is None or (info.stage == 'format' and info.files_formatted == info.files_total) else ""
+    print(f"\r{line:<79}", end=end, file=sys.stderr, flush=True)
+
 def parse_arguments() -> argparse.Namespace:
     """Define y parsea los argumentos de la línea de comandos."""
     parser = argparse.ArgumentParser(
@@ -65,9 +135,19 @@ def parse_arguments() -> argparse.Namespace:
   # Usar ruta de bóveda directa
   python main.py --vault-path "/ruta/temporal/boveda" --template "Archivo:GenerarNota" --target "Conceptos" --output-note-path "Conceptos/NuevaIdea.md"
 
+  # Combinar varias bóvedas (targets por bóveda con NOMBRE::ruta; sin prefijo = todas)
+  python main.py --select-vault "NoitaMod" --select-vault "NoitaBase" --target "NoitaMod::data/scripts" --target "NoitaBase::save00"
+
   # Excluir extensiones
   python main.py --target "NotasVarias" --exclude-ext .pdf --exclude-ext .png
 
+  # Solo el esquema de encabezados, o solo una sección de una nota
+  python main.py --target "Proyectos" --output-mode outline
+  python main.py --target "Proyectos/Plan.md#Objetivos"
+
+  # Varias plantillas con el mismo contexto (un archivo por plantilla: prompt_ResumenConceptosClave.txt, ...)
+  python main.py --template "Archivo:ResumenConceptosClave" "Archivo:GenerarPreguntas" --target "Tema1" --output prompt.txt
+
   # Sin ruta de nota (para plantillas que no la necesiten)
   python main.py --template "Archivo:AnalizarContenido" --target "CarpetaAnalisis" --output-mode tree
 
@@ -78,7 +158,7 @@ def parse_arguments() -> argparse.Namespace:
     )
 
     vault_selection_group = parser.add_mutually_exclusive_group()
-    vault_selection_group.add_argument( "--select-vault", type=str, metavar='NOMBRE', help="Nombre de bóveda guardada." )
+    vault_selection_group.add_argument( "--select-vault", type=str, action='append', metavar='NOMBRE', help="Nombre de bóveda guardada. Repetir para combinar varias bóvedas (usar --target NOMBRE::ruta para targets por bóveda)." )
     vault_selection_group.add_argument( "--vault-path", type=Path, metavar='RUTA_DIRECTORIO', help="Ruta directa a bóveda." )
 
     vault_management_group = parser.add_argument_group('Gestión de Bóvedas (ejecutar y salir)')
@@ -87,21 +167,47 @@ def parse_arguments() -> argparse.Namespace:
     vault_management_group.add_argument( "--list-vaults", action='store_true', help="Muestra bóvedas y sale." )
 
     gen_group = parser.add_argument_group('Generación de Prompt')
-    gen_group.add_argument( "--target", type=str, action='append', default=[], metavar='RUTA_RELATIVA', help="Ruta relativa (a bóveda) a incluir. Repetir. Vacío = toda la bóveda." )
-    gen_group.add_argument( "--ext", type=str, action='append', default=[], metavar='EXTENSION', help=f"Extensión a INCLUIR (ej: .md). Default: {core.DEFAULT_EXTENSIONS}" )
+    gen_group.add_argument( "--target", type=str, action='append', default=[], metavar='RUTA_RELATIVA', help="Ruta relativa (a bóveda) a incluir. Repetir. Vacío = toda la bóveda. 'nota.md#Encabezado' incluye solo esa sección; 'archivo.py:120-260' solo esas líneas ('120-' = hasta el final)." )
+    gen_group.add_argument( "--tag", type=str, action='append', default=[], metavar='ETIQUETA', help="Solo notas con esta etiqueta (en línea o frontmatter; incluye subetiquetas). Repetir = deben cumplirse todas." )
+    gen_group.add_argument( "--where", type=parse_where_filter, action='append', default=[], metavar='CLAVE=VALOR', help="Solo notas cuya propiedad de frontmatter CLAVE valga VALOR (ej: status=draft). Repetir = deben cumplirse todas." )
+    gen_group.add_argument( "--ext", type=str, action='append', default=[], metavar='EXTENSION', help=f"Extensión a INCLUIR (ej: .md). Default: {defaults.DEFAULT_EXTENSIONS}" )
     gen_group.add_argument( "--exclude-ext", type=str, action='append', default=[], metavar='EXTENSION', help="Extensión a EXCLUIR (ej: .log)." )
-    gen_group.add_argument( "--template", type=str, metavar='NOMBRE_O_RUTA', help="Nombre plantilla ('Archivo:Nombre') o ruta a .txt." )
+    gen_group.add_argument( "--template", type=str, nargs='+', action='extend', metavar='NOMBRE_O_RUTA', help="Nombre plantilla ('Archivo:Nombre') o ruta a .txt. Repetible. Con varias, el contexto se calcula una vez y cada prompt se guarda en su archivo (requiere --output)." )
     gen_group.add_argument( "--list-templates", action='store_true', help="Muestra plantillas y sale." )
-    gen_group.add_argument( "--output-mode", type=str, choices=['tree', 'content', 'both'], default='both', help="Qué contexto incluir. Default: both" )
+    gen_group.add_argument( "--output-mode", type=str, choices=['tree', 'content', 'both', 'outline'], default='both', help="Qué contexto incluir ('outline' = esquema de encabezados). Default: both" )
+    gen_group.add_argument( "--tree-max-depth", type=int, default=None, metavar='N', help="Profundidad máxima del árbol; niveles más profundos se resumen. 0 = sin límite (default)." )
+    gen_group.add_argument( "--max-file-bytes", type=parse_byte_size, default=None, metavar='TAMAÑO', help="Tamaño máximo por archivo (ej: 200K). Archivos mayores: solo cabeza y cola, con el rango omitido marcado." )
+    gen_group.add_argument( "--max-file-lines", type=int, default=None, metavar='N', help="Líneas máximas por archivo. Archivos mayores: solo cabeza y cola, con el rango omitido marcado. 0 = sin límite (default)." )
+    gen_group.add_argument( "--scan-workers", type=int, default=None, metavar='N', help="Recorre los directorios con N hilos en paralelo (útil en unidades de red/SMB). 0 o 1 = recorrido secuencial (default)." )
+    gen_group.add_argument( "--git", action='store_true', help="Si la bóveda es la raíz de un repositorio git, lista los archivos desde el índice de git (solo versionados, respeta .gitignore) en lugar de recorrer el disco." )
+    gen_group.add_argument( "--max-files", type=int, default=None, metavar='N', help="Incluye solo los N primeros archivos según --sort (ej: las N notas modificadas más recientemente). Solo esos se leen." )
+    gen_group.add_argument( "--sort", type=str, choices=defaults.SELECTION_SORTS, default='mtime', help="Criterio de --max-files: 'mtime' = más recientes, 'size' = más grandes, 'name' = primeros por ruta. Default: mtime" )
+    gen_group.add_argument( "--git-untracked", action='store_true', help="Con --git, incluye también los archivos no versionados (no ignorados)." )
+    gen_group.add_argument( "--dedupe", type=parse_similarity, nargs='?', const=defaults.DEFAULT_NEAR_DUPLICATE_THRESHOLD, default=None, metavar='UMBRAL', help=f"Omite notas casi idénticas (similitud >= UMBRAL, default {defaults.DEFAULT_NEAR_DUPLICATE_THRESHOLD}); se incluye una por grupo y el resto se lista." )
+    gen_group.add_argument( "--expand-embeds", type=int, nargs='?', const=defaults.DEFAULT_TRANSCLUSION_DEPTH, default=None, metavar='NIVELES', help=f"Inserta el contenido de las notas incrustadas (![[nota]], ![[nota#Encabezado]]) tras la línea que las incrusta, hasta NIVELES de anidamiento (default {defaults.DEFAULT_TRANSCLUSION_DEPTH})." )
+    gen_group.add_argument( "--extract", action='store_true', help="Extrae el texto de .canvas, .excalidraw(.md), .csv/.tsv y .pdf en lugar de incluirlos como texto bruto." )
+    gen_group.add_argument( "--order", type=str, choices=defaults.FILE_ORDERS, default='name', help="Orden del contenido. 'stable' = archivos menos modificados primero y recientes al final (aprovecha la caché de prefijos del LLM) e informa del prefijo idéntico a la ejecución anterior. Default: name" )
+    gen_group.add_argument( "--redact", action='store_true', help=f"Sustituye secretos y datos personales ({', '.join(defaults.REDACTION_PRESETS)} y los de la sección 'redaction' de la configuración) por {defaults.REDACTION_REPLACEMENT.format(name='patrón')}." )
+    gen_group.add_argument( "--redact-literal", type=str, action='append', default=[], metavar='TEXTO', help="Texto a redactar tal cual (ej: un nombre). Repetir. Implica --redact." )
+    gen_group.add_argument( "--redact-regex", type=parse_redact_regex, action='append', default=[], metavar='[NOMBRE=]EXPR', help="Expresión regular a redactar (con grupo de captura, solo se redacta el grupo 1). Repetir. Implica --redact." )
+    gen_group.add_argument( "--tree-collapse", type=int, default=None, metavar='N', help="Resume directorios del árbol con más de N entradas. 0 = nunca (default)." )
     # <<< MODIFICADO: Help text actualizado para reflejar opcionalidad >>>
+    gen_group.add_argument( "--estimate", action='store_true', help="Solo estima archivos, bytes y tokens de la selección (sin leer archivos ni necesitar plantilla) y sale." )
     gen_group.add_argument( "--output-note-path", type=str, metavar='RUTA_RELATIVA', help="Ruta relativa (en bóveda) para nota objetivo. Opcional, pero necesaria para placeholders {ruta_destino} y {etiqueta_jerarquica_N}." )
     gen_group.add_argument( "--output", type=Path, default=None, metavar='ARCHIVO_SALIDA', help="Archivo opcional para guardar prompt." )
+    gen_group.add_argument( "--max-memory", type=parse_byte_size, default=None, metavar='TAMAÑO', help="Memoria máxima para el contenido (ej: 256M). Por encima, se vuelca a un archivo temporal y el prompt se escribe por streaming." )
 
     parser.add_argument( '--version', action='version', version='%(prog)s 1.1.0' )
 
     args = parser.parse_args()
+    if args.max_files is not None and args.max_files < 1: parser.error("--max-files debe ser 1 o más.")
+    # Igual que en la GUI: 0 = sin límite (o recorrido secuencial); negativos no tienen sentido
+    for option, attr in (('--tree-max-depth', 'tree_max_depth'), ('--tree-collapse', 'tree_collapse'), ('--scan-workers', 'scan_workers'), ('--max-file-lines', 'max_file_lines')):
+        value = getattr(args, attr)
+        if value is not None and value < 0: parser.error(f"{option} debe ser 0 (sin límite) o más.")
+        if value == 0: setattr(args, attr, None)
 
-    args.ext = [f".{e.lower().lstrip('.')}" for e in (set(args.ext) if args.ext else set(core.DEFAULT_EXTENSIONS)) if e.strip()]
+    args.ext = [f".{e.lower().lstrip('.')}" for e in (set(args.ext) if args.ext else set(defaults.DEFAULT_EXTENSIONS)) if e.strip()]
     args.exclude_ext = [f".{e.lower().lstrip('.')}" for e in set(args.exclude_ext) if e.strip()]
 
     return args
@@ -109,7 +215,7 @@ def parse_arguments() -> argparse.Namespace:
 def main():
     """Función principal que orquesta el proceso CLI."""
     args = parse_arguments()
-    vaults = config_handler.get_vaults()
+    vaults = config_handler.get_vaults(check_paths=False) # Solo se valida la bóveda que se use
 
     is_management_action = args.list_vaults or args.list_templates or args.add_vault or args.remove_vault
     if is_management_action:
@@ -124,19 +230,29 @@ def main():
         print("\nAcción(es) de gestión completada(s)."); sys.exit(0)
 
     print("--- Iniciando Generación de Prompt ---")
+    import core # Importar la lógica central
+    import prompt_prefix
+    import redaction
+    from progress import CancellationToken, GenerationCancelled
 
     # 1. Determinar la bóveda a usar
     selected_vault_path: Optional[Path] = None; selected_vault_name: Optional[str] = None; used_manual_path = False
+    federated_vaults: List[Tuple[str, Path]] = [] # Solo se rellena con 2+ --select-vault
     # [Lógica de selección de bóveda sin cambios]
     if args.vault_path:
         try: manual_path = args.vault_path.resolve(); assert manual_path.is_dir(); selected_vault_path = manual_path; selected_vault_name = f"(Ruta Manual: {args.vault_path.name})"; used_manual_path = True; print(f"Usando bóveda manual: '{selected_vault_path}'")
         except: print(f"Error: Ruta manual inválida: {args.vault_path}", file=sys.stderr); sys.exit(1)
     elif args.select_vault:
-        if args.select_vault in vaults:
-            selected_vault_name = args.select_vault
-            try: selected_vault_path = Path(vaults[selected_vault_name]).resolve(); assert selected_vault_path.is_dir(); print(f"Usando bóveda: '{selected_vault_name}'")
-            except: print(f"Error: Ruta guardada para '{selected_vault_name}' inválida.", file=sys.stderr); sys.exit(1)
-        else: print(f"Error: Bóveda '{args.select_vault}' no encontrada.", file=sys.stderr); sys.exit(1)
+        for vault_name in dict.fromkeys(args.select_vault): # Sin duplicados, conservando orden
+            if vault_name not in vaults: print(f"Error: Bóveda '{vault_name}' no encontrada.", file=sys.stderr); sys.exit(1)
+            try: vault_path = Path(vaults[vault_name]).resolve(); assert vault_path.is_dir(); federated_vaults.append((vault_name, vault_path)); print(f"Usando bóveda: '{vault_name}'")
+            except: print(f"Error: Ruta guardada para '{vault_name}' inválida.", file=sys.stderr); sys.exit(1)
+        selected_vault_name, selected_vault_path = federated_vaults[0] # La primera resuelve rutas absolutas de nota destino
+        if len(federated_vaults) == 1:
+            # Con una sola bóveda, los targets "NOMBRE::ruta" se reparten igual que con varias
+            try: args.target = core.split_federated_targets(args.target, [selected_vault_name])[selected_vault_name]
+            except ValueError as e: print(f"\nError: {e}", file=sys.stderr); sys.exit(1)
+            federated_vaults = []
     else:
         last_vault_info = config_handler.get_last_vault()
         if last_vault_info: selected_vault_name, selected_vault_path = last_vault_info; print(f"Usando última bóveda: '{selected_vault_name}'")
@@ -159,10 +275,39 @@ def main():
         except ValueError: print(f"Error: Ruta nota destino absoluta '{args.output_note_path}' no en bóveda.", file=sys.stderr); sys.exit(1)
         except Exception as e: print(f"Error procesando ruta nota destino: {e}", file=sys.stderr); sys.exit(1)
 
+    # Opciones de selección y formateo, comunes a la estimación y a la generación
+    generation_options = core.GenerationOptions(
+        excluded_extensions=args.exclude_ext,
+        tree_max_depth=args.tree_max_depth, tree_collapse_threshold=args.tree_collapse,
+        max_file_bytes=args.max_file_bytes, max_file_lines=args.max_file_lines,
+        near_duplicate_threshold=args.dedupe,
+        tag_filters=args.tag, where_filters=args.where,
+        scan_workers=args.scan_workers,
+        use_git_index=args.git, git_untracked=args.git_untracked, max_files=args.max_files, selection_sort=args.sort,
+        file_order=args.order,
+        use_extractors=args.extract,
+        transclusion_depth=args.expand_embeds,
+    )
+
+    # 3b. Modo estimación: no necesita plantilla ni lee archivos
+    if args.estimate:
+        estimate_vaults = [(None, selected_vault_path, args.target)]
+        if federated_vaults:
+            try: targets_per_vault = core.split_federated_targets(args.target, [name for name, _ in federated_vaults])
+            except ValueError as e: print(f"\nError: {e}", file=sys.stderr); sys.exit(1)
+            estimate_vaults = [(name, path, targets_per_vault[name]) for name, path in federated_vaults]
+        estimates = [
+            core.estimate_selection(path, targets, args.ext, args.output_mode, generation_options, root_label=name)
+            for name, path, targets in estimate_vaults
+        ]
+        print_estimate_cli(core.merge_estimates(estimates) if len(estimates) > 1 else estimates[0]); sys.exit(0)
+
     # 4. Determinar la plantilla a usar
     template_string: Optional[str] = None
-    if args.template:
-        try: template_string = prompt_handler.load_template(args.template)
+    template_names: List[str] = list(dict.fromkeys(args.template or []))
+    extra_template_strings: List[str] = []
+    if template_names:
+        try: template_string, *extra_template_strings = [prompt_handler.load_template(name) for name in template_names]
         except ValueError as e: print(f"\nError: {e}", file=sys.stderr); sys.exit(1)
     else:
         print("\nINFO: No se especificó plantilla. Seleccione una:")
@@ -172,37 +317,110 @@ def main():
             except ValueError as e: print(f"\nError cargando plantilla: {e}", file=sys.stderr); sys.exit(1)
         else: print("No se seleccionó plantilla. Abortando.", file=sys.stderr); sys.exit(1)
     if not template_string: print("Error fatal: No se pudo cargar plantilla.", file=sys.stderr); sys.exit(1)
+    # Varias plantillas: un archivo de salida por plantilla, derivado de --output
+    extra_output_files: List[Path] = []
+    if extra_template_strings:
+        if not args.output: print("\nError: Con varias --template se necesita --output (se guarda un archivo por plantilla).", file=sys.stderr); sys.exit(1)
+        output_files = [prompt_handler.template_output_path(args.output, name).resolve() for name in template_names]
+        if len(set(output_files)) < len(output_files): print("\nError: Dos plantillas tienen el mismo nombre; usa rutas con nombres distintos.", file=sys.stderr); sys.exit(1)
+        args.output, *extra_output_files = output_files
+    redactor = None
+    if args.redact or args.redact_literal or args.redact_regex:
+        try: redactor = redaction.Redactor.from_config(config_handler.get_redaction_config(), args.redact_literal, dict(args.redact_regex))
+        except ValueError as e: print(f"\nError: {e}", file=sys.stderr); sys.exit(1)
+    generation_options.redactor = redactor
 
     # 5. Llamar a la lógica core
+    # Ctrl+C cancela de forma cooperativa (entre archivos); un segundo Ctrl+C interrumpe de inmediato
+    cancel_token = CancellationToken()
+    def handle_sigint(signum, frame):
+        if cancel_token.cancelled: raise KeyboardInterrupt
+        print("\nINFO: Cancelando generación... (Ctrl+C de nuevo para forzar)", file=sys.stderr)
+        cancel_token.cancel()
+    previous_sigint_handler = signal.signal(signal.SIGINT, handle_sigint)
+    print("\n--- Ejecutando Generación Core ---")
+    # Con --max-memory el prompt no se construye en memoria: se escribe directamente en la salida
+    output_stream = None
+    if args.max_memory:
+        if args.output:
+            try: output_file = args.output.resolve(); output_file.parent.mkdir(parents=True, exist_ok=True); output_stream = open(output_file, 'wb')
+            except Exception as e: print(f"\nError abriendo {args.output}: {e}", file=sys.stderr); sys.exit(1)
+        else:
+            print("\n--- Prompt Final (consola) ---", flush=True); output_stream = sys.stdout.buffer
+    extra_streams: List[BinaryIO] = []
     try:
-        print("\n--- Ejecutando Generación Core ---")
-        final_prompt = core.generate_prompt_core(
-            vault_path=selected_vault_path,
-            target_paths=args.target,
-            extensions=args.ext,
-            output_mode=args.output_mode,
-            output_note_path=output_note_path_relative, # Puede ser None
-            template_string=template_string,
-            excluded_extensions=args.exclude_ext # Pasar exclusiones
-        )
+        for extra_output_file in extra_output_files: extra_output_file.parent.mkdir(parents=True, exist_ok=True); extra_streams.append(open(extra_output_file, 'wb'))
+    except Exception as e:
+        for stream in extra_streams: stream.close()
+        print(f"\nError abriendo {extra_output_file}: {e}", file=sys.stderr); sys.exit(1)
+    # Con --order stable se calculan hashes por bloque de lo que se escribe para comparar con la ejecución anterior
+    prefix_writer = prompt_prefix.HashingWriter(output_stream) if output_stream is not None and args.order == 'stable' else None
+    try:
+        if federated_vaults:
+            targets_per_vault = core.split_federated_targets(args.target, [name for name, _ in federated_vaults])
+            final_prompt = core.generate_federated_prompt_core(
+                vaults=[(name, path, targets_per_vault[name]) for name, path in federated_vaults],
+                extensions=args.ext,
+                output_mode=args.output_mode,
+                output_note_path=output_note_path_relative,
+                template_string=template_string,
+                options=generation_options,
+                progress_callback=print_progress_cli,
+                cancel_token=cancel_token,
+                output_stream=prefix_writer or output_stream,
+                max_memory=args.max_memory,
+                extra_templates=list(zip(extra_template_strings, extra_streams)),
+            )
+        else:
+            final_prompt = core.generate_prompt_core(
+                vault_path=selected_vault_path,
+                target_paths=args.target,
+                extensions=args.ext,
+                output_mode=args.output_mode,
+                output_note_path=output_note_path_relative, # Puede ser None
+                template_string=template_string,
+                options=generation_options,
+                progress_callback=print_progress_cli,
+                cancel_token=cancel_token,
+                output_stream=prefix_writer or output_stream,
+                max_memory=args.max_memory,
+                extra_templates=list(zip(extra_template_strings, extra_streams)),
+            )
+    except GenerationCancelled as e:
+         print(f"\n{e} Abortando.", file=sys.stderr); sys.exit(130)
     except Exception as e:
          print(f"\nError durante la generación: {e}", file=sys.stderr)
          import traceback; traceback.print_exc(); sys.exit(1)
+    finally:
+        signal.signal(signal.SIGINT, previous_sigint_handler)
+        if output_stream is not None and output_stream is not sys.stdout.buffer: output_stream.close()
+        for stream in extra_streams: stream.close()
 
     # 6. Mostrar o guardar resultado
-    if args.output:
+    if output_stream is not None:
+        if args.output: print("\n--- Prompt Final Guardado ---"); print(f"Ruta: {output_file}")
+        else: output_stream.flush(); print()
+    elif args.output:
         try:
             output_file = args.output.resolve(); output_file.parent.mkdir(parents=True, exist_ok=True)
             output_file.write_text(final_prompt, encoding='utf-8')
-            print(f"\n--- Prompt Final Guardado ---"); print(f"Ruta: {output_file}")
+            print("\n--- Prompt Final Guardado ---"); print(f"Ruta: {output_file}")
         except Exception as e:
             print(f"\nError guardando prompt en {args.output}: {e}", file=sys.stderr)
             print("\n--- Prompt Final (fallback consola) ---"); print(final_prompt)
     else:
         print("\n--- Prompt Final (consola) ---"); print(final_prompt)
+    for extra_output_file in extra_output_files: print(f"Ruta: {extra_output_file}")
+    if redactor is not None: print(f"INFO: Redacciones: {redactor.summary()}", file=sys.stderr)
+    if args.order == 'stable':
+        prefix_key = prompt_prefix.run_key([path for _, path in federated_vaults] or [selected_vault_path], template_string)
+        prefix_report = prompt_prefix.compare_and_store(prefix_key, prefix_writer.fingerprint) if prefix_writer else prompt_prefix.report_prompt(prefix_key, final_prompt)
+        print(f"INFO: {prompt_prefix.format_report(prefix_report)}", file=sys.stderr)
 
     # 7. Guardar la bóveda usada como la última
-    if selected_vault_name and not used_manual_path:
+    if federated_vaults:
+        print("INFO: No se actualiza última bóveda (varias --select-vault).", file=sys.stderr)
+    elif selected_vault_name and not used_manual_path:
         config_handler.set_last_vault(selected_vault_name)
     elif used_manual_path:
         print("INFO: No se actualiza última bóveda (--vault-path).", file=sys.stderr)
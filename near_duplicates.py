@@ -0,0 +1,122 @@
+# near_duplicates.py
+from operator import eq
+import re
+import sys
+import zlib
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from defaults import DEFAULT_NEAR_DUPLICATE_THRESHOLD
+from file_handler import read_file_content
+from index_cache import IndexCache, get_default_cache
+from progress import CancellationToken, check_cancelled
+
+# Firma MinHash de una sola permutación (one-permutation hashing): cada shingle se
+# hashea una única vez y se asigna a uno de SIGNATURE_BINS cubos, guardando el mínimo.
+SIGNATURE_BINS = 64
+# LSH: la firma se divide en LSH_BANDS bandas de LSH_ROWS valores; dos archivos son
+# candidatos si coinciden en alguna banda completa
+LSH_BANDS = 16
+LSH_ROWS = SIGNATURE_BINS // LSH_BANDS
+SHINGLE_SIZE = 5 # Palabras por shingle
+DEFAULT_SIMILARITY_THRESHOLD = DEFAULT_NEAR_DUPLICATE_THRESHOLD
+_EMPTY_BIN = (1 << 64) - 1
+_TOKEN_RE = re.compile(r'\w+')
+# El hash de tuplas de enteros es determinista, pero puede cambiar entre versiones de Python
+CACHE_NAMESPACE = f"minhash-v1-py{sys.version_info[0]}.{sys.version_info[1]}"
+
+
+class NearDuplicateGroup(NamedTuple):
+    """Grupo de casi-duplicados: el archivo que se conserva y los omitidos."""
+    representative: Path
+    duplicates: List[Path]
+
+
+def compute_signature(text: str) -> Optional[List[int]]:
+    """
+    Calcula la firma MinHash de un texto a partir de shingles de SHINGLE_SIZE
+    palabras (sin distinguir mayúsculas ni espacios).
+
+    Returns:
+        Lista de SIGNATURE_BINS enteros, o None si el texto es demasiado corto
+        para compararlo con fiabilidad.
+    """
+    token_ids = [zlib.crc32(token.encode('utf-8')) for token in _TOKEN_RE.findall(text.lower())]
+    if len(token_ids) < SHINGLE_SIZE:
+        return None
+    bins = [_EMPTY_BIN] * SIGNATURE_BINS
+    for i in range(len(token_ids) - SHINGLE_SIZE + 1):
+        h = hash(tuple(token_ids[i:i + SHINGLE_SIZE])) & _EMPTY_BIN
+        index = h % SIGNATURE_BINS; value = h // SIGNATURE_BINS
+        if value < bins[index]: bins[index] = value
+    # Densificación: los cubos vacíos toman el valor del siguiente cubo ocupado (circular)
+    if _EMPTY_BIN in bins:
+        for i in range(SIGNATURE_BINS):
+            if bins[i] == _EMPTY_BIN:
+                for offset in range(1, SIGNATURE_BINS):
+                    candidate = bins[(i + offset) % SIGNATURE_BINS]
+                    if candidate != _EMPTY_BIN:
+                        bins[i] = candidate + offset * SIGNATURE_BINS; break # Desplazar para no igualar cubos distintos
+    return bins
+
+
+def estimate_similarity(signature_a: List[int], signature_b: List[int]) -> float:
+    """Estimación de la similitud de Jaccard: fracción de cubos con el mismo mínimo."""
+    return sum(map(eq, signature_a, signature_b)) / SIGNATURE_BINS
+
+
+def get_signature(file_path: Path, cache: Optional[IndexCache] = None) -> Optional[List[int]]:
+    """Firma del archivo, leída de la caché persistente si el archivo no cambió."""
+    cache = cache or get_default_cache()
+    cached = cache.get(CACHE_NAMESPACE, file_path)
+    if cached is not None:
+        return cached or None # [] = archivo demasiado corto (también se cachea)
+    content = read_file_content(file_path)
+    if content is None:
+        return None
+    signature = compute_signature(content)
+    cache.put(CACHE_NAMESPACE, file_path, signature or [])
+    return signature
+
+
+def find_near_duplicates(
+    file_paths: List[Path],
+    threshold: float = DEFAULT_SIMILARITY_THRESHOLD,
+    cancel_token: Optional[CancellationToken] = None,
+) -> Tuple[List[Path], List[NearDuplicateGroup]]:
+    """
+    Agrupa archivos casi idénticos (similitud estimada >= threshold) mediante LSH,
+    sin comparar todos los pares. Los archivos se recorren en el orden de
+    file_paths: cada uno se compara con los representativos (archivos
+    conservados) que comparten alguna banda de su firma y se une al grupo del
+    más parecido que llegue al umbral; si ninguno llega, pasa a ser
+    representativo. Así todo archivo omitido se parece a su representativo (no
+    hay cadenas A~B~C que junten A y C), y dos archivos parecidos a un tercero
+    pero no entre sí quedan en grupos distintos.
+
+    Returns:
+        Tupla (archivos_a_conservar, grupos). Se conserva el primer archivo de cada
+        grupo según el orden de file_paths, y el orden relativo de los
+        conservados no cambia.
+    """
+    signatures: List[Optional[List[int]]] = []
+    for file_path in file_paths:
+        check_cancelled(cancel_token)
+        signatures.append(get_signature(file_path))
+
+    # Cada cubo guarda solo representativos: los omitidos ya están cubiertos por el suyo
+    buckets: Dict[Tuple[int, Tuple[int, ...]], List[int]] = {}
+    members: Dict[int, List[Path]] = {}
+    kept: List[Path] = []
+    for i, signature in enumerate(signatures):
+        if signature is None: kept.append(file_paths[i]); continue
+        keys = [(band, tuple(signature[band * LSH_ROWS:(band + 1) * LSH_ROWS])) for band in range(LSH_BANDS)]
+        candidates = {representative for key in keys for representative in buckets.get(key, ())}
+        # El más parecido de los que llegan al umbral (a igualdad, el primero)
+        scores = ((estimate_similarity(signature, signatures[representative]), -representative) for representative in candidates)
+        best = max((score for score in scores if score[0] >= threshold), default=None)
+        if best is not None: members.setdefault(-best[1], []).append(file_paths[i]); continue
+        kept.append(file_paths[i])
+        for key in keys: buckets.setdefault(key, []).append(i)
+    groups = [NearDuplicateGroup(file_paths[representative], duplicates) for representative, duplicates in sorted(members.items())]
+    return kept, groups
@@ -0,0 +1,133 @@
+# outline.py
+import os
+from pathlib import Path
+import re
+import sys
+from bisect import bisect_right
+from typing import List, NamedTuple, Optional, Tuple
+
+from index_cache import IndexCache, get_default_cache
+
+# Encabezados ATX ("# Título" ... "###### Título"); "#etiqueta" sin espacio no es encabezado
+_HEADING_RE = re.compile(rb'^(#{1,6})[ \t]+(.+?)[ \t\r]*$', re.MULTILINE)
+_CLOSING_HASHES_RE = re.compile(r'\s+#+$')
+# Delimitadores de bloques de código: los "#" dentro de ellos no son encabezados
+_FENCE_RE = re.compile(rb'^ {0,3}(`{3,}|~{3,})', re.MULTILINE)
+# Frontmatter YAML al inicio del archivo (sus comentarios "# ..." tampoco son encabezados)
+_FRONTMATTER_RE = re.compile(rb'\A---[ \t]*\r?\n.*?^(?:---|\.\.\.)[ \t\r]*$', re.DOTALL | re.MULTILINE)
+# Separador entre la ruta de una nota y el encabezado en targets ("nota.md#Encabezado")
+SECTION_SEPARATOR = "#"
+CACHE_NAMESPACE = "outline"
+
+
+class Heading(NamedTuple):
+    """Encabezado Markdown con su posición en el archivo."""
+    level: int
+    title: str
+    offset: int  # Byte donde empieza la línea del encabezado
+    line: int    # Número de línea (1-based)
+
+
+def _code_block_ranges(data: bytes) -> List[Tuple[int, int]]:
+    """Rangos [inicio, fin) de bytes ocupados por bloques de código cercados."""
+    ranges: List[Tuple[int, int]] = []
+    open_fence: Optional[bytes] = None; open_start = 0
+    for match in _FENCE_RE.finditer(data):
+        fence = match.group(1)
+        if open_fence is None:
+            open_fence = fence; open_start = match.start()
+        elif fence[:1] == open_fence[:1] and len(fence) >= len(open_fence):
+            ranges.append((open_start, match.end())); open_fence = None
+    if open_fence is not None:
+        ranges.append((open_start, len(data))) # Bloque sin cerrar: hasta el final
+    return ranges
+
+
+def parse_outline(data: bytes) -> List[Heading]:
+    """Extrae los encabezados ATX de un documento Markdown (en bytes), ignorando bloques de código."""
+    code_ranges = _code_block_ranges(data) if b'``' in data or b'~~' in data else []
+    frontmatter = _FRONTMATTER_RE.match(data) if data.startswith(b'---') else None
+    if frontmatter: code_ranges = [(0, frontmatter.end())] + [r for r in code_ranges if r[0] >= frontmatter.end()]
+    code_starts = [start for start, _ in code_ranges]
+    headings: List[Heading] = []
+    line = 1; last_offset = 0
+    for match in _HEADING_RE.finditer(data):
+        offset = match.start()
+        index = bisect_right(code_starts, offset) - 1
+        if index >= 0 and offset < code_ranges[index][1]:
+            continue
+        line += data.count(b'\n', last_offset, offset); last_offset = offset
+        title = _CLOSING_HASHES_RE.sub('', match.group(2).decode('utf-8', errors='replace')).strip()
+        if title:
+            headings.append(Heading(len(match.group(1)), title, offset, line))
+    return headings
+
+
+def get_outline(file_path: Path, cache: Optional[IndexCache] = None) -> Optional[Tuple[List[Heading], int]]:
+    """
+    Devuelve (encabezados, tamaño_en_bytes) de un archivo. El esquema se guarda en
+    la caché persistente y solo se recalcula si el archivo cambió.
+
+    Returns:
+        La tupla, o None si el archivo no se pudo leer (error ya impreso).
+    """
+    cache = cache or get_default_cache()
+    try:
+        st = os.stat(file_path)
+        cached = cache.get(CACHE_NAMESPACE, file_path, st)
+        if cached is not None:
+            return [Heading(*heading) for heading in cached], st.st_size
+        data = file_path.read_bytes()
+    except Exception as e:
+        print(f"Error leyendo {file_path}: {e}", file=sys.stderr); return None
+    headings = parse_outline(data)
+    cache.put(CACHE_NAMESPACE, file_path, [list(heading) for heading in headings], st)
+    return headings, len(data)
+
+
+def find_section(headings: List[Heading], file_size: int, section_spec: str) -> Optional[Tuple[int, int, int]]:
+    """
+    Localiza una sección por su título (sin distinguir mayúsculas). Admite rutas
+    de encabezados al estilo Obsidian ("Padre#Hijo").
+
+    Returns:
+        (byte_inicio, byte_fin, línea_inicio), o None si no existe.
+    """
+    components = [c.strip().lower() for c in section_spec.split(SECTION_SEPARATOR) if c.strip()]
+    if not components: return None
+    start_index = 0; limit_index = len(headings); found = -1
+    for component in components:
+        found = next((i for i in range(start_index, limit_index) if headings[i].title.lower() == component), -1)
+        if found == -1: return None
+        # El siguiente componente debe estar dentro de la sección encontrada
+        level = headings[found].level
+        start_index = found + 1
+        limit_index = next((i for i in range(start_index, len(headings)) if headings[i].level <= level), len(headings))
+    heading = headings[found]
+    end = headings[limit_index].offset if limit_index < len(headings) else file_size
+    return heading.offset, end, heading.line
+
+
+def read_section(file_path: Path, section_spec: str, cache: Optional[IndexCache] = None) -> Optional[Tuple[str, int]]:
+    """
+    Lee solo los bytes de una sección usando el esquema cacheado (seek + read).
+
+    Returns:
+        (texto_de_la_sección, número_de_su_primera_línea); None si el archivo no
+        se pudo leer o la sección no existe.
+    """
+    outline = get_outline(file_path, cache)
+    if outline is None: return None
+    headings, file_size = outline
+    section = find_section(headings, file_size, section_spec)
+    if section is None: return None
+    start, end, first_line = section
+    try:
+        with open(file_path, 'rb') as f:
+            f.seek(start)
+            data = f.read(end - start)
+    except Exception as e:
+        print(f"Error leyendo {file_path}: {e}", file=sys.stderr); return None
+    try: text = data.decode('utf-8')
+    except UnicodeDecodeError: text = data.decode('latin-1')
+    return text, first_line
@@ -0,0 +1,59 @@
+# progress.py
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Optional
+
+
+class GenerationCancelled(Exception):
+    """Se lanza cuando una generación se interrumpe a través de su CancellationToken."""
+
+
+class CancellationToken:
+    """
+    Token de cancelación cooperativa. La lógica core lo consulta entre archivo y
+    archivo; cualquier hilo (GUI, manejador de señales) puede llamar a cancel().
+    """
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def raise_if_cancelled(self):
+        if self._event.is_set():
+            raise GenerationCancelled("Generación cancelada por el usuario.")
+
+
+@dataclass
+class ProgressInfo:
+    """Estado de progreso que se entrega al callback en cada actualización."""
+    stage: str                       # 'scan' o 'format'
+    files_scanned: int = 0           # Archivos recorridos durante la búsqueda
+    files_matched: int = 0           # Archivos que pasan los filtros
+    files_formatted: int = 0         # Archivos ya formateados
+    files_total: int = 0             # Total a formatear (conocido tras la búsqueda)
+    bytes_so_far: int = 0            # Bytes (UTF-8) de contenido formateado acumulado
+    current_path: Optional[Path] = None
+
+
+ProgressCallback = Callable[[ProgressInfo], None]
+
+# Cada cuántos archivos recorridos se notifica durante la búsqueda
+SCAN_REPORT_EVERY = 50
+
+
+def check_cancelled(cancel_token: Optional[CancellationToken]):
+    """Lanza GenerationCancelled si el token (opcional) fue cancelado."""
+    if cancel_token is not None:
+        cancel_token.raise_if_cancelled()
+
+
+def report_progress(progress_callback: Optional[ProgressCallback], info: ProgressInfo):
+    """Llama al callback (si existe) con el estado actual."""
+    if progress_callback is not None:
+        progress_callback(info)
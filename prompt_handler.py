@@ -33,6 +33,14 @@ def get_available_templates() -> Dict[str, str]:
              print(f"Advertencia: Error buscando plantillas en '{templates_dir}': {e}", file=sys.stderr)
     return available
 
+def template_output_path(output: Path, template_name: str) -> Path:
+    """
+    Archivo de salida de una plantilla cuando se generan varias con el mismo
+    contexto: 'prompt.txt' + 'Archivo: Resumen' (o 'ruta/Resumen.txt') -> 'prompt_Resumen.txt'.
+    """
+    stem = Path(template_name.split(':', 1)[1].strip() if template_name.startswith('Archivo:') else template_name).stem
+    return output.with_name(f"{output.stem}_{stem}{output.suffix}")
+
 def load_template(template_name_or_path: str) -> str:
     """
     Carga una plantilla por su nombre conocido (de get_available_templates) o por ruta directa.
@@ -0,0 +1,103 @@
+# prompt_prefix.py
+import hashlib
+import os
+from pathlib import Path
+from typing import BinaryIO, Iterable, List, NamedTuple, Optional
+
+from index_cache import IndexCache, get_default_cache
+
+CACHE_NAMESPACE = "prompt-prefix-v1"
+# Granularidad de la comparación: se guarda un hash de 8 bytes por bloque (~1,5% del prompt)
+BLOCK_SIZE = 1024
+_DIGEST_SIZE = 8
+
+
+class PrefixReport(NamedTuple):
+    """Comparación del prompt actual con el de la ejecución anterior."""
+    identical_bytes: int  # Prefijo idéntico (múltiplo de BLOCK_SIZE salvo si el prompt es igual entero)
+    total_bytes: int
+    previous_bytes: Optional[int]  # None si no hay ejecución anterior registrada
+
+
+class PromptFingerprint:
+    """Hashes por bloques de BLOCK_SIZE bytes de un prompt, calculados a medida que se escribe."""
+    def __init__(self):
+        self.size = 0
+        self._digests: List[bytes] = []
+        self._pending = bytearray()
+
+    def update(self, data: bytes):
+        self.size += len(data)
+        self._pending += data
+        full = len(self._pending) - len(self._pending) % BLOCK_SIZE
+        if not full: return
+        with memoryview(self._pending) as view:
+            for start in range(0, full, BLOCK_SIZE):
+                self._digests.append(hashlib.blake2b(view[start:start + BLOCK_SIZE], digest_size=_DIGEST_SIZE).digest())
+        del self._pending[:full]
+
+    def hexdigests(self) -> str:
+        """Hashes concatenados en hexadecimal (el último bloque puede estar incompleto)."""
+        digests = self._digests + ([hashlib.blake2b(self._pending, digest_size=_DIGEST_SIZE).digest()] if self._pending else [])
+        return b"".join(digests).hex()
+
+
+class HashingWriter:
+    """Envuelve un archivo binario de salida y actualiza un PromptFingerprint con todo lo que se escribe."""
+    def __init__(self, out: BinaryIO):
+        self.out = out
+        self.fingerprint = PromptFingerprint()
+
+    def write(self, data: bytes) -> int:
+        self.fingerprint.update(data)
+        return self.out.write(data)
+
+    def writelines(self, parts: Iterable[bytes]):
+        for part in parts: self.write(part)
+
+    def flush(self):
+        self.out.flush()
+
+
+def run_key(vault_paths: List[Path], template_string: str) -> str:
+    """Clave de la ejecución: mismas bóvedas y misma plantilla (los targets y opciones pueden variar)."""
+    template_hash = hashlib.blake2b(template_string.encode('utf-8'), digest_size=16).hexdigest()
+    return "|".join(os.path.abspath(path) for path in vault_paths) + "|" + template_hash
+
+
+def compare_and_store(key: str, fingerprint: PromptFingerprint, cache: Optional[IndexCache] = None) -> PrefixReport:
+    """
+    Compara el prompt con el de la ejecución anterior con la misma clave y
+    guarda el actual para la siguiente. Solo se guardan los hashes por bloque,
+    nunca el prompt.
+    """
+    cache = cache or get_default_cache()
+    digests = fingerprint.hexdigests()
+    previous = cache.get_value(CACHE_NAMESPACE, key)
+    cache.put_value(CACHE_NAMESPACE, key, {"size": fingerprint.size, "digests": digests})
+    cache.flush()
+    if previous is None:
+        return PrefixReport(0, fingerprint.size, None)
+    previous_digests = previous["digests"]
+    if previous["size"] == fingerprint.size and previous_digests == digests:
+        return PrefixReport(fingerprint.size, fingerprint.size, previous["size"])
+    step = 2 * _DIGEST_SIZE; equal_blocks = 0
+    for start in range(0, min(len(digests), len(previous_digests)), step):
+        if digests[start:start + step] != previous_digests[start:start + step]: break
+        equal_blocks += 1
+    identical = min(equal_blocks * BLOCK_SIZE, fingerprint.size, previous["size"])
+    return PrefixReport(identical, fingerprint.size, previous["size"])
+
+
+def report_prompt(key: str, prompt: str) -> PrefixReport:
+    """compare_and_store para un prompt ya construido como string."""
+    fingerprint = PromptFingerprint()
+    fingerprint.update(prompt.encode('utf-8'))
+    return compare_and_store(key, fingerprint)
+
+
+def format_report(report: PrefixReport) -> str:
+    if report.previous_bytes is None:
+        return f"Prefijo estable: sin ejecución anterior con esta bóveda y plantilla ({report.total_bytes} bytes registrados)."
+    fraction = report.identical_bytes / report.total_bytes if report.total_bytes else 1.0
+    return f"Prefijo idéntico a la ejecución anterior: {report.identical_bytes} de {report.total_bytes} bytes ({fraction:.1%})."
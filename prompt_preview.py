@@ -0,0 +1,60 @@
+# prompt_preview.py
+import mmap
+import os
+from pathlib import Path
+import re
+import sys
+from typing import List, NamedTuple, Tuple
+
+from formatter import SEPARATOR
+
+_SEPARATOR_BYTES = SEPARATOR.encode('utf-8')
+# Cabecera de bloque de archivo: "\n----\n/ruta[#sección|:rango]:\n----\n"
+_BLOCK_HEADER_RE = re.compile(rb'\n' + re.escape(_SEPARATOR_BYTES) + rb'\n/([^\n]*):\n' + re.escape(_SEPARATOR_BYTES) + rb'\n')
+_FOOTER = b'\n' + _SEPARATOR_BYTES + b'\n'
+PREAMBLE_LABEL = "(Inicio del prompt)"
+EPILOGUE_LABEL = "(Final del prompt)"
+
+
+class PromptBlock(NamedTuple):
+    """Tramo [start, end) de bytes de un prompt generado: un archivo, o el texto que lo rodea."""
+    label: str
+    start: int
+    end: int
+
+    @property
+    def size(self) -> int:
+        return self.end - self.start
+
+
+def index_prompt_file(file_path: Path) -> List[PromptBlock]:
+    """
+    Divide un prompt ya escrito en disco en bloques por archivo (según las
+    cabeceras de formatter), sin cargarlo en memoria: el archivo se recorre con
+    mmap y solo se guardan las posiciones. El texto anterior al primer archivo
+    (plantilla, árbol) y el posterior al último son bloques propios.
+    """
+    try:
+        if os.path.getsize(file_path) == 0: return []
+        with open(file_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            headers = [(match.start(), match.end(), match.group(1).decode('utf-8', errors='replace')) for match in _BLOCK_HEADER_RE.finditer(data)]
+            blocks: List[PromptBlock] = []
+            position = 0
+            for index, (start, content_start, label) in enumerate(headers):
+                if start > position: blocks.append(PromptBlock(PREAMBLE_LABEL if not blocks else EPILOGUE_LABEL, position, start))
+                limit = headers[index + 1][0] if index + 1 < len(headers) else len(data)
+                footer = data.find(_FOOTER, content_start - 1, limit) # Las líneas del contenido van numeradas: la primera línea separadora es el pie
+                end = footer + len(_FOOTER) if footer != -1 else limit
+                blocks.append(PromptBlock(label, start, end)); position = end
+            if position < len(data): blocks.append(PromptBlock(PREAMBLE_LABEL if not blocks else EPILOGUE_LABEL, position, len(data)))
+            return blocks
+    except Exception as e:
+        print(f"Error indexando el prompt {file_path}: {e}", file=sys.stderr); return []
+
+
+def read_block(file_path: Path, block: PromptBlock, max_bytes: int) -> Tuple[str, bool]:
+    """Texto de un bloque (como mucho max_bytes, cortado en un carácter completo). Devuelve (texto, truncado)."""
+    with open(file_path, 'rb') as f:
+        f.seek(block.start)
+        data = f.read(min(block.size, max_bytes))
+    return data.decode('utf-8', errors='ignore'), block.size > max_bytes
@@ -0,0 +1,248 @@
+# redaction.py
+from collections import Counter
+import re
+import threading
+from typing import Dict, Iterable, List, Mapping, NamedTuple, Optional, Tuple
+
+from defaults import REDACTION_REPLACEMENT
+
+# Texto que sustituye cada coincidencia
+REPLACEMENT = REDACTION_REPLACEMENT
+LITERAL_RULE_NAME = "literal"
+# Alrededor de cada ancla solo se examina su línea, hasta este número de bytes a cada lado
+MAX_WINDOW_BYTES = 4096
+
+# Patrones incluidos: (expresión, anclas, multilínea). Las anclas son textos que
+# toda coincidencia contiene; se buscan con búsqueda literal y la expresión solo
+# se evalúa en la línea donde aparecen.
+BUILTIN_PATTERNS: Dict[str, Tuple[str, Tuple[str, ...], bool]] = {
+    "email": (r"(?<![\w.+-])[\w.+-]+@[\w-]+(?:\.[\w-]+)*\.[A-Za-z]{2,}", ("@",), False),
+    "api_key": (
+        r"\b(?:sk-(?:ant-)?[A-Za-z0-9_-]{20,}|AKIA[0-9A-Z]{16}|gh[pousr]_[A-Za-z0-9]{36,}"
+        r"|github_pat_[A-Za-z0-9_]{22,}|AIza[0-9A-Za-z_-]{35}|xox[abprs]-[A-Za-z0-9-]{10,})",
+        ("sk-", "AKIA", "ghp_", "gho_", "ghu_", "ghs_", "ghr_", "github_pat_", "AIza", "xoxa-", "xoxb-", "xoxp-", "xoxr-", "xoxs-"),
+        False,
+    ),
+    # Sin línea END (clave cortada o pegada a medias) se redactan las líneas de cuerpo que siguen:
+    # base64 o cabeceras "Proc-Type:"/"DEK-Info:", con o sin el prefijo de numeración "  12 | "
+    "private_key": (
+        r"-----BEGIN [A-Z ]*PRIVATE KEY-----(?:.*?-----END [A-Z ]*PRIVATE KEY-----"
+        r"|(?:\n(?:[ \t]*\d+ \| )?[ \t]*(?:[A-Za-z0-9+/=]{16,}|(?:Proc-Type|DEK-Info):[^\n]*)[ \t]*(?=\n|$))*)",
+        ("PRIVATE KEY-----",),
+        True,
+    ),
+}
+
+_REGEX_METACHARACTERS = set(".^$*+?{}[]|()\\")
+
+
+class RedactionRule(NamedTuple):
+    name: str
+    pattern: Optional[re.Pattern]  # None = literal (la coincidencia es el ancla)
+    anchors: Tuple[bytes, ...]     # Vacío = la expresión recorre el bloque entero
+    multiline: bool = False        # La coincidencia puede seguir en líneas posteriores
+    whole_words: bool = False      # Literales: no se redactan dentro de otra palabra (como \b)
+
+
+def _literal_prefix(pattern: str) -> Optional[str]:
+    """
+    Texto literal con el que empieza toda coincidencia de la expresión (o None):
+    permite localizar las expresiones del usuario con búsqueda literal.
+    """
+    depth = 0; escaped = False; in_class = False
+    for char in pattern: # Con alternativas en el nivel superior no hay prefijo común
+        if escaped: escaped = False; continue
+        if char == '\\': escaped = True
+        elif in_class: in_class = char != ']'
+        elif char == '[': in_class = True
+        elif char == '(': depth += 1
+        elif char == ')': depth -= 1
+        elif char == '|' and depth == 0: return None
+    i = 2 if pattern.startswith(r"\b") else 0
+    prefix: List[str] = []
+    while i < len(pattern):
+        char = pattern[i]
+        if char == '\\' and i + 1 < len(pattern) and not pattern[i + 1].isalnum():
+            prefix.append(pattern[i + 1]); i += 2; continue
+        if char in _REGEX_METACHARACTERS: break
+        prefix.append(char); i += 1
+    if i < len(pattern) and pattern[i] in "*?{" and prefix: prefix.pop() # El último carácter es opcional/repetible
+    return "".join(prefix) or None
+
+
+def _is_word_char(char: str) -> bool:
+    return char.isalnum() or char == '_'
+
+
+def _at_word_boundaries(data: bytes, start: int, end: int) -> bool:
+    """
+    Como \b alrededor de data[start:end] (UTF-8): si el tramo empieza (o acaba)
+    con una letra, un dígito o '_', el carácter anterior (o siguiente) no puede serlo.
+    """
+    first = data[start:start + 4].decode('utf-8', 'replace')[:1]; before = data[max(0, start - 4):start].decode('utf-8', 'replace')[-1:]
+    if _is_word_char(first) and _is_word_char(before): return False
+    last = data[max(start, end - 4):end].decode('utf-8', 'replace')[-1:]; after = data[end:end + 4].decode('utf-8', 'replace')[:1]
+    return not (_is_word_char(last) and _is_word_char(after))
+
+
+class Redactor:
+    """
+    Sustituye secretos y datos personales en los bloques formateados, en una
+    sola pasada por bloque para todo el conjunto de patrones:
+
+    - Todas las anclas (literales del usuario y textos obligatorios de cada
+      expresión) se agrupan por su primer byte en unas pocas expresiones
+      literales, que el motor de re recorre a velocidad de búsqueda de texto.
+      Cada posición se prueba (el resto del ancla va en una búsqueda hacia
+      delante), así que un ancla no oculta otra que empiece dentro de ella, y
+      donde coincide un ancla cuentan también las que son prefijo suyo.
+    - Cada expresión solo se evalúa alrededor de sus anclas (en su línea,
+      hasta MAX_WINDOW_BYTES a cada lado); las ventanas de anclas cercanas se
+      unen, así que cada ancla queda cubierta y ningún tramo se evalúa dos
+      veces. Las expresiones sin prefijo literal recorren el bloque entero.
+    - Las coincidencias solapadas se resuelven (gana la que empieza antes y,
+      a igualdad, la más larga) y el bloque se reconstruye con un solo join.
+
+    Si una expresión tiene grupos de captura, solo se redacta el grupo 1
+    (ej: "password: (\\S+)" conserva "password: "). Los literales solo se
+    redactan como palabras completas ("Ana" no toca "Anatomía"), salvo con
+    whole_word_literals=False. Los recuentos por patrón se acumulan en `counts`
+    (seguro entre hilos).
+    """
+    def __init__(self, rules: List[RedactionRule]):
+        self.rules = rules
+        self.counts: Counter = Counter()
+        self._lock = threading.Lock()
+        self._anchor_rules: Dict[bytes, List[int]] = {}
+        for index, rule in enumerate(rules):
+            for anchor in rule.anchors: self._anchor_rules.setdefault(anchor, []).append(index)
+        by_first_byte: Dict[int, List[bytes]] = {}
+        for anchor in self._anchor_rules: by_first_byte.setdefault(anchor[0], []).append(anchor)
+        # Un primer byte fijo por expresión permite al motor usar su búsqueda rápida de prefijo literal;
+        # el resto va en una búsqueda hacia delante para no saltarse anclas solapadas
+        self._families = [
+            re.compile(re.escape(bytes([first])) + b"(?=(" + b"|".join(re.escape(a[1:]) for a in sorted(anchors, key=len, reverse=True)) + b"))")
+            for first, anchors in by_first_byte.items()
+        ]
+        # La alternativa más larga gana: las anclas que también coinciden ahí son sus prefijos
+        self._anchor_prefixes: Dict[bytes, List[bytes]] = {
+            anchor: [other for other in self._anchor_rules if anchor.startswith(other)] for anchor in self._anchor_rules
+        }
+        self._unanchored = [rule for rule in rules if rule.pattern is not None and not rule.anchors]
+
+    @classmethod
+    def from_patterns(
+        cls,
+        presets: Iterable[str] = (),
+        literals: Iterable[str] = (),
+        regexes: Optional[Mapping[str, str]] = None,
+        whole_word_literals: bool = True,
+    ) -> "Redactor":
+        """
+        Construye el redactor a partir de patrones incluidos (BUILTIN_PATTERNS),
+        literales y expresiones regulares con nombre. Con whole_word_literals=False
+        los literales se redactan también dentro de otras palabras.
+
+        Raises:
+            ValueError: Si un patrón incluido no existe o una expresión no compila.
+        """
+        rules: List[RedactionRule] = []
+        for name in presets:
+            if name not in BUILTIN_PATTERNS:
+                raise ValueError(f"Patrón de redacción desconocido '{name}' (disponibles: {', '.join(BUILTIN_PATTERNS)})")
+            pattern, anchors, multiline = BUILTIN_PATTERNS[name]
+            rules.append(RedactionRule(name, re.compile(pattern, re.DOTALL if multiline else 0), tuple(a.encode('utf-8') for a in anchors), multiline))
+        literal_anchors = tuple(dict.fromkeys(literal.encode('utf-8') for literal in literals if literal))
+        if literal_anchors: rules.append(RedactionRule(LITERAL_RULE_NAME, None, literal_anchors, whole_words=whole_word_literals))
+        for name, expression in (regexes or {}).items():
+            try: compiled = re.compile(expression)
+            except re.error as e: raise ValueError(f"Expresión de redacción inválida '{expression}': {e}")
+            prefix = _literal_prefix(expression) if not compiled.flags & re.IGNORECASE else None
+            rules.append(RedactionRule(name, compiled, (prefix.encode('utf-8'),) if prefix else ()))
+        return cls(rules)
+
+    @classmethod
+    def from_config(
+        cls,
+        config: Mapping[str, object],
+        extra_literals: Iterable[str] = (),
+        extra_regexes: Optional[Mapping[str, str]] = None,
+    ) -> "Redactor":
+        """
+        Redactor con la sección "redaction" de la configuración (ver
+        config_handler.get_redaction_config) más literales/expresiones extra.
+        Sin "presets" en la configuración se usan todos los patrones incluidos;
+        "whole_word_literals": false redacta los literales también dentro de
+        otras palabras.
+
+        Raises:
+            ValueError: Como from_patterns.
+        """
+        return cls.from_patterns(
+            config.get("presets", list(BUILTIN_PATTERNS)),
+            [*config.get("literals", []), *extra_literals],
+            {**config.get("regexes", {}), **(extra_regexes or {})},
+            whole_word_literals=bool(config.get("whole_word_literals", True)),
+        )
+
+    def _match_window(self, rule: RedactionRule, data: bytes, start: int, end: int, spans: Dict[Tuple[int, int], str]):
+        """Evalúa la expresión de la regla en data[start:end] y añade sus coincidencias (en bytes) a spans."""
+        text = data[start:end].decode('utf-8', 'surrogateescape') # 1 carácter por byte inválido: los offsets siguen cuadrando
+        char_position = 0; byte_position = start
+        for match in rule.pattern.finditer(text):
+            match_start, match_end = match.span(1) if rule.pattern.groups else match.span()
+            if match_start < 0 or match_start == match_end: continue
+            byte_position += len(text[char_position:match_start].encode('utf-8', 'surrogateescape'))
+            byte_end = byte_position + len(text[match_start:match_end].encode('utf-8', 'surrogateescape'))
+            spans.setdefault((byte_position, byte_end), rule.name)
+            char_position = match_start
+
+    def redact(self, data: bytes) -> bytes:
+        """Devuelve data (UTF-8) con las coincidencias sustituidas por REPLACEMENT."""
+        hits = [hit for family in self._families for hit in family.finditer(data)]
+        if not hits and not self._unanchored: return data # Caso habitual: ninguna ancla en el bloque
+        if len(self._families) > 1: hits.sort(key=lambda hit: hit.start())
+        spans: Dict[Tuple[int, int], str] = {}
+        # Ventana [inicio, fin) en bytes pendiente de evaluar por regla; la de un ancla que la solapa la amplía
+        pending_windows: Dict[int, Tuple[int, int]] = {}
+        for hit in hits:
+            hit_start = hit.start()
+            for anchor in self._anchor_prefixes[data[hit_start:hit.end(1)]]:
+                hit_end = hit_start + len(anchor)
+                for rule_index in self._anchor_rules[anchor]:
+                    rule = self.rules[rule_index]
+                    if rule.pattern is None:
+                        if not rule.whole_words or _at_word_boundaries(data, hit_start, hit_end): spans.setdefault((hit_start, hit_end), rule.name)
+                        continue
+                    lowest_start = max(0, hit_start - MAX_WINDOW_BYTES)
+                    line_start = data.rfind(b'\n', lowest_start, hit_start)
+                    window_start = line_start + 1 if line_start != -1 else lowest_start
+                    if rule.multiline: window_end = len(data)
+                    else:
+                        window_end = data.find(b'\n', hit_end, hit_end + MAX_WINDOW_BYTES)
+                        if window_end == -1: window_end = min(len(data), hit_end + MAX_WINDOW_BYTES)
+                    current = pending_windows.get(rule_index)
+                    if current is not None and window_start <= current[1]:
+                        pending_windows[rule_index] = (current[0], max(current[1], window_end)); continue
+                    if current is not None: self._match_window(rule, data, *current, spans)
+                    pending_windows[rule_index] = (window_start, window_end)
+        for rule_index, (start, end) in pending_windows.items(): self._match_window(self.rules[rule_index], data, start, end, spans)
+        for rule in self._unanchored: self._match_window(rule, data, 0, len(data), spans)
+        if not spans: return data
+
+        parts: List[bytes] = []; counts: Counter = Counter(); last_end = 0
+        for (start, end), name in sorted(spans.items(), key=lambda item: (item[0][0], -item[0][1])):
+            if start < last_end: continue # Solapada con una coincidencia anterior
+            parts.append(data[last_end:start]); parts.append(REPLACEMENT.format(name=name).encode('utf-8'))
+            last_end = end; counts[name] += 1
+        parts.append(data[last_end:])
+        with self._lock: self.counts.update(counts)
+        return b"".join(parts)
+
+    def redact_text(self, text: str) -> str:
+        return self.redact(text.encode('utf-8')).decode('utf-8')
+
+    def summary(self) -> str:
+        """Recuento de redacciones por patrón (ej: "email=3, api_key=1")."""
+        with self._lock:
+            return ", ".join(f"{name}={count}" for name, count in self.counts.most_common()) or "ninguna"
@@ -0,0 +1,135 @@
+# spill.py
+import io
+import os
+import sys
+import tempfile
+from typing import BinaryIO, Iterable, Optional, Tuple
+
+COPY_CHUNK_SIZE = 1024 * 1024
+_WHITESPACE = b" \t\n\r\x0b\x0c"
+
+
+class SpillBuffer:
+    """
+    Buffer binario que se mantiene en memoria mientras no supere max_memory
+    bytes; a partir de ahí su contenido pasa a un archivo temporal en disco y
+    las escrituras siguientes van directamente a él. Con max_memory=None nunca
+    se vuelca.
+
+    Admite la interfaz que usan formatter.write_file_content y core
+    (write, writelines, tell, seek, read). Se cierra con close() o con `with`;
+    el archivo temporal se borra al cerrarse.
+    """
+    def __init__(self, max_memory: Optional[int] = None):
+        self.max_memory = max_memory
+        self.file: BinaryIO = io.BytesIO()
+        self.spilled = False
+
+    def _reserve(self, size: int):
+        """Vuelca a disco antes de que una escritura de `size` bytes supere el límite."""
+        if not self.spilled and self.max_memory is not None and self.file.tell() + size > self.max_memory:
+            disk_file = tempfile.TemporaryFile(prefix="obsidian_context_")
+            position = self.file.tell()
+            with self.file.getbuffer() as view: disk_file.write(view)
+            disk_file.seek(position)
+            self.file = disk_file; self.spilled = True
+            print(f"INFO: Límite de memoria ({self.max_memory} bytes) alcanzado; el contexto continúa en disco.", file=sys.stderr)
+
+    def write(self, data: bytes) -> int:
+        self._reserve(len(data))
+        return self.file.write(data)
+
+    def writelines(self, parts: Iterable[bytes]):
+        parts = parts if isinstance(parts, list) else list(parts)
+        self._reserve(sum(map(len, parts)))
+        self.file.writelines(parts)
+
+    def tell(self) -> int:
+        return self.file.tell()
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        return self.file.seek(offset, whence)
+
+    def read(self, size: int = -1) -> bytes:
+        return self.file.read(size)
+
+    def size(self) -> int:
+        """Tamaño total escrito (sin mover la posición actual)."""
+        position = self.file.tell()
+        end = self.file.seek(0, os.SEEK_END)
+        self.file.seek(position)
+        return end
+
+    def stripped_range(self) -> Tuple[int, int]:
+        """Rango [inicio, fin) del contenido sin espacios en blanco ASCII al principio ni al final (equivale a str.strip() para los bloques formateados)."""
+        end = self.size(); start = 0
+        while start < end:
+            self.file.seek(start)
+            chunk = self.file.read(min(COPY_CHUNK_SIZE, end - start))
+            stripped = chunk.lstrip(_WHITESPACE)
+            start += len(chunk) - len(stripped)
+            if stripped: break
+        while end > start:
+            size = min(COPY_CHUNK_SIZE, end - start)
+            self.file.seek(end - size)
+            chunk = self.file.read(size)
+            stripped = chunk.rstrip(_WHITESPACE)
+            end -= len(chunk) - len(stripped)
+            if stripped: break
+        self.file.seek(0, os.SEEK_END)
+        return start, end
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self) -> "SpillBuffer":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _copy_fd_range(src_fd: int, dst_fd: int, offset: int, count: int) -> int:
+    """Copia entre descriptores dentro del kernel (copy_file_range, si no sendfile). Devuelve los bytes copiados."""
+    copied = 0
+    for copy_function in (getattr(os, 'copy_file_range', None), getattr(os, 'sendfile', None)):
+        if copy_function is None: continue
+        try:
+            while copied < count:
+                if copy_function is os.sendfile: n = os.sendfile(dst_fd, src_fd, offset + copied, count - copied)
+                else: n = copy_function(src_fd, dst_fd, count - copied, offset + copied)
+                if not n: break
+                copied += n
+            return copied
+        except OSError:
+            continue # No soportado para este par de descriptores (ej: pipe, otro sistema de archivos)
+    return copied
+
+
+def copy_range(src: SpillBuffer, dst: BinaryIO, start: int, end: int):
+    """
+    Copia src[start:end] en dst sin construir strings Python: desde memoria con
+    un memoryview y, si src ya está en disco, con copy_file_range/sendfile
+    cuando dst tiene descriptor propio (lectura por bloques como último recurso).
+    """
+    if end <= start: return
+    if not src.spilled:
+        with src.file.getbuffer() as view: dst.write(view[start:end])
+        return
+    copied = 0
+    dst_fd = None
+    if not isinstance(dst, SpillBuffer):
+        try: dst_fd = dst.fileno()
+        except (AttributeError, OSError, io.UnsupportedOperation): dst_fd = None
+    if dst_fd is not None:
+        dst.flush()
+        copied = _copy_fd_range(src.file.fileno(), dst_fd, start, end - start)
+        try: dst.seek(0, os.SEEK_CUR) # Resincronizar la posición del objeto de archivo con la del descriptor
+        except (OSError, io.UnsupportedOperation): pass
+    position = start + copied
+    src.file.seek(position)
+    while position < end:
+        chunk = src.file.read(min(COPY_CHUNK_SIZE, end - position))
+        if not chunk: break
+        dst.write(chunk); position += len(chunk)
+    src.file.seek(0, os.SEEK_END)
@@ -0,0 +1,189 @@
+# tag_index.py
+import re
+import sys
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from file_handler import read_file_content
+from index_cache import IndexCache, get_default_cache
+from progress import CancellationToken, check_cancelled
+
+CACHE_NAMESPACE = "metadata-v1"
+# Claves del frontmatter con significado especial en Obsidian
+TAG_KEYS = ("tags", "tag")
+ALIAS_KEYS = ("aliases", "alias")
+
+_FRONTMATTER_RE = re.compile(r'\A---[ \t]*\r?\n(.*?)^(?:---|\.\.\.)[ \t]*$', re.DOTALL | re.MULTILINE)
+_FENCED_CODE_RE = re.compile(r'^ {0,3}(`{3,}|~{3,}).*?(?:^ {0,3}\1[`~]*[ \t]*$|\Z)', re.DOTALL | re.MULTILINE)
+_INLINE_CODE_RE = re.compile(r'`[^`\n]*`')
+# Etiqueta en línea: "#" al inicio o tras un espacio, con al menos un carácter no numérico
+_INLINE_TAG_RE = re.compile(r'(?<!\S)#([\w/-]*[^\W\d][\w/-]*)')
+_KEY_VALUE_RE = re.compile(r'^([^\s:#][^:]*?)[ \t]*:[ \t]*(.*?)[ \t]*$')
+_LIST_ITEM_RE = re.compile(r'^[ \t]+-[ \t]*(.*?)[ \t]*$|^-[ \t]+(.*?)[ \t]*$')
+
+
+def _clean_scalar(value: str) -> str:
+    """Quita comillas y comentarios finales de un valor YAML simple."""
+    value = value.strip()
+    if len(value) >= 2 and value[0] == value[-1] and value[0] in "\"'":
+        return value[1:-1]
+    return value.split(" #", 1)[0].strip()
+
+
+def parse_frontmatter(text: str) -> Dict[str, List[str]]:
+    """
+    Parsea el frontmatter YAML de una nota con un subconjunto de YAML suficiente
+    para las propiedades de Obsidian: "clave: valor", listas en línea
+    ("clave: [a, b]") y listas de bloque ("- a"). No requiere PyYAML.
+
+    Returns:
+        Diccionario clave (en minúsculas) -> lista de valores (strings).
+    """
+    match = _FRONTMATTER_RE.match(text)
+    if not match: return {}
+    fields: Dict[str, List[str]] = {}
+    current_key: Optional[str] = None
+    for line in match.group(1).splitlines():
+        if not line.strip() or line.lstrip().startswith('#'): continue
+        item = _LIST_ITEM_RE.match(line)
+        if item and current_key is not None:
+            value = _clean_scalar(item.group(1) if item.group(1) is not None else item.group(2))
+            if value: fields[current_key].append(value)
+            continue
+        key_value = _KEY_VALUE_RE.match(line.lstrip())
+        if not key_value: continue
+        if line[:1] in " \t": current_key = None; continue # Estructuras anidadas: no se indexan
+        current_key = _clean_scalar(key_value.group(1)).lower()
+        raw_value = key_value.group(2)
+        if raw_value.startswith('[') and raw_value.endswith(']'):
+            values = [_clean_scalar(v) for v in raw_value[1:-1].split(',')]
+        else:
+            values = [_clean_scalar(raw_value)]
+        fields[current_key] = [v for v in values if v]
+    return fields
+
+
+def _normalize_tag(tag: str) -> str:
+    return tag.strip().lstrip('#').strip('/').lower()
+
+
+def extract_metadata(text: str) -> Dict[str, object]:
+    """
+    Extrae etiquetas (en línea y del frontmatter), alias y demás propiedades.
+
+    Returns:
+        {"tags": [...], "aliases": [...], "fields": {clave: [valores]}}; las
+        etiquetas se normalizan sin "#" y en minúsculas.
+    """
+    fields = parse_frontmatter(text)
+    tags = set()
+    for key in TAG_KEYS:
+        for value in fields.get(key, []):
+            # "tags: a, b" o "tags: a b" en una sola línea
+            tags.update(_normalize_tag(t) for t in re.split(r'[,\s]+', value) if t.strip('#'))
+    aliases = [alias for key in ALIAS_KEYS for alias in fields.get(key, [])]
+
+    frontmatter = _FRONTMATTER_RE.match(text)
+    body = text[frontmatter.end():] if frontmatter else text
+    if '#' in body:
+        if '`' in body or '~~~' in body:
+            body = _INLINE_CODE_RE.sub('', _FENCED_CODE_RE.sub('', body))
+        tags.update(_normalize_tag(t) for t in _INLINE_TAG_RE.findall(body))
+    tags.discard('')
+    return {"tags": sorted(tags), "aliases": aliases, "fields": fields}
+
+
+def get_metadata(file_path: Path, cache: Optional[IndexCache] = None) -> Optional[Dict[str, object]]:
+    """Metadatos del archivo, leídos del índice persistente si el archivo no cambió."""
+    cache = cache or get_default_cache()
+    cached = cache.get(CACHE_NAMESPACE, file_path)
+    if cached is not None:
+        return cached
+    content = read_file_content(file_path)
+    if content is None:
+        return None
+    metadata = extract_metadata(content)
+    cache.put(CACHE_NAMESPACE, file_path, metadata)
+    return metadata
+
+
+def parse_where(expression: str) -> Tuple[str, str]:
+    """
+    Parsea un filtro "clave=valor" (la clave sin distinguir mayúsculas).
+
+    Raises:
+        ValueError: Si no tiene la forma clave=valor.
+    """
+    key, separator, value = expression.partition('=')
+    if not separator or not key.strip():
+        raise ValueError(f"Filtro inválido '{expression}' (formato: clave=valor)")
+    return key.strip().lower(), value.strip()
+
+
+def matches_filters(metadata: Dict[str, object], tags: List[str], where: List[Tuple[str, str]]) -> bool:
+    """
+    True si la nota cumple TODOS los filtros. Una etiqueta coincide también con
+    sus subetiquetas ("fisica" coincide con "fisica/mecanica"). En where, los
+    valores se comparan sin distinguir mayúsculas y basta con que coincida un
+    elemento si la propiedad es una lista; "tags" y "aliases" usan los valores
+    indexados.
+    """
+    note_tags = metadata.get("tags", [])
+    for tag in tags:
+        wanted = _normalize_tag(tag)
+        if not any(t == wanted or t.startswith(wanted + '/') for t in note_tags):
+            return False
+    fields = metadata.get("fields", {})
+    for key, value in where:
+        if key in TAG_KEYS: values = note_tags; value = _normalize_tag(value)
+        elif key in ALIAS_KEYS: values = metadata.get("aliases", [])
+        else: values = fields.get(key, [])
+        if not any(v.lower() == value.lower() for v in values):
+            return False
+    return True
+
+
+def filter_files(
+    file_paths: List[Path],
+    tags: Optional[List[str]] = None,
+    where: Optional[List[Tuple[str, str]]] = None,
+    cancel_token: Optional[CancellationToken] = None,
+) -> List[Path]:
+    """
+    Devuelve los archivos (en el mismo orden) cuyos metadatos cumplen los
+    filtros. Solo se leen los archivos nuevos o modificados desde la última
+    indexación; el resto se resuelve desde el índice.
+    """
+    if not tags and not where:
+        return file_paths
+    cache = get_default_cache()
+    selected: List[Path] = []
+    for file_path, metadata in zip(file_paths, cache.get_many(CACHE_NAMESPACE, file_paths)):
+        check_cancelled(cancel_token)
+        if metadata is None: metadata = get_metadata(file_path, cache) # Nuevo o modificado: reindexar
+        if metadata is not None and matches_filters(metadata, tags or [], where or []):
+            selected.append(file_path)
+    cache.flush()
+    print(f"Notas que cumplen los filtros de etiquetas/propiedades: {len(selected)} de {len(file_paths)}", file=sys.stderr)
+    return selected
+
+
+def filter_files_indexed(
+    file_paths: List[Path],
+    tags: Optional[List[str]] = None,
+    where: Optional[List[Tuple[str, str]]] = None,
+) -> Tuple[List[Path], int]:
+    """
+    Como filter_files, pero sin abrir ningún archivo: usa solo el índice. Las
+    notas sin metadatos indexados (nuevas o modificadas) se conservan.
+
+    Returns:
+        Tupla (archivos_seleccionados, número_de_archivos_sin_indexar).
+    """
+    if not tags and not where:
+        return file_paths, 0
+    selected: List[Path] = []; unindexed = 0
+    for file_path, metadata in zip(file_paths, get_default_cache().get_many(CACHE_NAMESPACE, file_paths)):
+        if metadata is None: unindexed += 1; selected.append(file_path)
+        elif matches_filters(metadata, tags or [], where or []): selected.append(file_path)
+    return selected, unindexed
@@ -0,0 +1,50 @@
+# tests/conftest.py
+import sys
+from pathlib import Path
+
+import pytest
+
+# Los módulos del proyecto están en la raíz del repositorio (sin paquete)
+REPO_ROOT = Path(__file__).resolve().parent.parent
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+import index_cache  # noqa: E402
+
+
+def pytest_addoption(parser):
+    parser.addoption("--benchmark", action="store_true", default=False, help="Ejecuta también los tests de rendimiento (marcados con benchmark).")
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "benchmark: test de tiempo de reloj; solo se ejecuta con --benchmark")
+
+
+def pytest_collection_modifyitems(config, items):
+    """Los benchmarks dependen de la carga de la máquina: se omiten salvo con --benchmark."""
+    if config.getoption("--benchmark"): return
+    skip_benchmark = pytest.mark.skip(reason="benchmark: usar --benchmark para ejecutarlo")
+    for item in items:
+        if "benchmark" in item.keywords: item.add_marker(skip_benchmark)
+
+
+@pytest.fixture(autouse=True)
+def isolated_cache(tmp_path, monkeypatch):
+    """Caché persistente en un directorio temporal, para no tocar la del repositorio."""
+    monkeypatch.setattr(index_cache, "get_cache_path", lambda: tmp_path / index_cache.CACHE_FILENAME)
+    return tmp_path / index_cache.CACHE_FILENAME
+
+
+@pytest.fixture
+def vault(tmp_path):
+    """Crea una bóveda en tmp_path/vault a partir de {ruta relativa: contenido}."""
+    def make(files):
+        root = tmp_path / "vault"
+        root.mkdir(exist_ok=True)
+        for relative, content in files.items():
+            path = root / relative
+            path.parent.mkdir(parents=True, exist_ok=True)
+            if isinstance(content, bytes): path.write_bytes(content)
+            else: path.write_text(content, encoding="utf-8", newline="")
+        return root
+    return make
@@ -0,0 +1,89 @@
+# tests/test_cli.py
+import json
+import sys
+
+import pytest
+
+import config_handler
+import main
+import tree_generator
+
+TEMPLATE = "Inicio\n{contexto_extraido}\nFin\n"
+
+
+@pytest.fixture
+def cli(tmp_path, monkeypatch):
+    """Ejecuta main.main() con una configuración temporal; devuelve (código de salida, prompt escrito)."""
+    config_path = tmp_path / "config.json"
+    monkeypatch.setattr(config_handler, "get_config_path", lambda: config_path)
+    template = tmp_path / "plantilla.txt"; template.write_text(TEMPLATE, encoding="utf-8")
+    output = tmp_path / "prompt.txt"
+    def run(vaults, *argv):
+        config_path.write_text(json.dumps({"vaults": {name: str(path) for name, path in vaults.items()}, "last_vault_name": None}), encoding="utf-8")
+        output.unlink(missing_ok=True)
+        monkeypatch.setattr(sys, "argv", ["main.py", "--template", str(template), "--output", str(output), *argv])
+        try: main.main(); code = 0
+        except SystemExit as e: code = e.code or 0
+        return code, output.read_text(encoding="utf-8") if output.exists() else None
+    return run
+
+
+def _two_vaults(tmp_path):
+    vaults = {}
+    for name in ("Notas", "Código"):
+        root = tmp_path / name
+        for relative in ("dentro/a.md", "fuera/b.md"):
+            (root / relative).parent.mkdir(parents=True, exist_ok=True); (root / relative).write_text(f"{name} {relative}\n", encoding="utf-8")
+        vaults[name] = root
+    return vaults
+
+
+def test_single_select_vault_accepts_prefixed_targets(cli, tmp_path):
+    vaults = _two_vaults(tmp_path)
+    code, prefixed = cli(vaults, "--select-vault", "Notas", "--target", "Notas::dentro", "--output-mode", "content")
+    assert code == 0
+    assert "Notas dentro/a.md" in prefixed and "fuera/b.md" not in prefixed
+    assert cli(vaults, "--select-vault", "Notas", "--target", "dentro", "--output-mode", "content") == (0, prefixed)
+
+
+def test_single_select_vault_rejects_other_vault_prefix(cli, tmp_path, capsys):
+    code, prompt = cli(_two_vaults(tmp_path), "--select-vault", "Notas", "--target", "Código::dentro")
+    assert code == 1 and prompt is None
+    assert "no está seleccionada" in capsys.readouterr().err
+
+
+def test_multiple_select_vault_splits_prefixed_targets(cli, tmp_path):
+    code, prompt = cli(_two_vaults(tmp_path), "--select-vault", "Notas", "--select-vault", "Código", "--target", "Notas::dentro", "--output-mode", "content")
+    assert code == 0
+    assert "Notas dentro/a.md" in prompt and "Notas fuera/b.md" not in prompt
+    assert "Código dentro/a.md" in prompt and "Código fuera/b.md" in prompt # Sin targets propios: bóveda completa
+
+
+def test_zero_limits_mean_unlimited(cli, tmp_path):
+    vaults = _two_vaults(tmp_path)
+    code, unlimited = cli(vaults, "--select-vault", "Notas", "--output-mode", "tree")
+    assert code == 0 and "a.md" in unlimited
+    for option in ("--tree-max-depth", "--tree-collapse", "--scan-workers", "--max-file-lines"):
+        assert cli(vaults, "--select-vault", "Notas", "--output-mode", "tree", option, "0") == (0, unlimited)
+
+
+@pytest.mark.parametrize("option", ["--tree-max-depth", "--tree-collapse", "--scan-workers", "--max-file-lines"])
+def test_negative_limits_are_rejected(cli, tmp_path, capsys, option):
+    code, prompt = cli(_two_vaults(tmp_path), "--select-vault", "Notas", option, "-1")
+    assert code == 2 and prompt is None
+    assert option in capsys.readouterr().err
+
+
+def test_tree_depth_zero_does_not_collapse_root(tmp_path):
+    files = [tmp_path / "dir" / "a.md"]
+    assert tree_generator.generate_tree_string(files, tmp_path, max_depth=0) == tree_generator.generate_tree_string(files, tmp_path)
+
+
+def test_repeated_template_flags_are_all_used(cli, tmp_path):
+    extra = [tmp_path / "segunda.txt", tmp_path / "tercera.txt"]
+    for path in extra: path.write_text(f"{path.stem}\n{{contexto_extraido}}\n", encoding="utf-8")
+    code, _ = cli(_two_vaults(tmp_path), "--select-vault", "Notas", "--output-mode", "content", "--template", str(extra[0]), "--template", str(extra[1]))
+    assert code == 0
+    prompts = {name: (tmp_path / f"prompt_{name}.txt").read_text(encoding="utf-8") for name in ("plantilla", "segunda", "tercera")}
+    assert prompts["plantilla"].startswith("Inicio\n") and prompts["segunda"].startswith("segunda\n") and prompts["tercera"].startswith("tercera\n")
+    assert all("Notas dentro/a.md" in prompt for prompt in prompts.values())
@@ -0,0 +1,38 @@
+# tests/test_dir_index.py
+import os
+
+import dir_index
+import index_cache
+
+
+def _entries(root, cache, relative_dir="", **kwargs):
+    return {entry.name: entry for entry in dir_index.list_directory(root, relative_dir, [".md"], cache=cache, **kwargs)}
+
+
+def test_in_place_edit_updates_cached_size(vault, tmp_path):
+    root = vault({"A/nota.md": "corto", "A/otra.md": "x"})
+    cache = index_cache.IndexCache(tmp_path / "cache.sqlite3")
+    assert _entries(root, cache, "A")["nota.md"].total_bytes == 5
+    directory_mtime = os.stat(root / "A").st_mtime_ns
+    (root / "A" / "nota.md").write_text("bastante más largo")
+    os.utime(root / "A", ns=(directory_mtime, directory_mtime)) # El directorio no cambia al editar un archivo
+    assert _entries(root, cache, "A")["nota.md"].total_bytes == len("bastante más largo".encode("utf-8"))
+    assert _entries(root, cache)["A"].total_bytes == len("bastante más largo".encode("utf-8")) + 1
+
+
+def test_listing_reads_only_one_level_below(vault, tmp_path, monkeypatch):
+    root = vault({f"A/B{i}/C/D/nota.md": "x" for i in range(3)} | {"A/directa.md": "xy"})
+    cache = index_cache.IndexCache(tmp_path / "cache.sqlite3")
+    listed = []
+    real_scandir = os.scandir
+    monkeypatch.setattr(os, "scandir", lambda path: listed.append(os.path.relpath(path, root)) or real_scandir(path))
+    entries = _entries(root, cache)
+    assert sorted(listed) == [".", "A"]
+    assert (entries["A"].file_count, entries["A"].total_bytes, entries["A"].dir_count) == (1, 2, 3)
+
+
+def test_subtree_totals_on_request(vault, tmp_path):
+    root = vault({f"A/B{i}/C/nota.md": "xyz" for i in range(3)} | {"A/directa.md": "xy", "A/ignorado.txt": "zzzz"})
+    cache = index_cache.IndexCache(tmp_path / "cache.sqlite3")
+    entry = _entries(root, cache, subtree_totals=True)["A"]
+    assert (entry.file_count, entry.total_bytes) == (4, 11)
@@ -0,0 +1,77 @@
+# tests/test_formatter.py
+import io
+import time
+
+import pytest
+
+import formatter
+
+
+def _fast(path, root, **limits):
+    out = io.BytesIO()
+    formatter.write_file_content(out, path, root, **limits)
+    return out.getvalue().decode("utf-8")
+
+
+@pytest.mark.parametrize("content", [
+    "uno\ndos\ntres\n",
+    "uno\r\ndos\r\n\r\n",
+    "  \n\tsangría\nfinal sin salto",
+    "",
+    "ñandú €\n" * 50,
+])
+def test_fast_path_matches_str_path(vault, content):
+    root = vault({"nota.md": content})
+    assert _fast(root / "nota.md", root) == formatter.format_file_content(root / "nota.md", root)
+
+
+def test_exact_line_limit_stays_on_fast_path(vault, monkeypatch):
+    root = vault({"nota.md": "a\nb\nc\n", "sin_salto.md": "a\nb\nc"})
+    def fail(*args, **kwargs): raise AssertionError("no debería delegar en format_file_content")
+    expected = {name: formatter.format_file_content(root / name, root) for name in ("nota.md", "sin_salto.md")}
+    monkeypatch.setattr(formatter, "format_file_content", fail)
+    for name, block in expected.items():
+        assert _fast(root / name, root, max_file_lines=3) == block
+
+
+def test_over_line_limit_is_sampled_without_full_read(vault, monkeypatch):
+    monkeypatch.setattr(formatter, "LINE_LIMIT_CHUNK_SIZE", 16)
+    root = vault({"nota.md": "".join(f"{i}\n" for i in range(1, 1001))})
+    reads = []
+    real_read = formatter._read_within_lines
+    monkeypatch.setattr(formatter, "_read_within_lines", lambda path, limit: reads.append(real_read(path, limit)))
+    block = _fast(root / "nota.md", root, max_file_lines=4)
+    assert reads == [None]
+    assert block == formatter.format_file_content(root / "nota.md", root, max_file_lines=4)
+    assert "líneas 3-998 omitidas" in block
+
+
+def test_read_within_lines_stops_early(tmp_path, monkeypatch):
+    monkeypatch.setattr(formatter, "LINE_LIMIT_CHUNK_SIZE", 8)
+    path = tmp_path / "grande.txt"
+    path.write_bytes(b"x\n" * 10000)
+    read_sizes = []
+    class TrackingFile(io.FileIO):
+        def read(self, size=-1):
+            data = super().read(size); read_sizes.append(len(data)); return data
+    monkeypatch.setattr(formatter, "open", lambda path, mode: TrackingFile(path, "r"), raising=False)
+    assert formatter._read_within_lines(path, 10) is None
+    assert sum(read_sizes) <= 32 # Se dejó de leer tras unos pocos bloques
+
+
+@pytest.mark.benchmark
+def test_fast_path_throughput(vault):
+    """Benchmark: la ruta rápida debe ser claramente más rápida que la basada en str (medido ~2×)."""
+    line = "- [ ] Tarea con algo de texto, un [[enlace]] y acentos: canción, pingüino\n"
+    root = vault({"grande.md": line * 40000}) # ~3 MB
+    path = root / "grande.md"
+
+    def best_of(function, repeats=5):
+        timings = []
+        for _ in range(repeats):
+            start = time.perf_counter(); function(); timings.append(time.perf_counter() - start)
+        return min(timings)
+
+    str_time = best_of(lambda: formatter.format_file_content(path, root).encode("utf-8"))
+    fast_time = best_of(lambda: formatter.write_file_content(io.BytesIO(), path, root))
+    assert str_time / fast_time > 1.4
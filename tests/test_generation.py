@@ -0,0 +1,64 @@
+# tests/test_generation.py
+import asyncio
+import io
+
+import async_core
+import core
+import redaction
+
+TEMPLATE = "Inicio\n{contexto_extraido}\nFin\n"
+
+
+def _notes(vault):
+    return vault({
+        "A/uno.md": "# Uno\ncorreo: ana@example.com\n" + "".join(f"línea {i}\n" for i in range(30)),
+        "A/dos.md": "# Dos\ntexto\n",
+        "B/tres.md": "# Tres\n![[dos]]\n",
+    })
+
+
+def _options(**overrides):
+    values = dict(max_file_lines=6, redactor=redaction.Redactor.from_config({}), transclusion_depth=1, use_git_index=False)
+    values.update(overrides)
+    return core.GenerationOptions(**values)
+
+
+def test_async_matches_sync(vault):
+    root = _notes(vault)
+    for output_mode in ("both", "content", "outline", "tree"):
+        sync_prompt = core.generate_prompt_core(root, [], [".md"], output_mode, None, TEMPLATE, _options())
+        async_prompt = asyncio.run(async_core.generate_prompt_async(root, [], [".md"], output_mode, None, TEMPLATE, _options()))
+        assert async_prompt == sync_prompt
+    assert "ana@example.com" not in sync_prompt
+
+
+def test_streaming_matches_in_memory(vault):
+    root = _notes(vault)
+    in_memory = core.generate_prompt_core(root, [], [".md"], "both", None, TEMPLATE, _options())
+    out = io.BytesIO()
+    assert core.generate_prompt_core(root, [], [".md"], "both", None, TEMPLATE, _options(), output_stream=out, max_memory=64) is None
+    assert out.getvalue().decode("utf-8") == in_memory
+
+
+def test_options_apply_to_selection_and_estimate(vault):
+    root = _notes(vault)
+    options = _options(excluded_extensions=[], max_files=1, selection_sort="name")
+    files, _ = core.select_files(root, [], [".md"], options)
+    assert [path.name for path in files] == ["dos.md"]
+    assert core.estimate_selection(root, [], [".md"], "both", options).files == 1
+
+
+def test_iter_context_blocks_yields_formatted_blocks(vault):
+    root = _notes(vault)
+    async def collect():
+        return [block async for block in async_core.iter_context_blocks(root, ["A"], [".md"], options=_options(transclusion_depth=None))]
+    blocks = asyncio.run(collect())
+    assert [block.split("\n")[2] for block in blocks] == ["/A/dos.md:", "/A/uno.md:"]
+
+
+def test_extractors_are_opt_in(vault):
+    root = vault({"dibujo.excalidraw.md": "---\nexcalidraw-plugin: parsed\n---\nTexto del dibujo\n%%\n# Drawing\n```json\n{\"type\": \"excalidraw\"}\n```\n%%\n"})
+    raw = core.generate_prompt_core(root, [], [".md"], "content", None, TEMPLATE, _options())
+    extracted = core.generate_prompt_core(root, [], [".md"], "content", None, TEMPLATE, _options(use_extractors=True))
+    assert '"type": "excalidraw"' in raw and "excalidraw-plugin" in raw # Por defecto, tal cual
+    assert "Texto del dibujo" in extracted and '"type": "excalidraw"' not in extracted
@@ -0,0 +1,78 @@
+# tests/test_git_index.py
+import shutil
+import subprocess
+import time
+
+import pytest
+
+import file_handler
+
+pytestmark = pytest.mark.skipif(shutil.which("git") is None, reason="git no está instalado")
+
+FILES = {"a.md": "a", "Proyectos/b.md": "b", "Proyectos/sub/c.md": "c", "Diario/2024 enero.md": "d", "Diario/adjunto.pdf": "x", "raíz ñ.md": "e"}
+
+
+def _git(root, *args):
+    subprocess.run(["git", "-C", str(root), "-c", "user.name=t", "-c", "user.email=t@t", *args], check=True, capture_output=True)
+
+
+def _find(root, targets=(), **kwargs):
+    return file_handler.find_relevant_files(root, list(targets), [".md"], **kwargs)
+
+
+def _repo(vault, files=FILES):
+    root = vault(files)
+    _git(root, "init", "-q"); _git(root, "add", "-A"); _git(root, "commit", "-q", "-m", "inicial")
+    return root
+
+
+@pytest.mark.parametrize("targets", [(), ("Proyectos",), ("Diario", "a.md")])
+def test_git_listing_matches_walker(vault, targets):
+    root = _repo(vault)
+    assert file_handler._list_git_files(root, []) is not None
+    assert _find(root, targets, use_git_index=True) == _find(root, targets, use_git_index=False)
+
+
+def test_git_listing_respects_untracked_and_deleted(vault):
+    root = _repo(vault)
+    (root / "nuevo.md").write_text("n", encoding="utf-8"); (root / "a.md").unlink()
+    walker = _find(root, use_git_index=False)
+    assert _find(root, use_git_index=True, git_untracked=True) == walker
+    assert _find(root, use_git_index=True) == [path for path in walker if path.name != "nuevo.md"]
+
+
+def test_git_listing_requires_vault_at_repository_root(vault):
+    repo = _repo(vault, {f"bóveda/{name}": content for name, content in FILES.items()})
+    assert file_handler._list_git_files(repo / "bóveda", []) is None
+    assert _find(repo / "bóveda", use_git_index=True) == _find(repo / "bóveda", use_git_index=False)
+
+
+def test_git_listing_falls_back_without_tracked_files(vault):
+    root = vault(FILES)
+    _git(root, "init", "-q")
+    assert file_handler._list_git_files(root, []) is None
+    assert len(_find(root, use_git_index=True)) == 5
+
+
+def test_git_listing_is_opt_in(vault, monkeypatch):
+    root = _repo(vault)
+    monkeypatch.setattr(file_handler, "_list_git_files", lambda *args: pytest.fail("git no debería usarse por defecto"))
+    assert len(_find(root)) == 5
+
+
+@pytest.mark.benchmark
+def test_git_listing_is_faster_with_targets(vault):
+    """Benchmark: con 3 carpetas como targets, git ls-files (limitado a ellas) debe ganar al recorrido de toda la bóveda."""
+    root = _repo(vault, {f"d{d:02}/s{s}/n{n}.md": "x" for d in range(40) for s in range(5) for n in range(50)}) # 10.000 notas
+    targets = ("d01", "d17", "d33")
+
+    def best_of(function, repeats=3):
+        timings = []
+        for _ in range(repeats):
+            start = time.perf_counter(); result = function(); timings.append(time.perf_counter() - start)
+        return result, min(timings)
+
+    walked, walk_time = best_of(lambda: _find(root, targets, use_git_index=False))
+    listed, git_time = best_of(lambda: _find(root, targets, use_git_index=True))
+    assert listed == walked and len(listed) == 3 * 5 * 50
+    assert walk_time / git_time > 2
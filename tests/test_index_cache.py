@@ -0,0 +1,42 @@
+# tests/test_index_cache.py
+import sqlite3
+
+import index_cache
+
+
+def _committed_rows(db_path):
+    """Filas visibles desde otra conexión (solo las ya confirmadas)."""
+    with sqlite3.connect(str(db_path)) as conn:
+        return conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+
+def test_put_value_commits_every_n_writes(tmp_path, monkeypatch):
+    monkeypatch.setattr(index_cache, "COMMIT_EVERY", 4)
+    cache = index_cache.IndexCache(tmp_path / "cache.sqlite3")
+    for i in range(3): cache.put_value("ns", f"clave{i}", i)
+    assert _committed_rows(cache.db_path) == 0
+    cache.put_value("ns", "clave3", 3)
+    assert _committed_rows(cache.db_path) == 4
+    cache.put_value("ns", "clave4", 4)
+    cache.flush()
+    assert _committed_rows(cache.db_path) == 5
+
+
+def test_put_commits_every_n_writes(tmp_path, monkeypatch):
+    monkeypatch.setattr(index_cache, "COMMIT_EVERY", 2)
+    cache = index_cache.IndexCache(tmp_path / "cache.sqlite3")
+    notes = [tmp_path / f"n{i}.md" for i in range(2)]
+    for note in notes: note.write_text("x")
+    for note in notes: cache.put("ns", note, {"ok": True})
+    assert _committed_rows(cache.db_path) == 2
+
+
+def test_get_is_invalidated_by_changes(tmp_path):
+    cache = index_cache.IndexCache(tmp_path / "cache.sqlite3")
+    note = tmp_path / "nota.md"
+    note.write_text("uno")
+    cache.put("ns", note, [1])
+    assert cache.get("ns", note) == [1]
+    note.write_text("uno dos")
+    assert cache.get("ns", note) is None
+    assert cache.get_value("ns", "otra") is None
@@ -0,0 +1,86 @@
+# tests/test_line_ranges.py
+import io
+
+import pytest
+
+import file_handler
+import formatter
+import index_cache
+from file_handler import LineRange
+
+
+def _numbered(count):
+    return "".join(f"línea {i}\n" for i in range(1, count + 1))
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("120-260", LineRange(120, 260)), ("7", LineRange(7, 7)), ("5-", LineRange(5, None)), (" 3-3 ", LineRange(3, 3)),
+    ("0-4", None), ("9-2", None), ("abc", None), ("-5", None), ("", None),
+])
+def test_parse_line_range(text, expected):
+    assert file_handler.parse_line_range(text) == expected
+
+
+def test_split_line_range_keeps_paths_without_range():
+    assert file_handler.split_line_range("src/app.py:120-260") == ("src/app.py", LineRange(120, 260))
+    assert file_handler.split_line_range("C:/notas/a.md:3") == ("C:/notas/a.md", LineRange(3, 3))
+    assert file_handler.split_line_range("nota: borrador.md") == ("nota: borrador.md", None)
+    assert file_handler.split_line_range(":10") == (":10", None)
+
+
+@pytest.mark.parametrize("line_range", [
+    LineRange(1, 1), LineRange(1, 3), LineRange(255, 258), LineRange(256, 257), LineRange(700, None), LineRange(999, 1005), LineRange(1001, 1002),
+])
+def test_read_line_range_matches_slice(tmp_path, line_range):
+    path = tmp_path / "largo.md"
+    path.write_text(_numbered(1000), encoding="utf-8")
+    lines = _numbered(1000).splitlines(keepends=True)
+    expected = "".join(lines[line_range.first - 1:line_range.last])
+    cache = index_cache.IndexCache(tmp_path / "cache.sqlite3")
+    assert file_handler.read_line_range(path, line_range, cache) == expected
+    assert file_handler.read_line_range(path, line_range, cache) == expected # Segunda vez, desde el índice de offsets
+
+
+def test_read_line_range_reuses_offset_index(tmp_path, monkeypatch):
+    monkeypatch.setattr(file_handler, "SAMPLE_CHUNK_SIZE", 64)
+    path = tmp_path / "largo.md"
+    path.write_text(_numbered(2000), encoding="utf-8")
+    cache = index_cache.IndexCache(tmp_path / "cache.sqlite3")
+    assert file_handler.read_line_range(path, LineRange(1800, 1801), cache) == "línea 1800\nlínea 1801\n"
+    assert len(cache.get(file_handler.LINE_INDEX_NAMESPACE, path)) == 2000 // file_handler.LINE_INDEX_STRIDE + 1
+    read_sizes = []
+    class TrackingFile(io.FileIO):
+        def read(self, size=-1):
+            data = super().read(size); read_sizes.append(len(data)); return data
+    monkeypatch.setattr(file_handler, "open", lambda path, mode: TrackingFile(path, "r"), raising=False)
+    assert file_handler.read_line_range(path, LineRange(1900, 1900), cache) == "línea 1900\n"
+    assert sum(read_sizes) < path.stat().st_size // 10 # Salta al punto de control de la línea 1793, no recorre desde el principio
+
+
+def test_read_line_range_stops_after_range(tmp_path, monkeypatch):
+    monkeypatch.setattr(file_handler, "SAMPLE_CHUNK_SIZE", 64)
+    path = tmp_path / "largo.md"
+    path.write_text(_numbered(5000), encoding="utf-8")
+    read_sizes = []
+    class TrackingFile(io.FileIO):
+        def read(self, size=-1):
+            data = super().read(size); read_sizes.append(len(data)); return data
+    monkeypatch.setattr(file_handler, "open", lambda path, mode: TrackingFile(path, "r"), raising=False)
+    assert file_handler.read_line_range(path, LineRange(2, 4), index_cache.IndexCache(tmp_path / "cache.sqlite3")) == "línea 2\nlínea 3\nlínea 4\n"
+    assert sum(read_sizes) < 300
+
+
+def test_split_section_targets_with_line_range(vault):
+    root = vault({"src/app.py": _numbered(10), "raro:1-2.md": "x\n"})
+    targets, sections = file_handler.split_section_targets(root, ["src/app.py:3-5", "src/app.py:8", "raro:1-2.md", "falta.py:1-2"])
+    assert targets == ["src/app.py", "src/app.py", "raro:1-2.md", "falta.py:1-2"]
+    assert sections == {"src/app.py": [":3-5", ":8"]}
+
+
+def test_format_file_content_keeps_original_numbering(vault):
+    root = vault({"src/app.py": _numbered(1200)})
+    block = formatter.format_file_content(root / "src/app.py", root, line_range=LineRange(998, 1001))
+    body = block.split(f"{formatter.SEPARATOR}\n")[2].splitlines()
+    assert "/src/app.py:998-1001:" in block
+    assert body == [" 998 | línea 998", " 999 | línea 999", "1000 | línea 1000", "1001 | línea 1001"]
+    assert "(Rango fuera del archivo)" in formatter.format_file_content(root / "src/app.py", root, line_range=LineRange(5000, None))
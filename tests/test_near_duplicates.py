@@ -0,0 +1,62 @@
+# tests/test_near_duplicates.py
+import random
+from pathlib import Path
+
+import near_duplicates
+from near_duplicates import LSH_ROWS, SIGNATURE_BINS, estimate_similarity
+
+
+def _with_signatures(monkeypatch, signatures):
+    """find_near_duplicates sobre rutas ficticias con firmas fijadas."""
+    paths = [Path(name) for name in signatures]
+    monkeypatch.setattr(near_duplicates, "get_signature", lambda path: signatures[path.name])
+    return paths
+
+
+def _changed(signature, bins, offset=1000):
+    return [value + offset if index in bins else value for index, value in enumerate(signature)]
+
+
+def test_members_of_a_shared_bucket_are_compared_with_each_other(monkeypatch):
+    a = list(range(SIGNATURE_BINS))
+    b = _changed(a, set(range(LSH_ROWS, SIGNATURE_BINS))) # Solo comparte con A la banda 0
+    c = _changed(b, {band * LSH_ROWS for band in range(1, SIGNATURE_BINS // LSH_ROWS)}, offset=5000) # Con B, también solo la banda 0
+    assert estimate_similarity(a, b) < 0.7 <= estimate_similarity(b, c)
+    paths = _with_signatures(monkeypatch, {"a.md": a, "b.md": b, "c.md": c})
+    kept, groups = near_duplicates.find_near_duplicates(paths, 0.7)
+    assert kept == [Path("a.md"), Path("b.md")]
+    assert groups == [(Path("b.md"), [Path("c.md")])]
+
+
+def test_groups_do_not_chain_through_a_middle_note(monkeypatch):
+    a = list(range(SIGNATURE_BINS))
+    b = _changed(a, set(range(0, 10)))
+    c = _changed(b, set(range(10, 20)))
+    assert estimate_similarity(a, b) >= 0.8 and estimate_similarity(b, c) >= 0.8 > estimate_similarity(a, c)
+    paths = _with_signatures(monkeypatch, {"a.md": a, "b.md": b, "c.md": c})
+    kept, groups = near_duplicates.find_near_duplicates(paths, 0.8)
+    assert kept == [Path("a.md"), Path("c.md")]
+    assert groups == [(Path("a.md"), [Path("b.md")])]
+
+
+def test_every_duplicate_resembles_its_representative(monkeypatch):
+    rng = random.Random(3)
+    base = [rng.randrange(1 << 40) for _ in range(SIGNATURE_BINS)]
+    signatures = {}
+    for i in range(200): # Variantes de una misma firma: muchos pares por encima y por debajo del umbral
+        signatures[f"n{i:03}.md"] = _changed(base, set(rng.sample(range(SIGNATURE_BINS), rng.randrange(0, 30))), offset=rng.randrange(1, 1 << 20))
+    paths = _with_signatures(monkeypatch, signatures)
+    kept, groups = near_duplicates.find_near_duplicates(paths, 0.8)
+    assert len(kept) + sum(len(group.duplicates) for group in groups) == len(paths)
+    for representative, duplicates in groups:
+        assert representative in kept
+        for duplicate in duplicates: assert estimate_similarity(signatures[representative.name], signatures[duplicate.name]) >= 0.8
+
+
+def test_near_identical_notes_are_grouped(vault):
+    text = " ".join(f"palabra{i}" for i in range(300))
+    root = vault({"a.md": text, "b.md": text + " final", "c.md": " ".join(f"otra{i}" for i in range(300)), "corta.md": "hola"})
+    files = sorted(root.glob("*.md"))
+    kept, groups = near_duplicates.find_near_duplicates(files, 0.8)
+    assert [path.name for path in kept] == ["a.md", "c.md", "corta.md"]
+    assert [(group.representative.name, [path.name for path in group.duplicates]) for group in groups] == [("a.md", ["b.md"])]
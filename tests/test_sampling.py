@@ -0,0 +1,62 @@
+# tests/test_sampling.py
+import file_handler
+import formatter
+
+
+def _numbered(text):
+    """Líneas numeradas del bloque formateado (sin cabecera ni pie)."""
+    return [line for line in text.splitlines() if " | " in line]
+
+
+def test_line_cap_is_shared_between_head_and_tail(vault):
+    root = vault({"nota.md": "".join(f"línea {i}\n" for i in range(1, 21))})
+    for max_lines in (1, 2, 3, 7):
+        sample = file_handler.read_file_sampled(root / "nota.md", max_lines=max_lines)
+        shown = sample.head.splitlines() + sample.tail.splitlines()
+        assert len(shown) == max_lines
+        assert sample.tail_start_line - 1 - len(sample.head.splitlines()) == sample.elided_lines
+
+
+def test_single_line_cap_shows_one_line(vault):
+    root = vault({"nota.md": "uno\ndos\ntres"})
+    block = formatter.format_file_content(root / "nota.md", root, max_file_lines=1)
+    lines = _numbered(block)
+    assert lines[0].endswith("| uno")
+    assert "líneas 2-3 omitidas" in lines[1]
+    assert len(lines) == 2
+
+
+def test_tail_keeps_original_line_numbers(vault):
+    root = vault({"nota.md": "".join(f"l{i}\n" for i in range(1, 11))})
+    block = formatter.format_file_content(root / "nota.md", root, max_file_lines=4)
+    lines = _numbered(block)
+    assert [line.split(" | ")[1] for line in lines if "omitidas" not in line] == ["l1", "l2", "l9", "l10"]
+    assert lines[3].startswith("  9 |")
+
+
+def test_cut_inside_long_line_is_marked(vault):
+    root = vault({"nota.md": "a" * 100 + "\n" + "b" * 100 + "\n"})
+    sample = file_handler.read_file_sampled(root / "nota.md", max_bytes=20)
+    assert sample.head == "a" * 10 + "…"
+    assert sample.tail == "…" + "b" * 9 + "\n"
+    assert sample.tail_start_line == 2 and sample.elided_lines == 0
+
+
+def test_multibyte_cut_does_not_fall_back_to_latin1(vault):
+    root = vault({"nota.md": "ñ" * 500})
+    sample = file_handler.read_file_sampled(root / "nota.md", max_bytes=101)
+    assert set(sample.head.rstrip("…")) == {"ñ"}
+    assert set(sample.tail.lstrip("…")) == {"ñ"}
+    assert len(sample.head.encode("utf-8")) <= 51 + len("…".encode("utf-8"))
+
+
+def test_latin1_file_still_decodes(vault):
+    root = vault({"nota.md": ("café\n" * 200).encode("latin-1")})
+    sample = file_handler.read_file_sampled(root / "nota.md", max_lines=2)
+    assert sample.head == "café\n" and sample.tail == "café\n"
+
+
+def test_within_limits_returns_whole_file(vault):
+    root = vault({"nota.md": "uno\ndos\n"})
+    sample = file_handler.read_file_sampled(root / "nota.md", max_bytes=100, max_lines=2)
+    assert sample.tail is None and sample.head == "uno\ndos\n"
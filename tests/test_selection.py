@@ -0,0 +1,66 @@
+# tests/test_selection.py
+import os
+import random
+
+import pytest
+
+import file_handler
+
+
+def _vault_with_stats(vault, count=60, seed=7):
+    """Notas con tamaños y mtimes aleatorios, con empates a propósito (el desempate es la ruta)."""
+    rng = random.Random(seed)
+    root = vault({f"d{i % 4}/n{i:03}.md": "x" * rng.randrange(1, 8) for i in range(count)})
+    for path in root.rglob("*.md"):
+        mtime_ns = rng.randrange(1, 6) * 1_000_000_000 + 1_600_000_000 * 1_000_000_000
+        os.utime(path, ns=(mtime_ns, mtime_ns))
+    return root
+
+
+def _full_sort(files, root, sort):
+    """Referencia: orden completo por el criterio, desempatando por ruta relativa."""
+    def key(path):
+        relative = path.relative_to(root).as_posix(); st = path.stat()
+        return {"name": (relative,), "mtime": (-st.st_mtime_ns, relative), "size": (-st.st_size, relative)}[sort]
+    return sorted(files, key=key)
+
+
+@pytest.mark.parametrize("sort", file_handler.SELECTION_SORTS)
+@pytest.mark.parametrize("max_files", [1, 7, 60, 100])
+def test_select_top_files_matches_full_sort(vault, sort, max_files):
+    root = _vault_with_stats(vault)
+    files = sorted(root.rglob("*.md"))
+    expected = sorted(_full_sort(files, root, sort)[:max_files])
+    assert file_handler.select_top_files(iter(files), root, max_files, sort) == expected # Acepta un iterador
+    assert file_handler.select_top_files(reversed(files), root, max_files, sort) == expected # No depende del orden de entrada
+
+
+@pytest.mark.parametrize("sort", file_handler.SELECTION_SORTS)
+def test_find_relevant_files_max_files(vault, sort):
+    root = _vault_with_stats(vault)
+    for targets in ([], ["d1", "d3"]):
+        everything = file_handler.find_relevant_files(root, targets, [".md"])
+        selected = file_handler.find_relevant_files(root, targets, [".md"], max_files=5, selection_sort=sort)
+        assert selected == sorted(_full_sort(everything, root, sort)[:5])
+
+
+def test_invalid_sort_is_rejected_before_walking(vault, monkeypatch):
+    root = _vault_with_stats(vault, count=3)
+    monkeypatch.setattr(file_handler.Path, "rglob", lambda *args: pytest.fail("no debería recorrer"))
+    with pytest.raises(ValueError):
+        file_handler.find_relevant_files(root, [], [".md"], max_files=2, selection_sort="fecha")
+
+
+@pytest.mark.parametrize("scan_workers", [None, 4])
+def test_max_files_reuses_walk_stat(vault, monkeypatch, scan_workers):
+    root = _vault_with_stats(vault)
+    expected = sorted(_full_sort(sorted(root.rglob("*.md")), root, "mtime")[:5])
+    stat_calls = []
+    real_stat = os.stat
+    def counting_stat(path, *args, **kwargs):
+        if str(path).endswith(".md"): stat_calls.append(str(path))
+        return real_stat(path, *args, **kwargs)
+    monkeypatch.setattr(os, "stat", counting_stat)
+    assert file_handler.find_relevant_files(root, [], [".md"], scan_workers=scan_workers, max_files=5) == expected
+    # rglob: un stat por archivo (el que descarta directorios); paralelo: el del DirEntry, sin os.stat
+    assert len(stat_calls) == len(set(stat_calls)) == (60 if scan_workers is None else 0)
@@ -0,0 +1,49 @@
+# tests/test_spill.py
+import io
+import tracemalloc
+
+import spill
+
+
+def test_memory_stays_bounded_after_spilling():
+    chunk = b"x" * 64 * 1024
+    total = 64 * len(chunk) # 4 MiB
+    tracemalloc.start()
+    try:
+        with spill.SpillBuffer(max_memory=256 * 1024) as buffer:
+            for _ in range(total // len(chunk)):
+                buffer.write(chunk)
+            _, peak = tracemalloc.get_traced_memory()
+            assert buffer.spilled
+            assert buffer.size() == total
+    finally:
+        tracemalloc.stop()
+    # El pico incluye el bloque de escritura y el BytesIO previo al volcado, nunca el total
+    assert peak < total // 4
+
+
+def test_without_limit_stays_in_memory():
+    with spill.SpillBuffer() as buffer:
+        buffer.write(b"a" * 1024 * 1024)
+        assert not buffer.spilled
+
+
+def test_copy_range_and_stripped_range_on_disk():
+    with spill.SpillBuffer(max_memory=16) as buffer:
+        buffer.writelines([b"\n\n  ", b"contenido ", b"de prueba", b" \n\n"])
+        assert buffer.spilled
+        start, end = buffer.stripped_range()
+        output = io.BytesIO()
+        spill.copy_range(buffer, output, start, end)
+    assert output.getvalue() == b"contenido de prueba"
+
+
+def test_copy_range_to_real_file(tmp_path):
+    data = bytes(range(256)) * 4096
+    target = tmp_path / "out.bin"
+    with spill.SpillBuffer(max_memory=1024) as buffer, open(target, "wb") as output:
+        buffer.write(data)
+        output.write(b"<")
+        spill.copy_range(buffer, output, 10, len(data) - 10)
+        output.write(b">")
+    assert target.read_bytes() == b"<" + data[10:-10] + b">"
@@ -0,0 +1,59 @@
+# tests/test_startup.py
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+# Módulos que solo deben cargarse al generar (no para --help ni --list-templates)
+HEAVY_MODULES = {"core", "redaction", "file_handler", "formatter", "index_cache", "sqlite3", "concurrent.futures"}
+
+_RUN_MAIN = (
+    "import runpy, sys\n"
+    "sys.argv = ['main.py'] + sys.argv[1:]\n"
+    "try: runpy.run_path('main.py', run_name='__main__')\n"
+    "except SystemExit: pass\n"
+    "print(' '.join(sorted(sys.modules)), file=sys.stderr)\n"
+)
+
+
+def _loaded_modules(*argv):
+    result = subprocess.run([sys.executable, "-c", _RUN_MAIN, *argv], cwd=REPO_ROOT, capture_output=True, text=True, timeout=60)
+    return set(result.stderr.strip().splitlines()[-1].split())
+
+
+def _best_time(*argv, runs=5):
+    best = float("inf")
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, *argv], cwd=REPO_ROOT, capture_output=True, timeout=60)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+@pytest.mark.parametrize("argv", [("--help",), ("--list-templates",)])
+def test_cli_startup_does_not_import_generation_modules(argv):
+    assert not HEAVY_MODULES & _loaded_modules(*argv)
+
+
+@pytest.mark.benchmark
+def test_cli_help_cold_start_budget():
+    # Margen amplio sobre el intérprete vacío: cargar core/sqlite3 de más ya se nota aquí
+    baseline = _best_time("-c", "pass")
+    assert _best_time("main.py", "--help") < baseline + 0.5
+
+
+def test_redaction_presets_match_defaults():
+    import defaults
+    import redaction
+    assert tuple(redaction.BUILTIN_PATTERNS) == defaults.REDACTION_PRESETS
+    assert redaction.REPLACEMENT == defaults.REDACTION_REPLACEMENT
+
+
+def test_core_keeps_default_extensions():
+    import core
+    import defaults
+    assert core.DEFAULT_EXTENSIONS is defaults.DEFAULT_EXTENSIONS
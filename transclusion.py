@@ -0,0 +1,142 @@
+# transclusion.py
+import os
+from pathlib import Path
+import re
+import sys
+import threading
+from typing import Dict, FrozenSet, List, Optional, Tuple
+
+import extractors
+from defaults import DEFAULT_TRANSCLUSION_DEPTH
+from file_handler import read_file_content
+from outline import SECTION_SEPARATOR, read_section
+
+NOTE_SUFFIX = ".md"
+
+# ![[nota]], ![[carpeta/nota.md]], ![[nota#Encabezado]], ![[nota#Padre#Hijo|alias]], ![[#Encabezado]]
+EMBED_RE = re.compile(r'!\[\[([^\]\|#]*)(?:#([^\]\|]*))?(?:\|[^\]]*)?\]\]')
+_FRONTMATTER_RE = re.compile(r'\A---[ \t]*\r?\n.*?^(?:---|\.\.\.)[ \t]*(?:\r?\n|\Z)', re.DOTALL | re.MULTILINE)
+
+EmbedKey = Tuple[Path, Optional[str]] # (nota, sección o None = nota completa)
+
+
+class Transcluder:
+    """
+    Expande las incrustaciones ![[nota]] / ![[nota#Encabezado]] de una bóveda
+    hasta max_depth niveles, para una generación.
+
+    - Los nombres de enlace se resuelven con un índice nombre -> ruta que se
+      construye una sola vez (al encontrar la primera incrustación), con el
+      criterio de Obsidian: ruta exacta, y si el nombre es ambiguo, la nota de
+      la misma carpeta o la de ruta más corta.
+    - Cada nota/sección incrustada se lee una sola vez, y su expansión se
+      memoriza por (nota, sección, niveles restantes): una nota incrustada
+      muchas veces se formatea una vez.
+    - Una nota que se incrusta a sí misma (directa o indirectamente) se marca
+      como incrustación circular en lugar de expandirse.
+
+    Es seguro entre hilos (los bloques se formatean en paralelo en async_core).
+    """
+    def __init__(self, vault_path: Path, max_depth: int = DEFAULT_TRANSCLUSION_DEPTH):
+        self.vault_path = vault_path
+        self.max_depth = max_depth
+        self._lock = threading.Lock()
+        self._by_path: Optional[Dict[str, Path]] = None
+        self._by_name: Dict[str, List[Path]] = {}
+        self._memo: Dict[Tuple[Path, Optional[str], int], List[str]] = {}
+        self._texts: Dict[EmbedKey, Optional[str]] = {}
+
+    def _build_index(self):
+        """Índice de notas por ruta relativa y por nombre (en minúsculas, sin .md)."""
+        by_path: Dict[str, Path] = {}; by_name: Dict[str, List[Path]] = {}
+        for directory, subdirectories, files in os.walk(self.vault_path):
+            subdirectories[:] = [d for d in subdirectories if not d.startswith('.')] # .obsidian, .trash, .git...
+            for file_name in files:
+                if not file_name.lower().endswith(NOTE_SUFFIX): continue
+                file_path = Path(directory, file_name)
+                if extractors.get_extractor(file_path) is not None: continue # Ej: .excalidraw.md no es una nota de texto
+                relative = file_path.relative_to(self.vault_path).as_posix()[:-len(NOTE_SUFFIX)].lower()
+                by_path[relative] = file_path
+                by_name.setdefault(relative.rsplit('/', 1)[-1], []).append(file_path)
+        for candidates in by_name.values(): candidates.sort(key=lambda p: (len(p.parts), p))
+        self._by_name = by_name; self._by_path = by_path
+        print(f"Transclusión - Índice de nombres: {len(by_path)} notas.", file=sys.stderr)
+
+    def resolve(self, link: str, source: Path) -> Optional[Path]:
+        """Ruta de la nota a la que apunta un enlace (sin '#sección'), o None si no existe."""
+        with self._lock:
+            if self._by_path is None: self._build_index()
+        name = link.strip().replace('\\', '/').lstrip('/').lower()
+        if name.endswith(NOTE_SUFFIX): name = name[:-len(NOTE_SUFFIX)]
+        if name in self._by_path: return self._by_path[name]
+        candidates = [p for p in self._by_name.get(name.rsplit('/', 1)[-1], [])
+                      if p.relative_to(self.vault_path).as_posix()[:-len(NOTE_SUFFIX)].lower().endswith('/' + name)] if '/' in name else self._by_name.get(name, [])
+        if not candidates: return None
+        return next((p for p in candidates if p.parent == source.parent), candidates[0])
+
+    def expand_line(self, line: str, source: Path, section: Optional[str] = None) -> List[str]:
+        """
+        Líneas que se insertan tras una línea de `source` con incrustaciones (vacío
+        si no tiene). Las incrustaciones anidadas van precedidas de "> " por nivel.
+        """
+        if '![[' not in line or self.max_depth <= 0: return []
+        lines, _ = self._expand_embeds(line, source, self.max_depth, frozenset({(source, section)}))
+        return lines
+
+    def _expand_embeds(self, line: str, source: Path, depth: int, stack: FrozenSet[EmbedKey]) -> Tuple[List[str], FrozenSet[EmbedKey]]:
+        """Expande las incrustaciones de una línea. Devuelve (líneas, claves de stack de las que depende el resultado)."""
+        expanded: List[str] = []; depends_on: FrozenSet[EmbedKey] = frozenset()
+        for match in EMBED_RE.finditer(line):
+            link, section = match.group(1), (match.group(2) or '').strip() or None
+            if section and section.startswith('^'): continue # Referencia a bloque: no se expande
+            if link.strip():
+                target = self.resolve(link, source)
+                if target is None:
+                    suffix = Path(link.strip()).suffix.lower()
+                    if suffix and suffix != NOTE_SUFFIX and ' ' not in suffix: continue # Adjunto (imagen, PDF...)
+                    expanded.append(f"(Nota incrustada no encontrada: {link.strip()})"); continue
+            else: target = source # ![[#Encabezado]] = sección de la misma nota
+            title = "/" + target.relative_to(self.vault_path).as_posix() + (SECTION_SEPARATOR + section if section else "")
+            key = (target, section)
+            if key in stack:
+                expanded.append(f"(Incrustación circular omitida: {title})"); depends_on |= {key}; continue
+            body, body_depends_on = self._render(key, depth, stack)
+            depends_on |= body_depends_on
+            expanded.append(f"{title}:"); expanded.extend(body)
+        return expanded, depends_on
+
+    def _read(self, key: EmbedKey) -> Optional[str]:
+        """Texto de una nota (sin frontmatter) o de una sección; se lee una vez por generación."""
+        with self._lock:
+            if key in self._texts: return self._texts[key]
+        target, section = key
+        if section is None:
+            text = read_file_content(target)
+            if text is not None: text = _FRONTMATTER_RE.sub('', text, count=1)
+        else:
+            found = read_section(target, section)
+            text = found[0] if found is not None else None
+        with self._lock: self._texts[key] = text
+        return text
+
+    def _render(self, key: EmbedKey, depth: int, stack: FrozenSet[EmbedKey]) -> Tuple[List[str], FrozenSet[EmbedKey]]:
+        """Texto de una nota/sección con sus propias incrustaciones expandidas hasta depth - 1 niveles más."""
+        memo_key = (*key, depth)
+        with self._lock: cached = self._memo.get(memo_key)
+        if cached is not None: return cached, frozenset()
+        target, section = key
+        text = self._read(key)
+        if text is None: return [f"(No se pudo leer la incrustación{' (sección no encontrada)' if section else ''})"], frozenset()
+
+        lines: List[str] = []; depends_on: FrozenSet[EmbedKey] = frozenset()
+        for line in text.splitlines():
+            lines.append(line)
+            if depth > 1 and '![[' in line:
+                nested, nested_depends_on = self._expand_embeds(line, target, depth - 1, stack | {key})
+                lines.extend(f"> {nested_line}" for nested_line in nested)
+                depends_on |= nested_depends_on
+        depends_on -= {key}
+        # Un resultado con una incrustación circular hacia un ancestro depende del camino: no se memoriza
+        if not depends_on:
+            with self._lock: self._memo[memo_key] = lines
+        return lines, depends_on